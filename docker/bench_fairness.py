@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import namedtuple
+
+from histogram import load_histograms
+from netem import LinkEmulator, ProfileConditions, TraceConditions, TraceWriter, read_trace
+
+# Multi-flow fairness benchmark: N senders share one emulated bottleneck
+# (netem.py, in this process), each through its own listen port so its
+# delivered bytes can be told apart, against one receiver_daemon.py.
+#
+#     python bench_fairness.py                                  # DEFAULT_FLOWS
+#     python bench_fairness.py R@0:4M C@3:3M C@3:3M T@6:2M --rate 2000000 --delay 0.04
+#
+# A flow is TYPE@START:SIZE, a TahoeRenoSender type started START seconds
+# into the run, sending SIZE bytes (K/M suffixes), and it leaves when done.
+
+DEFAULT_FLOWS = ['R@0:4M', 'C@3:3M', 'T@6:2M']
+LINK_RATE = 1000000  # bytes/sec
+LINK_DELAY = 0.02  # one-way, seconds
+QUEUE_LIMIT = 100  # packets
+RECEIVER_PORT = 5100  # the flows' listen ports follow it
+SAMPLE_INTERVAL = 0.1  # seconds between samples of the bytes delivered per flow
+RATE_WINDOW = 1.0  # per-flow throughput is averaged over this many seconds
+# a period has converged once every active flow is within this fraction of
+# its fair share (link rate / active flows) for CONVERGENCE_HOLD seconds
+CONVERGENCE_TOLERANCE = 0.25
+CONVERGENCE_HOLD = 1.0
+RUN_TIMEOUT = 300.0
+RESULTS_FILE = '/tmp/fairness_results.jsonl'
+
+# the sender class and options each type's launcher (sender_objective.py) uses, plain TahoeRenoSender otherwise
+LAUNCHERS = {
+    'O': ('ThreadedTahoeRenoSender', {'selective_repeat': True, 'rack': True, 'hystart': True}),
+}
+
+SENDER_SCRIPT = ("import sys, json, utils; "
+                 "getattr(utils, sys.argv[1])(sys.argv[2], **json.loads(sys.argv[3])).send(sys.argv[4], 'localhost', int(sys.argv[5]))")
+
+Flow = namedtuple('Flow', ['sender_type', 'start', 'size'])
+
+def parse_size(text):
+    units = {'K': 1024, 'M': 1024 * 1024}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+def parse_flow(text):
+    sender_type, _, rest = text.partition('@')
+    start, _, size = rest.partition(':')
+    return Flow(sender_type, float(start or 0), parse_size(size or '1M'))
+
+def jain_index(rates):
+    """(sum x)^2 / (n * sum x^2): 1 when all flows get the same, 1/n when one gets everything."""
+    squares = sum(rate * rate for rate in rates)
+    return sum(rates) ** 2 / (len(rates) * squares) if squares else None
+
+def run_flows(flows, conditions, limit, selective_repeat, trace_path, workdir):
+    """Run the flows through one bottleneck, return (samples, joined, left, exit codes)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    ports = [RECEIVER_PORT + 1 + i for i in range(len(flows))]
+    paths = []
+    for i, flow in enumerate(flows):
+        paths.append(os.path.join(workdir, f'flow-{i}.bin'))
+        with open(paths[-1], 'wb') as f:
+            f.write(os.urandom(flow.size))
+
+    emulator = LinkEmulator(conditions, TraceWriter(trace_path) if trace_path else None, ports,
+                            ('127.0.0.1', RECEIVER_PORT), limit)
+    emulator_thread = threading.Thread(target=emulator.run, daemon=True)
+    receiver = subprocess.Popen([sys.executable, 'receiver_daemon.py', str(RECEIVER_PORT),
+                                 os.path.join(workdir, 'received')],
+                                cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    emulator_thread.start()
+    time.sleep(0.5)
+
+    processes = [None] * len(flows)
+    joined = [None] * len(flows)
+    left = [None] * len(flows)
+    samples = []
+    start = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic() - start
+            for i, flow in enumerate(flows):
+                if processes[i] is None and now >= flow.start:
+                    sender_class, sender_options = LAUNCHERS.get(flow.sender_type, ('TahoeRenoSender', {}))
+                    sender_options = dict(sender_options)
+                    if selective_repeat:
+                        sender_options['selective_repeat'] = True
+                    env = dict(os.environ, HISTOGRAM_FILE=os.path.join(workdir, f'flow-{i}.json'),
+                               PATH_METRICS_FILE='')
+                    with open(os.path.join(workdir, f'flow-{i}.log'), 'wb') as log:
+                        processes[i] = subprocess.Popen(
+                            [sys.executable, '-c', SENDER_SCRIPT, sender_class, flow.sender_type, json.dumps(sender_options),
+                             paths[i], str(ports[i])],
+                            cwd=here, env=env, stdout=log, stderr=subprocess.STDOUT)
+                    joined[i] = now
+                elif processes[i] is not None and left[i] is None and processes[i].poll() is not None:
+                    left[i] = now
+            samples.append((now, [emulator.delivered[port] for port in ports]))
+            if all(t is not None for t in left) or now > RUN_TIMEOUT:
+                break
+            time.sleep(SAMPLE_INTERVAL)
+    finally:
+        for process in processes:
+            if process is not None and process.poll() is None:
+                process.kill()
+        emulator.stop()
+        emulator_thread.join()
+        emulator.close()
+        receiver.send_signal(signal.SIGINT)
+        receiver.wait()
+
+    # a flow leaves with its last delivered byte, its process exits a little later;
+    # a flow that never started (RUN_TIMEOUT first) has neither
+    for i in range(len(flows)):
+        if joined[i] is None:
+            left[i] = None
+            continue
+        final = samples[-1][1][i]
+        left[i] = next(t for t, delivered in samples if delivered[i] >= final and t >= (joined[i] or 0))
+    return samples, joined, left, [process.wait() if process else None for process in processes]
+
+def windowed_rates(samples):
+    """Per-flow throughput at every sample, averaged over the preceding RATE_WINDOW."""
+    rates = []
+    j = 0
+    for t, delivered in samples:
+        while samples[j][0] < t - RATE_WINDOW:
+            j += 1
+        span = t - samples[j][0]
+        rates.append([(d - d0) / span if span > 0 else 0.0 for d, d0 in zip(delivered, samples[j][1])])
+    return rates
+
+def analyze(flows, samples, joined, left, link_rate):
+    rates = windowed_rates(samples)
+    times = [t for t, _ in samples]
+    started = [i for i in range(len(flows)) if joined[i] is not None]
+
+    def active(t):
+        return [i for i in started if joined[i] <= t < left[i]]
+
+    # periods between flows joining or leaving
+    events = sorted(set(joined[i] for i in started) | set(left[i] for i in started))
+    periods = []
+    all_jain = []
+    for begin, end in zip(events, events[1:]):
+        members = active(begin)
+        if not members:
+            continue
+        fair_share = link_rate / len(members)
+        in_period = [k for k, t in enumerate(times) if begin <= t < end]
+        within = [all(abs(rates[k][i] - fair_share) <= CONVERGENCE_TOLERANCE * fair_share for i in members)
+                  for k in in_period]
+
+        converged = None
+        for n, k in enumerate(in_period):
+            if times[k] + CONVERGENCE_HOLD > end:
+                break
+            if all(w for w, m in zip(within[n:], in_period[n:]) if times[m] - times[k] <= CONVERGENCE_HOLD):
+                converged = times[k] - begin
+                break
+
+        # skip the first window, its rates still include the previous period
+        steady = [k for k in in_period if times[k] >= begin + RATE_WINDOW]
+        jain = [jain_index([rates[k][i] for i in members]) for k in steady] if len(members) > 1 else []
+        jain = [value for value in jain if value is not None]
+        all_jain += jain
+        periods.append({
+            'begin': round(begin, 3),
+            'end': round(end, 3),
+            'flows': members,
+            'jain_index': sum(jain) / len(jain) if jain else None,
+            'utilization': (sum(sum(rates[k][i] for i in members) for k in steady) / len(steady) / link_rate
+                            if steady else None),
+            'convergence_seconds': converged,
+        })
+
+    span = max(left[i] for i in started) - min(joined[i] for i in started) if started else 0.0
+    delivered = sum(samples[-1][1])
+    convergence = [p['convergence_seconds'] for p in periods]
+    return periods, {
+        'jain_index': sum(all_jain) / len(all_jain) if all_jain else None,
+        'utilization': delivered / (link_rate * span) if span > 0 else None,
+        'max_convergence_seconds': (max(convergence) if convergence and None not in convergence else None),
+        'unconverged_periods': convergence.count(None),
+        'duration': span,
+    }
+
+def flow_results(flows, samples, joined, left, exit_codes, link_rate, workdir):
+    results = []
+    for i, flow in enumerate(flows):
+        if joined[i] is None:
+            results.append({'type': flow.sender_type, 'start': flow.start, 'size': flow.size, 'duration': None,
+                            'goodput': None, 'link_share': None, 'exit_code': None})
+            continue
+        duration = left[i] - joined[i]
+        sent = [d[i] for t, d in samples if joined[i] <= t <= left[i]]
+        result = {
+            'type': flow.sender_type,
+            'start': flow.start,
+            'size': flow.size,
+            'duration': duration,
+            'goodput': flow.size / duration if duration > 0 else None,
+            'link_share': (sent[-1] - sent[0]) / duration / link_rate if len(sent) > 1 and duration > 0 else None,
+            'exit_code': exit_codes[i],
+        }
+        histogram_path = os.path.join(workdir, f'flow-{i}.json')
+        if os.path.exists(histogram_path):
+            for name, histogram in load_histograms([histogram_path]).items():
+                if name in ('delay', 'rtt'):
+                    percentiles = histogram.percentiles((50, 99))
+                    result[f'{name}_p50'] = percentiles[50]
+                    result[f'{name}_p99'] = percentiles[99]
+        results.append(result)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def format_value(value, spec):
+    return format(value, spec) if value is not None else '-'
+
+def print_report(flows, periods, summary):
+    print(f"{'flow':<6}{'type':<6}{'start':>7}{'time s':>9}{'goodput B/s':>14}{'share':>8}"
+          f"{'delay p50':>11}{'delay p99':>11}{'rtt p99':>10}")
+    for i, flow in enumerate(flows):
+        status = '' if flow['exit_code'] == 0 else '  (not started)' if flow['duration'] is None else '  (failed)'
+        print(f"{i:<6}{flow['type']:<6}{flow['start']:>7.1f}{format_value(flow['duration'], '.2f'):>9}"
+              f"{format_value(flow['goodput'], ',.0f'):>14}{format_value(flow['link_share'], '.0%'):>8}"
+              f"{format_value(flow.get('delay_p50'), '.4f'):>11}{format_value(flow.get('delay_p99'), '.4f'):>11}"
+              f"{format_value(flow.get('rtt_p99'), '.4f'):>10}"
+              f"{status}")
+    print(f"{'period':<16}{'flows':<12}{'jain':>7}{'util':>7}{'converged after':>17}")
+    for period in periods:
+        print(f"{period['begin']:>6.1f}-{period['end']:<9.1f}{','.join(map(str, period['flows'])):<12}"
+              f"{format_value(period['jain_index'], '.3f'):>7}{format_value(period['utilization'], '.0%'):>7}"
+              f"{format_value(period['convergence_seconds'], '.2f') + ' s' if period['convergence_seconds'] is not None else 'never':>17}")
+    print(f"Jain's fairness index: {format_value(summary['jain_index'], '.3f')}, "
+          f"link utilization: {format_value(summary['utilization'], '.1%')}, "
+          f"max convergence time: {format_value(summary['max_convergence_seconds'], '.2f')} s "
+          f"({summary['unconverged_periods']} periods did not converge)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent senders through one bottleneck and score fairness.")
+    parser.add_argument('flows', nargs='*', default=DEFAULT_FLOWS, help="TYPE@START:SIZE, e.g. R@0:4M")
+    parser.add_argument('--rate', type=int, default=LINK_RATE, help="bottleneck rate, bytes/sec")
+    parser.add_argument('--delay', type=float, default=LINK_DELAY, help="one-way delay, seconds")
+    parser.add_argument('--loss', type=float, default=0.0, help="random loss probability")
+    parser.add_argument('--limit', type=int, default=QUEUE_LIMIT, help="bottleneck queue, packets")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--selective-repeat', action='store_true', help="for every flow, not only type O")
+    parser.add_argument('--trace', metavar='FILE', help="record the bottleneck trace (see netem.py)")
+    parser.add_argument('--replay', metavar='FILE', help="replay a recorded trace instead of --delay/--loss")
+    parser.add_argument('--output', default=RESULTS_FILE, help="results are appended here as one JSON line")
+    options = parser.parse_args()
+
+    flows = [parse_flow(text) for text in options.flows]
+    if options.replay:
+        conditions = TraceConditions(read_trace(options.replay))
+    else:
+        conditions = ProfileConditions('fixed', options.seed, options.delay, options.loss, 0.0, options.rate)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        samples, joined, left, exit_codes = run_flows(flows, conditions, options.limit, options.selective_repeat,
+                                                      options.trace, workdir)
+        periods, summary = analyze(flows, samples, joined, left, options.rate)
+        per_flow = flow_results(flows, samples, joined, left, exit_codes, options.rate, workdir)
+
+    print_report(per_flow, periods, summary)
+    result = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'config': {'flows': options.flows, 'rate': options.rate, 'delay': options.delay, 'loss': options.loss,
+                   'limit': options.limit, 'seed': options.seed, 'replay': options.replay},
+        'summary': summary,
+        'periods': periods,
+        'flows': per_flow,
+    }
+    with open(options.output, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import select
+import socket
+import time
+
+from offload import enable_gso, enable_gro, segment_runs, send_segments
+from receiver import RecvRing, GroRing, MAX_PACKET_SIZE
+
+# packets queued per round, kept below what fits in the receive buffer
+PACKETS_PER_ROUND = 512
+ROUNDS = 200
+RCVBUF_SIZE = 4 * 1024 * 1024
+DRAIN_TIMEOUT = 1.0
+
+class CountingSocket(socket.socket):
+    """UDP socket that counts its send and receive syscalls."""
+
+    calls = 0
+
+    def sendto(self, *args):
+        CountingSocket.calls += 1
+        return super().sendto(*args)
+
+    def sendmsg(self, *args):
+        CountingSocket.calls += 1
+        return super().sendmsg(*args)
+
+    def recvfrom_into(self, *args):
+        CountingSocket.calls += 1
+        return super().recvfrom_into(*args)
+
+    def recvmsg_into(self, *args):
+        CountingSocket.calls += 1
+        return super().recvmsg_into(*args)
+
+def send_plain(tx, packets, address):
+    for packet in packets:
+        tx.sendto(packet, address)
+
+def send_gso(tx, packets, address):
+    for run in segment_runs(packets):
+        send_segments(tx, run, address)
+
+def run(send, gro):
+    """Datagrams/s, and send and receive syscalls per MB, for one loopback setup."""
+    with CountingSocket(socket.AF_INET, socket.SOCK_DGRAM) as rx, \
+            CountingSocket(socket.AF_INET, socket.SOCK_DGRAM) as tx:
+        rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+        rx.bind(('127.0.0.1', 0))
+        address = rx.getsockname()
+        ring = GroRing() if gro and enable_gro(rx) else RecvRing()
+        packets = [bytes(MAX_PACKET_SIZE) for _ in range(PACKETS_PER_ROUND)]
+
+        send_calls = receive_calls = received = 0
+        start = time.perf_counter_ns()
+        for _ in range(ROUNDS):
+            CountingSocket.calls = 0
+            send(tx, packets, address)
+            send_calls += CountingSocket.calls
+
+            CountingSocket.calls = 0
+            pending = PACKETS_PER_ROUND
+            while pending > 0 and select.select([rx], [], [], DRAIN_TIMEOUT)[0]:
+                count = ring.receive(rx)
+                pending -= count
+                received += count
+            receive_calls += CountingSocket.calls
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+
+    megabytes = received * MAX_PACKET_SIZE / 1e6
+    return received / elapsed, send_calls / megabytes, receive_calls / megabytes, received
+
+if __name__ == '__main__':
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        gso, gro = enable_gso(probe), enable_gro(probe)
+    setups = [('sendto / recvfrom_into', send_plain, False)]
+    if gso:
+        setups.append(('GSO sendmsg / recvfrom_into', send_gso, False))
+        if gro:
+            setups.append(('GSO sendmsg / GRO recvmsg_into', send_gso, True))
+    else:
+        print("UDP GSO not supported here, only the baseline runs")
+
+    baseline = None
+    for name, send, use_gro in setups:
+        pps, send_per_mb, receive_per_mb, received = run(send, use_gro)
+        baseline = baseline or pps
+        lost = ROUNDS * PACKETS_PER_ROUND - received
+        print(f"{name}: {pps:,.0f} packets/sec ({pps / baseline:.2f}x), "
+              f"syscalls per MB: {send_per_mb:.1f} send, {receive_per_mb:.1f} receive"
+              + (f", {lost} lost" if lost else ""))
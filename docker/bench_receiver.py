@@ -0,0 +1,134 @@
+import io
+import multiprocessing
+import socket
+import time
+import statistics
+
+import receiver
+from receiver import PACKET_SIZE, SEQ_ID_SIZE, MESSAGE_SIZE, FINACK_MESSAGE, create_acknowledgement
+
+# packets queued per round, kept below what fits in the receive buffer
+PACKETS_PER_ROUND = 1000
+ROUNDS = 30
+RCVBUF_SIZE = 4 * 1024 * 1024
+
+def legacy_serve(udp_socket):
+    """The original per-datagram receive loop, kept here as the baseline."""
+    expected_seq_id = 0
+    received_data = {}
+    while True:
+        packet, client = udp_socket.recvfrom(PACKET_SIZE)
+        seq_id, message = packet[:SEQ_ID_SIZE], packet[SEQ_ID_SIZE:]
+        if message == FINACK_MESSAGE:
+            return received_data
+        seq_id = int.from_bytes(seq_id, signed=True, byteorder='big')
+        received_data[seq_id] = message
+        if seq_id <= expected_seq_id and len(received_data[seq_id]) > 0:
+            while expected_seq_id in received_data:
+                expected_seq_id += len(received_data[expected_seq_id])
+        ack_id = expected_seq_id
+        udp_socket.sendto(create_acknowledgement(ack_id, 'ack'), client)
+
+def legacy_output(received_data):
+    return b''.join(received_data[seq_id] for seq_id in sorted(received_data))
+
+def ring_serve(udp_socket, **options):
+    sink = io.BytesIO()
+    receiver.serve(udp_socket, sink=sink, **options)
+    return sink
+
+def ring_output(sink):
+    return sink.getvalue()
+
+def build_datagrams(payloads):
+    datagrams = [(i * MESSAGE_SIZE).to_bytes(SEQ_ID_SIZE, signed=True, byteorder='big') + payload
+                 for i, payload in enumerate(payloads)]
+    return datagrams + [(-1).to_bytes(SEQ_ID_SIZE, signed=True, byteorder='big') + FINACK_MESSAGE]
+
+def fill(sender, address, datagrams):
+    for datagram in datagrams:
+        sender.sendto(datagram, address)
+
+def send_lockstep(address, datagrams, connection):
+    """Send each datagram once the previous one is ACKed, a round per message on connection."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        while connection.recv():
+            for datagram in datagrams[:-1]:
+                sender.sendto(datagram, address)
+                sender.recv(PACKET_SIZE)
+            sender.sendto(datagrams[-1], address)
+
+def run(variants, lockstep=False):
+    """Median packets/sec of each (serve, output) pair, checking that output() of each result is the data sent.
+
+    A round queues all datagrams before serve() starts, or with lockstep has a
+    child process send each one only after the previous ACK, so every wakeup
+    finds a single datagram. The rate is then over the receiving thread's CPU
+    time, the wall time would mostly be the sender's. The time runs until
+    output() has the data, the legacy loop leaves its reassembly for after the
+    FINACK. The variants take
+    turns round by round, each round starting from the next one, so neither a
+    slow spell of the machine nor the position in the round favours any of them.
+    """
+    rates = [[] for _ in variants]
+    clock = time.thread_time_ns if lockstep else time.perf_counter_ns
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as rx, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as tx:
+        rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+        rx.bind(('127.0.0.1', 0))
+        address = rx.getsockname()
+        # distinct payloads, so misplaced data shows up as well as missing data
+        payloads = [bytes([i % 256]) * MESSAGE_SIZE for i in range(PACKETS_PER_ROUND)]
+        expected = b''.join(payloads)
+        datagrams = build_datagrams(payloads)
+        if lockstep:
+            connection, child_connection = multiprocessing.Pipe()
+            child = multiprocessing.Process(target=send_lockstep, args=(address, datagrams, child_connection))
+            child.start()
+
+        order = list(range(len(variants)))
+        for round_number in range(ROUNDS):
+            shift = round_number % len(order)
+            for index in order[shift:] + order[:shift]:
+                variant_rates = rates[index]
+                serve, output = variants[index]
+                if not lockstep:
+                    fill(tx, address, datagrams)
+                start = clock()
+                if lockstep:
+                    connection.send(True)
+                result = output(serve(rx))
+                elapsed_ns = clock() - start
+                if result != expected:
+                    raise RuntimeError(f"{serve.__name__}: received data differs from what was sent")
+                variant_rates.append((PACKETS_PER_ROUND + 1) / (elapsed_ns / 1e9))
+                # discard the ACKs so the sender side never backs up
+                tx.setblocking(False)
+                try:
+                    while True:
+                        tx.recv(PACKET_SIZE)
+                except BlockingIOError:
+                    pass
+                tx.setblocking(True)
+        if lockstep:
+            connection.send(False)
+            child.join()
+
+    return [statistics.median(variant_rates) for variant_rates in rates]
+
+def coalesced_acks(udp_socket):
+    return ring_serve(udp_socket, coalesce_acks=True)
+
+if __name__ == '__main__':
+    legacy_pps, ring_pps, coalesced_pps = run([(legacy_serve, legacy_output), (ring_serve, ring_output),
+                                               (coalesced_acks, ring_output)])
+    print(f"{PACKETS_PER_ROUND} datagrams queued per round:")
+    print(f"  Legacy recvfrom loop: {legacy_pps:,.0f} packets/sec")
+    print(f"  receiver.serve() defaults (one ACK per datagram{', GRO' if receiver.RECEIVE_OFFLOAD else ''}): "
+          f"{ring_pps:,.0f} packets/sec ({ring_pps / legacy_pps:.2f}x)")
+    print(f"  receiver.serve() with coalesced ACKs: {coalesced_pps:,.0f} packets/sec "
+          f"({coalesced_pps / legacy_pps:.2f}x)")
+    legacy_pps, ring_pps = run([(legacy_serve, legacy_output), (ring_serve, ring_output)], lockstep=True)
+    print("One datagram per wakeup, each sent after the previous ACK (receiver CPU time):")
+    print(f"  Legacy recvfrom loop: {legacy_pps:,.0f} packets/sec")
+    print(f"  receiver.serve() defaults: {ring_pps:,.0f} packets/sec ({ring_pps / legacy_pps:.2f}x)")
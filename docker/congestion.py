@@ -0,0 +1,412 @@
+# ======================================================================
+#                   congestion.py
+# ======================================================================
+#
+# Congestion window controllers used by TahoeRenoSender for the sender
+# types beyond Tahoe/Reno. Windows are in packets (floats), time in seconds.
+# Every controller has on_ack(), on_loss() and on_timeout(), each returning
+# the new (cwnd, ssthresh). HyStart is not a controller: any sender type
+# can use it to end slow start early.
+
+import os
+import time
+import operator
+import logging
+
+from delivery_rate import MinMaxFilter
+
+logger = logging.getLogger(__name__)
+
+CUBIC_C = 0.4  # scaling constant, packets / s^3
+CUBIC_BETA = 0.7  # multiplicative decrease factor
+CUBIC_ALPHA = 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA)  # Reno-friendly additive increase
+CUBIC_MAX_GROWTH = 1.5  # target is capped at this multiple of cwnd (RFC 9438)
+MIN_CWND = 2
+
+VEGAS_ALPHA = 2  # grow while fewer than this many packets are queued
+VEGAS_BETA = 4  # shrink while more than this many packets are queued
+VEGAS_GAMMA = 1  # leave slow start once this many packets are queued
+BASE_RTT_WINDOW = 60.0  # seconds, base RTT is the minimum over this window
+COMPETE_ROUNDS = 8  # rounds of an undrainable queue before competing with loss-based flows
+
+# Score weights of throughput/2000, 1/jitter and 1/delay, as in
+# PerformanceMetrics; OBJECTIVE_WEIGHTS="w1,w2,w3" in the environment overrides them
+OBJECTIVE_WEIGHTS = (0.2, 0.1, 0.8)
+OBJECTIVE_EPOCH_RTTS = 3  # round trips measured per epoch, after one to settle
+OBJECTIVE_MIN_EPOCH = 0.005  # seconds, floor of the round trip used for epochs
+OBJECTIVE_MIN_SAMPLES = 64  # delay samples an epoch needs to be scored
+OBJECTIVE_STEP = 0.25  # first window change, as a fraction of cwnd
+OBJECTIVE_MIN_STEP = 1 / 32
+OBJECTIVE_MAX_STEP = 0.5
+OBJECTIVE_TOLERANCE = 0.2  # a score this much lower than the last one still counts as noise
+OBJECTIVE_BETA = 0.7  # window kept after a loss
+OBJECTIVE_QUEUE_DELAY = 0.25  # a loss counts as congestion once SRTT exceeds its minimum by this fraction
+OBJECTIVE_MIN_JITTER = 0.00001  # seconds, keeps a quiet epoch from scoring infinitely well
+
+HYSTART_LOW_WINDOW = 4  # packets, slow start below this window is never cut short
+HYSTART_MIN_SAMPLES = 4  # RTT samples a round needs before its minimum counts
+HYSTART_ACK_DELTA = 0.002  # seconds, ACKs closer than this form one train
+HYSTART_DELAY_MIN = 0.004  # RTT increase threshold, min RTT / 8 clamped to these bounds
+HYSTART_DELAY_MAX = 0.016
+
+class CubicWindow:
+    """CUBIC window growth (RFC 9438) with byte counting.
+
+    on_ack() takes the number of packets a (possibly cumulative or stretched)
+    ACK covers, so slow start grows by what was delivered rather than by the
+    number of ACKs, and congestion avoidance applies the per-packet increment
+    for every packet acknowledged.
+    """
+
+    def __init__(self):
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+        self.w_est = 0.0
+        self.min_rtt = None
+
+    def on_ack(self, cwnd, ssthresh, acked, rtt=None, now=None):
+        now = time.monotonic() if now is None else now
+        if rtt is not None and rtt > 0 and (self.min_rtt is None or rtt < self.min_rtt):
+            self.min_rtt = rtt
+
+        # slow start, byte counted and stopping at ssthresh
+        if cwnd < ssthresh:
+            grow = min(acked, ssthresh - cwnd)
+            cwnd += grow
+            acked -= grow
+            if acked <= 0:
+                return cwnd, ssthresh
+
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if cwnd < self.w_max:
+                self.k = ((self.w_max - cwnd) / CUBIC_C) ** (1 / 3)
+            else:
+                # no loss yet, or grown past the old maximum: probe from here
+                self.k = 0.0
+                self.w_max = cwnd
+            self.w_est = cwnd
+
+        # cubic target one RTT ahead, capped to avoid bursts
+        t = now - self.epoch_start + (self.min_rtt or 0)
+        target = CUBIC_C * (t - self.k) ** 3 + self.w_max
+        target = min(max(target, cwnd), CUBIC_MAX_GROWTH * cwnd)
+
+        # Reno-friendly estimate, grows like Reno with the CUBIC beta
+        self.w_est += CUBIC_ALPHA * acked / cwnd
+
+        if self.w_est > target:
+            return max(cwnd, self.w_est), ssthresh
+        return cwnd + acked * (target - cwnd) / cwnd, ssthresh
+
+    def on_loss(self, cwnd):
+        """Multiplicative decrease with fast convergence, return (cwnd, ssthresh)."""
+        if cwnd < self.w_max:
+            # still below the last maximum, release bandwidth to newer flows
+            self.w_max = cwnd * (1 + CUBIC_BETA) / 2
+        else:
+            self.w_max = cwnd
+        self.epoch_start = None
+        ssthresh = max(cwnd * CUBIC_BETA, MIN_CWND)
+        return ssthresh, ssthresh
+
+    def on_timeout(self, cwnd):
+        _cwnd, ssthresh = self.on_loss(cwnd)
+        return 1, ssthresh
+
+class VegasWindow:
+    """Delay-based window in the style of TCP Vegas, keeping a small standing queue.
+
+    Once per round trip the number of our packets sitting in the bottleneck
+    queue is estimated as cwnd * (rtt - base_rtt) / rtt, using the smallest
+    RTT of the round, and the window moves by one packet to keep it between
+    alpha and beta.
+
+    A delay-based flow loses to loss-based ones, which keep the queue full.
+    With yield_to_loss (the default) it simply backs off, like a LEDBAT
+    scavenger. Otherwise, after COMPETE_ROUNDS rounds in which shrinking did
+    not drain the queue, it switches to Reno increase until the queue drains.
+    """
+
+    def __init__(self, alpha=VEGAS_ALPHA, beta=VEGAS_BETA, yield_to_loss=True):
+        self.alpha = alpha
+        self.beta = beta
+        self.yield_to_loss = yield_to_loss
+        self.base_rtt = MinMaxFilter(BASE_RTT_WINDOW, operator.le)
+
+        self.round_start = None
+        self.round_min_rtt = None
+        self.queued_rounds = 0
+        self.competing = False
+
+    def on_ack(self, cwnd, ssthresh, acked, rtt=None, now=None):
+        now = time.monotonic() if now is None else now
+        if rtt is not None and rtt > 0:
+            self.base_rtt.update(now, rtt)
+            if self.round_min_rtt is None or rtt < self.round_min_rtt:
+                self.round_min_rtt = rtt
+        if self.round_start is None:
+            self.round_start = now
+
+        if cwnd < ssthresh:
+            cwnd += min(acked, ssthresh - cwnd)
+        elif self.competing:
+            cwnd += acked / cwnd
+
+        if self.round_min_rtt is None or now - self.round_start < self.round_min_rtt:
+            return cwnd, ssthresh
+
+        # one round trip passed, act on the delay it saw
+        round_rtt = self.round_min_rtt
+        self.round_start = now
+        self.round_min_rtt = None
+        queued = cwnd * (round_rtt - self.base_rtt.get()) / round_rtt
+
+        if cwnd < ssthresh:
+            if queued > VEGAS_GAMMA:
+                # the queue started to build, hand over to congestion avoidance
+                cwnd = max(cwnd - queued, MIN_CWND)
+                ssthresh = cwnd
+            return cwnd, ssthresh
+
+        if self.competing:
+            if queued < self.alpha:
+                logger.info("Queue drained, back to delay-based control")
+                self.competing = False
+            return cwnd, ssthresh
+
+        if queued < self.alpha:
+            cwnd += 1
+            self.queued_rounds = 0
+        elif queued > self.beta:
+            cwnd = max(cwnd - 1, MIN_CWND)
+            self.queued_rounds += 1
+            if not self.yield_to_loss and self.queued_rounds >= COMPETE_ROUNDS:
+                logger.info("Standing queue from other flows, competing like Reno")
+                self.competing = True
+                self.queued_rounds = 0
+        else:
+            self.queued_rounds = 0
+        # shrinking below ssthresh must not restart slow start
+        return cwnd, min(ssthresh, cwnd)
+
+    def on_loss(self, cwnd):
+        ssthresh = max(cwnd / 2, MIN_CWND)
+        return ssthresh, ssthresh
+
+    def on_timeout(self, cwnd):
+        _cwnd, ssthresh = self.on_loss(cwnd)
+        self.round_start = None
+        self.round_min_rtt = None
+        return 1, ssthresh
+
+def objective_weights():
+    """Score weights from OBJECTIVE_WEIGHTS in the environment, else the module default."""
+    value = os.environ.get('OBJECTIVE_WEIGHTS')
+    if not value:
+        return OBJECTIVE_WEIGHTS
+    weights = tuple(float(weight) for weight in value.split(','))
+    if len(weights) != 3:
+        raise ValueError(f"OBJECTIVE_WEIGHTS needs three weights, got {value!r}")
+    return weights
+
+def objective_score(throughput, delay, jitter, weights=OBJECTIVE_WEIGHTS):
+    """Composite score of a transfer, throughput in bytes/s, delay and jitter in seconds."""
+    return weights[0] * (throughput / 2000) + weights[1] / jitter + weights[2] / delay
+
+class ObjectiveWindow:
+    """Window tuned online to the composite score by hill climbing.
+
+    After slow start the sender runs in epochs: one round trip for the queue
+    to settle at the current window, then OBJECTIVE_EPOCH_RTTS round trips in
+    which goodput, mean delay and mean jitter are measured and scored with the
+    weights. Delay and jitter come from the transfer's per-packet histograms
+    once observe() is given them, so loss recovery stalls count as they do in
+    the final score, otherwise from the RTT samples. Jitter is smoothed over
+    epochs, since a single loss dominates one epoch's value.
+
+    The window is then multiplied or divided by 1 + step, by at least one
+    packet. The step grows while the score improves and halves when it drops
+    by more than OBJECTIVE_TOLERANCE, which also reverses the direction, so
+    the window settles around the best operating point for the weights and
+    follows it when the path changes. A loss only cuts the window when the
+    SRTT shows a queue; without one it is taken as random loss, which the
+    scores already account for. pacing_rate spreads the window over the base
+    RTT for senders that pace.
+    """
+
+    def __init__(self, segment_size, weights=None):
+        self.segment_size = segment_size
+        self.weights = weights or objective_weights()
+        # smallest SRTT, unlike the min RTT not fooled by the odd reordered packet that skipped the queue
+        self.srtt = None
+        self.base_rtt = MinMaxFilter(BASE_RTT_WINDOW, operator.le)
+        self.pacing_rate = None
+
+        # cumulative RTT and RTT change sums, used when no histograms are observed
+        self.histograms = None
+        self.rtt_sum = self.jitter_sum = 0.0
+        self.rtt_count = self.jitter_count = 0
+        self.last_rtt = None
+
+        self.direction = 1
+        self.step = OBJECTIVE_STEP
+        self.last_score = None
+        self.jitter = None
+        self.epochs = 0
+        self.start_epoch(None)
+
+    def observe(self, delay_histogram, jitter_histogram):
+        """Score epochs on the transfer's per-packet delay and jitter histograms."""
+        self.histograms = (delay_histogram, jitter_histogram)
+
+    def sums(self):
+        """Cumulative (delay sum, count, jitter sum, count) the epochs are scored on."""
+        if self.histograms is not None:
+            delay, jitter = self.histograms
+            return delay.sum, delay.total, jitter.sum, jitter.total
+        return self.rtt_sum, self.rtt_count, self.jitter_sum, self.jitter_count
+
+    def start_epoch(self, now):
+        self.epoch_start = now
+        self.measure_start = None
+        self.marks = None
+        self.acked = 0
+
+    def on_ack(self, cwnd, ssthresh, acked, rtt=None, now=None):
+        now = time.monotonic() if now is None else now
+        if rtt is not None and rtt > 0:
+            self.srtt = rtt if self.srtt is None else self.srtt + (rtt - self.srtt) / 8
+            self.base_rtt.update(now, self.srtt)
+            self.rtt_sum += rtt
+            self.rtt_count += 1
+            if self.last_rtt is not None:
+                self.jitter_sum += abs(rtt - self.last_rtt)
+                self.jitter_count += 1
+            self.last_rtt = rtt
+        base_rtt = self.base_rtt.get()
+        if base_rtt is not None:
+            self.pacing_rate = cwnd * self.segment_size / base_rtt
+
+        if cwnd < ssthresh:
+            return cwnd + min(acked, ssthresh - cwnd), ssthresh
+        if base_rtt is None:
+            return cwnd, ssthresh
+        if self.epoch_start is None:
+            self.start_epoch(now)
+
+        round_trip = max(base_rtt, OBJECTIVE_MIN_EPOCH)
+        if now - self.epoch_start < round_trip:
+            return cwnd, ssthresh
+        if self.marks is None:
+            # settled at this window, measure from here
+            self.measure_start = now
+            self.marks = self.sums()
+            return cwnd, ssthresh
+        self.acked += acked
+        delay_sum, delays, jitter_sum, jitters = (value - mark for value, mark in zip(self.sums(), self.marks))
+        elapsed = now - self.measure_start
+        if elapsed < OBJECTIVE_EPOCH_RTTS * round_trip or delays < OBJECTIVE_MIN_SAMPLES or not jitters:
+            return cwnd, ssthresh
+
+        jitter = jitter_sum / jitters
+        self.jitter = jitter if self.jitter is None else self.jitter + (jitter - self.jitter) / 4
+        score = objective_score(self.acked * self.segment_size / elapsed, delay_sum / delays,
+                                max(self.jitter, OBJECTIVE_MIN_JITTER), self.weights)
+        if self.last_score is None or score >= self.last_score:
+            self.step = min(self.step * 1.5, OBJECTIVE_MAX_STEP)
+        elif score < self.last_score * (1 - OBJECTIVE_TOLERANCE):
+            self.direction = -self.direction
+            self.step = max(self.step / 2, OBJECTIVE_MIN_STEP)
+        else:
+            # too close to call: prefer the larger window, small epochs score high by chance
+            self.direction = 1
+        logger.info(f"Objective epoch: score {score:.1f} at cwnd {cwnd:.1f}, "
+                    f"stepping {'up' if self.direction > 0 else 'down'} by {self.step:.3f}")
+        self.last_score = score
+        self.epochs += 1
+        self.start_epoch(now)
+
+        # steps up and down are the same factor, so noise alone does not drift the window,
+        # and at least a packet, so small windows can climb out of it
+        target = cwnd * (1 + self.step) if self.direction > 0 else cwnd / (1 + self.step)
+        cwnd = max(cwnd + self.direction * max(abs(target - cwnd), 1), MIN_CWND)
+        # a smaller window must not restart slow start
+        return cwnd, min(ssthresh, cwnd)
+
+    def on_loss(self, cwnd):
+        """Back off if a queue built up, and keep climbing down from the new window."""
+        if self.srtt is not None and self.srtt < self.base_rtt.get() * (1 + OBJECTIVE_QUEUE_DELAY):
+            return cwnd, cwnd
+        self.start_epoch(None)
+        self.last_score = None
+        self.direction = -1
+        self.step = max(self.step / 2, OBJECTIVE_MIN_STEP)
+        ssthresh = max(cwnd * OBJECTIVE_BETA, MIN_CWND)
+        return ssthresh, ssthresh
+
+    def on_timeout(self, cwnd):
+        _cwnd, ssthresh = self.on_loss(cwnd)
+        return 1, ssthresh
+
+class HyStart:
+    """Hybrid slow start: leave slow start when the path fills up, before it loses packets.
+
+    Rounds are one RTT long. Slow start ends at the current window when
+    either:
+    - the ACKs of a round arrive back to back (an ACK train) for half the
+      min RTT, so the window already covers the path (HyStart);
+    - the round's smallest RTT rose by min RTT / 8 (4..16 ms) over the last
+      round's, so a queue is building (the HyStart++ delay test, RFC 9406).
+    """
+
+    def __init__(self, low_window=HYSTART_LOW_WINDOW):
+        self.low_window = low_window
+        self.min_rtt = None
+        self.round_start = None
+        self.last_ack = None
+        self.round_min_rtt = None
+        self.last_round_min_rtt = None
+        self.samples = 0
+        self.exits = 0
+
+    def on_ack(self, cwnd, rtt=None, now=None):
+        """Account a new ACK during slow start, return True when slow start should end."""
+        now = time.monotonic() if now is None else now
+        if self.round_start is None or (self.round_min_rtt is not None and now - self.round_start >= self.round_min_rtt):
+            if self.samples >= HYSTART_MIN_SAMPLES:
+                self.last_round_min_rtt = self.round_min_rtt
+            self.round_start = self.last_ack = now
+            self.round_min_rtt = None
+            self.samples = 0
+        if rtt is None or rtt <= 0:
+            return False
+
+        self.samples += 1
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        if self.round_min_rtt is None or rtt < self.round_min_rtt:
+            self.round_min_rtt = rtt
+        if cwnd < self.low_window:
+            return False
+
+        if now - self.last_ack <= HYSTART_ACK_DELTA:
+            self.last_ack = now
+            if now - self.round_start >= self.min_rtt / 2:
+                return self.exit(cwnd, "ACK train")
+
+        if self.samples >= HYSTART_MIN_SAMPLES and self.last_round_min_rtt is not None:
+            eta = min(max(self.last_round_min_rtt / 8, HYSTART_DELAY_MIN), HYSTART_DELAY_MAX)
+            if self.round_min_rtt >= self.last_round_min_rtt + eta:
+                return self.exit(cwnd, "RTT increase")
+        return False
+
+    def exit(self, cwnd, reason):
+        logger.info(f"HyStart: {reason}, leaving slow start at cwnd {cwnd}")
+        self.exits += 1
+        return True
+
+# ======================================================================
+#                  END of congestion.py
+# ======================================================================
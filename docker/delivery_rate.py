@@ -0,0 +1,159 @@
+# ======================================================================
+#                   delivery_rate.py
+# ======================================================================
+#
+# Delivery rate sampling (draft-cheng-iccrg-delivery-rate-estimation) and
+# windowed min/max filters, so any sender can keep a live estimate of the
+# bottleneck bandwidth and the minimum RTT. Packets are identified by the
+# ACK id that covers them, i.e. the end offset of their payload.
+
+import time
+import operator
+from collections import deque, namedtuple
+
+BW_FILTER_ROUNDS = 10  # max bandwidth filter window, in round trips
+MIN_RTT_FILTER_WINDOW = 10.0  # min RTT filter window, in seconds
+
+RateSample = namedtuple('RateSample', ['delivery_rate', 'rtt', 'interval', 'delivered', 'is_app_limited'])
+
+class MinMaxFilter:
+    """Kathleen Nichols' windowed min/max filter, as in Linux lib/win_minmax.c.
+
+    Keeps the best, second best and third best samples over the window, each
+    from a later sub-window than the one before, so every update is O(1).
+    Construct with better=operator.ge for a running max, operator.le for a
+    running min.
+    """
+
+    def __init__(self, window, better):
+        self.window = window
+        self.better = better
+        self.samples = None
+
+    def reset(self, t, value):
+        sample = (t, value)
+        self.samples = [sample, sample, sample]
+        return value
+
+    def get(self):
+        return self.samples[0][1] if self.samples else None
+
+    def update(self, t, value):
+        s = self.samples
+        if s is None or self.better(value, s[0][1]) or t - s[2][0] > self.window:
+            return self.reset(t, value)
+
+        sample = (t, value)
+        if self.better(value, s[1][1]):
+            s[1] = s[2] = sample
+        elif self.better(value, s[2][1]):
+            s[2] = sample
+
+        # age out the best sample, promoting the later ones
+        dt = t - s[0][0]
+        if dt > self.window:
+            s[0], s[1], s[2] = s[1], s[2], sample
+            if t - s[0][0] > self.window:
+                s[0], s[1], s[2] = s[1], s[2], sample
+        elif s[1][0] == s[0][0] and dt > self.window / 4:
+            # a quarter of the window passed without a second choice, take one
+            s[1] = s[2] = sample
+        elif s[2][0] == s[1][0] and dt > self.window / 2:
+            s[2] = sample
+        return s[0][1]
+
+class RateSampler:
+    """Per-ACK delivery rate samples with a max bandwidth and a min RTT filter.
+
+    on_send() stamps each (re)transmission with the delivery state at that
+    time, on_ack() turns the newest packet a cumulative ACK covers into a
+    rate sample. Samples taken while the sender had nothing to send are
+    marked app-limited and only raise the bandwidth estimate.
+    """
+
+    def __init__(self, bw_rounds=BW_FILTER_ROUNDS, min_rtt_window=MIN_RTT_FILTER_WINDOW):
+        self.delivered = 0
+        self.delivered_time = None
+        self.first_sent_time = None
+        self.app_limited = 0
+
+        # round trips are counted by delivered bytes crossing the mark set at the last round start
+        self.round_count = 0
+        self.next_round_delivered = 0
+
+        self.bw_filter = MinMaxFilter(bw_rounds, operator.ge)
+        self.min_rtt_filter = MinMaxFilter(min_rtt_window, operator.le)
+
+        # ack id -> (delivered, delivered_time, first_sent_time, sent_time, is_app_limited, retransmitted)
+        self.packets = {}
+        self.sent_order = deque()
+
+    def on_send(self, ack_id, inflight, now=None, retransmit=False):
+        now = time.monotonic() if now is None else now
+        if inflight == 0 or self.delivered_time is None:
+            # restarting from idle, do not let the idle time count as delivery time
+            self.first_sent_time = now
+            self.delivered_time = now
+        self.packets[ack_id] = (self.delivered, self.delivered_time, self.first_sent_time,
+                                now, self.app_limited != 0, retransmit)
+        self.sent_order.append(ack_id)
+
+    def mark_app_limited(self, inflight):
+        """Call when the window allows sending but there is no data to send."""
+        self.app_limited = max(self.delivered + inflight, 1)
+
+    def on_rtt_sample(self, rtt, now=None):
+        """An RTT measured without delivering new data, e.g. echoed by a duplicate ACK."""
+        self.min_rtt_filter.update(time.monotonic() if now is None else now, rtt)
+
+    def on_ack(self, ack_id, acked_bytes, rtt=None, now=None):
+        now = time.monotonic() if now is None else now
+        self.delivered += acked_bytes
+        self.delivered_time = now
+
+        packet = self.packets.get(ack_id)
+        while self.sent_order and self.sent_order[0] <= ack_id:
+            self.packets.pop(self.sent_order.popleft(), None)
+        if self.app_limited and self.delivered > self.app_limited:
+            self.app_limited = 0
+        if packet is None:
+            return None
+
+        prior_delivered, prior_time, first_sent_time, sent_time, is_app_limited, retransmitted = packet
+        self.first_sent_time = sent_time
+
+        if prior_delivered >= self.next_round_delivered:
+            self.next_round_delivered = self.delivered
+            self.round_count += 1
+
+        if rtt is None and not retransmitted:
+            # Karn: without an echoed timestamp an ACK for a retransmitted packet gives no trustworthy RTT
+            rtt = now - sent_time
+        if rtt is not None:
+            self.min_rtt_filter.update(now, rtt)
+
+        # the longer of the send and ACK phases, so ACK compression cannot inflate the rate
+        interval = max(sent_time - first_sent_time, now - prior_time)
+        min_rtt = self.min_rtt_filter.get()
+        if interval <= 0 or (min_rtt is not None and interval < min_rtt):
+            return None
+
+        delivery_rate = (self.delivered - prior_delivered) / interval
+        if not is_app_limited or delivery_rate >= (self.bw_filter.get() or 0):
+            self.bw_filter.update(self.round_count, delivery_rate)
+        return RateSample(delivery_rate, rtt, interval, self.delivered - prior_delivered, is_app_limited)
+
+    def bandwidth(self):
+        """Bottleneck bandwidth estimate in bytes/sec (0 until the first sample)."""
+        return self.bw_filter.get() or 0
+
+    def min_rtt(self):
+        return self.min_rtt_filter.get()
+
+    def bdp(self):
+        min_rtt = self.min_rtt()
+        return self.bandwidth() * min_rtt if min_rtt is not None else 0
+
+# ======================================================================
+#                  END of delivery_rate.py
+# ======================================================================
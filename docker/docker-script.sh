@@ -2,22 +2,42 @@
 chmod +x training_profile.sh
 ./training_profile.sh &
 
+# one receiver for all runs, each sender opens its own session
+python receiver_daemon.py &
+RECEIVER_PID=$!
+sleep 1
+
 echo " ========== Stop and Wait ========== "
-python receiver.py &
 python sender_stop_and_wait.py
 
 echo " ========== Fixed Sliding Window ========== "
-python receiver.py &
 python sender_fixed_sliding_window.py
 
 echo " ========== TCP Tahoe ========== "
-python receiver.py &
 python sender_tahoe.py
 
 echo " ========== TCP Reno ========== "
-python receiver.py &
 python sender_reno.py
 
 echo " ========== Custom Protocol ========== "
-python receiver.py &
 python sender_custom.py
+
+echo " ========== Custom Protocol, RACK-TLP and HyStart ========== "
+python sender_custom_rack.py
+
+echo " ========== Threaded Reno ========== "
+python sender_threaded.py
+
+echo " ========== TCP CUBIC ========== "
+python sender_cubic.py
+
+echo " ========== TCP Vegas ========== "
+python sender_vegas.py
+
+echo " ========== Objective Tuned ========== "
+python sender_objective.py
+
+echo " ========== Multi-file Session ========== "
+python sender_session.py
+
+kill -INT $RECEIVER_PID
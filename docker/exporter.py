@@ -0,0 +1,155 @@
+# ======================================================================
+#                   exporter.py
+# ======================================================================
+#
+# Live metrics for in-flight transfers, in the Prometheus text format.
+# A background thread calls the owner's collect() once per interval and
+# publishes the snapshot to a textfile (for node_exporter's textfile
+# collector) and/or an HTTP endpoint on loopback. Scrapes are served from
+# the last snapshot, so the transfer pays for one collect() per interval
+# no matter how often it is scraped.
+#
+#     METRICS_TEXTFILE=/var/lib/node_exporter/{job}.prom python sender_reno.py
+#     METRICS_PORT=9101 python receiver.py      # curl 127.0.0.1:9101/metrics
+
+import os
+import time
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = 'udp_tcp'
+DEFAULT_INTERVAL = 1.0  # seconds between snapshots
+RTT_QUANTILES = (0.5, 0.9, 0.99)
+
+def quantile_metrics(name, samples, quantiles=RTT_QUANTILES):
+    """Summary-style quantile gauges of a bounded sample list."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {f'{name}{{quantile="{q}"}}': samples[min(int(q * len(samples)), len(samples) - 1)]
+            for q in quantiles}
+
+class MetricsExporter:
+    """Periodically publishes collect()'s {name: value} dict, a no-op unless configured.
+
+    Names ending in _total are exported as counters, everything else as
+    gauges. rates maps a counter to a gauge that is set to the counter's
+    per-second increase over the last interval, e.g. goodput from bytes acked.
+    textfile may contain {job}, so sender and receiver can share one setting.
+    """
+
+    def __init__(self, job, collect, textfile=None, port=None, interval=None, rates=None) -> None:
+        self.job = job
+        self.collect = collect
+        self.textfile = textfile or os.environ.get('METRICS_TEXTFILE')
+        if self.textfile:
+            self.textfile = self.textfile.format(job=job)
+        self.port = port or int(os.environ.get('METRICS_PORT', 0))
+        self.interval = interval or float(os.environ.get('METRICS_INTERVAL', DEFAULT_INTERVAL))
+        self.rates = rates or {}
+
+        self.snapshot = b''
+        self.last_values = {}
+        self.last_time = None
+        self.stopped = threading.Event()
+        self.thread = None
+        self.server = None
+
+    @property
+    def enabled(self):
+        return bool(self.textfile or self.port)
+
+    def render(self):
+        now = time.monotonic()
+        values = self.collect()
+        for counter, gauge in self.rates.items():
+            if self.last_time is not None and now > self.last_time and counter in values:
+                values[gauge] = (values[counter] - self.last_values.get(counter, 0)) / (now - self.last_time)
+        self.last_values = values
+        self.last_time = now
+
+        lines = []
+        typed = set()
+        for name, value in values.items():
+            if value is None:
+                continue
+            base_name = f"{METRICS_PREFIX}_{self.job}_{name.split('{')[0]}"
+            if base_name not in typed:
+                typed.add(base_name)
+                lines.append(f"# TYPE {base_name} {'counter' if base_name.endswith('_total') else 'gauge'}")
+            lines.append(f"{METRICS_PREFIX}_{self.job}_{name} {value}")
+        return ('\n'.join(lines) + '\n').encode()
+
+    def publish(self):
+        try:
+            self.snapshot = self.render()
+        except Exception as e:
+            # never let monitoring take the transfer down
+            logger.warning(f"Could not collect metrics: {e}")
+            return
+        if self.textfile:
+            # write then rename, so the collector never reads a partial file
+            tmp_path = self.textfile + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(self.snapshot)
+            os.replace(tmp_path, self.textfile)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.publish()
+
+    def start_server(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(exporter.snapshot)))
+                self.end_headers()
+                self.wfile.write(exporter.snapshot)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint disabled, cannot bind 127.0.0.1:{self.port}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def start(self):
+        if not self.enabled:
+            return self
+        self.publish()
+        if self.port:
+            self.start_server()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        # final values, so a finished transfer is not left with a stale snapshot
+        self.publish()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+# ======================================================================
+#                  END of exporter.py
+# ======================================================================
@@ -0,0 +1,149 @@
+# ======================================================================
+#                   histogram.py
+# ======================================================================
+#
+# Fixed-memory latency histograms in the style of HdrHistogram. Values are
+# counted in buckets whose width doubles with every power of two, so each
+# recorded latency keeps SUB_BUCKET_BITS - 1 significant bits (under 1%
+# error) from a microsecond up to an hour in about 3.3k counters. Recording
+# is O(1), histograms with the same layout merge by adding their counters,
+# and to_dict()/from_dict() carry them between processes as JSON:
+#
+#     HISTOGRAM_FILE=/tmp/reno-{pid}.json python sender_reno.py
+#     python histogram.py /tmp/reno-*.json      # percentiles of all runs merged
+
+import sys
+import json
+import math
+
+UNIT = 1e-6  # seconds per counted unit
+SUB_BUCKET_BITS = 8
+HIGHEST_TRACKABLE = 3600.0  # seconds, larger values are counted in the last bucket
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+class LatencyHistogram:
+    """Log-bucketed histogram of latencies in seconds, with an exact max and mean."""
+
+    def __init__(self, unit=UNIT, sub_bucket_bits=SUB_BUCKET_BITS, highest=HIGHEST_TRACKABLE) -> None:
+        self.unit = unit
+        self.sub_bucket_bits = sub_bucket_bits
+        self.highest = highest
+        self.half_count = 1 << (sub_bucket_bits - 1)
+        self.highest_value = int(highest / unit)
+        self.counts = [0] * (self.index(self.highest_value) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def index(self, value):
+        # values below 2**bits are counted exactly, above that each power of two gets half_count buckets
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        return shift * self.half_count + (value >> shift)
+
+    def bucket_limit(self, index):
+        """Upper edge of a bucket, in seconds."""
+        if index < 2 * self.half_count:
+            return (index + 1) * self.unit
+        shift = index // self.half_count - 1
+        return ((index - shift * self.half_count + 1) << shift) * self.unit
+
+    def record(self, seconds):
+        value = min(max(int(seconds / self.unit), 0), self.highest_value)
+        self.counts[self.index(value)] += 1
+        self.total += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def percentiles(self, percents=REPORT_PERCENTILES):
+        """{percent: latency} in one pass over the buckets, None for an empty histogram."""
+        if not self.total:
+            return {percent: None for percent in percents}
+        targets = sorted((max(math.ceil(percent / 100 * self.total), 1), percent) for percent in percents)
+        results = {}
+        seen = 0
+        i = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            while i < len(targets) and seen >= targets[i][0]:
+                # the bucket edge may lie above every recorded value
+                results[targets[i][1]] = min(self.bucket_limit(index), self.max)
+                i += 1
+            if i == len(targets):
+                break
+        return results
+
+    def percentile(self, percent):
+        return self.percentiles((percent,))[percent]
+
+    def describe(self, percents=REPORT_PERCENTILES):
+        """'p50 / p90 / ... / max' with microsecond precision."""
+        values = list(self.percentiles(percents).values()) + [self.max]
+        return ' / '.join(f"{value:.6f}" for value in values)
+
+    def merge(self, other):
+        if (other.unit, other.sub_bucket_bits, len(other.counts)) != (self.unit, self.sub_bucket_bits, len(self.counts)):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        return self
+
+    def to_dict(self):
+        return {
+            'unit': self.unit,
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'highest': self.highest,
+            'total': self.total,
+            'sum': self.sum,
+            'max': self.max,
+            # sparse, most buckets of a latency histogram stay empty
+            'counts': {str(index): count for index, count in enumerate(self.counts) if count},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['unit'], data['sub_bucket_bits'], data['highest'])
+        for index, count in data['counts'].items():
+            histogram.counts[int(index)] = count
+        histogram.total = data['total']
+        histogram.sum = data['sum']
+        histogram.max = data['max']
+        return histogram
+
+def save_histograms(path, histograms):
+    """Write {name: LatencyHistogram} as JSON."""
+    with open(path, 'w') as f:
+        json.dump({name: histogram.to_dict() for name, histogram in histograms.items()}, f)
+
+def load_histograms(paths):
+    """Read files written by save_histograms(), merging histograms of the same name."""
+    merged = {}
+    for path in paths:
+        with open(path) as f:
+            for name, data in json.load(f).items():
+                histogram = LatencyHistogram.from_dict(data)
+                if name in merged:
+                    merged[name].merge(histogram)
+                else:
+                    merged[name] = histogram
+    return merged
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python histogram.py FILE...")
+    header = '/'.join(f"p{percent:g}" for percent in REPORT_PERCENTILES)
+    for name, histogram in load_histograms(sys.argv[1:]).items():
+        print(f"{name} ({histogram.total} samples, mean {histogram.mean():.6f}) {header}/max: {histogram.describe()} seconds")
+
+# ======================================================================
+#                  END of histogram.py
+# ======================================================================
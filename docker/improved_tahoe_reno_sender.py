@@ -40,6 +40,8 @@ def stop_and_wait_send(udp_socket, message, address):
             return False
 
 def fixed_sliding_window_send(udp_socket, messages, address, acks):
+    # every message in the window starts unacked
+    unacked = len(acks)
     # wait for acknowledgement
     while True:
         try:
@@ -53,19 +55,17 @@ def fixed_sliding_window_send(udp_socket, messages, address, acks):
             # calculate the 
             ack_id_prev = ack_id - MESSAGE_SIZE
 
-            if ack_id_prev in acks:
-                acks[ack_id_prev] = True
-            else:
-                max_acks_key = max(acks.keys())
+            if ack_id_prev not in acks:
+                # the last message is shorter, messages are in sequence order
+                _, message = messages[-1]
+                ack_id_prev = ack_id - len(message) + SEQ_ID_SIZE
 
-                # search for length of the last message
-                for sid, message in messages:
-                    if sid == max_acks_key:
-                        ack_id_prev = ack_id - len(message) + SEQ_ID_SIZE
-                        acks[ack_id_prev] = True
+            if acks.get(ack_id_prev) is False:
+                unacked -= 1
+            acks[ack_id_prev] = True
 
             # all acks received, move on
-            if all(acks.values()):
+            if unacked == 0:
                 return True
         except socket.timeout:
             # no ack received, resend unacked messages
@@ -81,6 +81,9 @@ def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
     dup_acks = []
     counts = []
 
+    # every message in the window starts unacked
+    unacked = len(acks)
+
     # check if we are in congestion avoidance phase
     if WINDOW_SIZE >= ssthresh:
         linear = True
@@ -91,6 +94,8 @@ def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
         # extract ack id
         ack_id = int.from_bytes(ack[:SEQ_ID_SIZE], byteorder='big')
         print(ack_id, ack[SEQ_ID_SIZE:])
+        if acks.get(ack_id) is False:
+            unacked -= 1
         acks[ack_id] = True
 
         # if TIMEOUT
@@ -118,7 +123,7 @@ def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
                 return False
 
         # if ALL RECEIVED
-        if all(acks.values()):
+        if unacked == 0:
             print("All ACK(s) received")
             if linear:
                 WINDOW_SIZE = WINDOW_SIZE + 1
@@ -134,6 +139,9 @@ def tcp_reno(udp_socket, messages, receiver_addr, acks, ssthresh):
     dup_acks = []
     counts = []
 
+    # every message in the window starts unacked
+    unacked = len(acks)
+
     # check if we are in congestion avoidance phase
     if WINDOW_SIZE >= ssthresh:
         linear = True
@@ -144,6 +152,8 @@ def tcp_reno(udp_socket, messages, receiver_addr, acks, ssthresh):
         # extract ack id
         ack_id = int.from_bytes(ack[:SEQ_ID_SIZE], byteorder='big')
         print(ack_id, ack[SEQ_ID_SIZE:])
+        if acks.get(ack_id) is False:
+            unacked -= 1
         acks[ack_id] = True
 
         # if TIMEOUT
@@ -172,7 +182,7 @@ def tcp_reno(udp_socket, messages, receiver_addr, acks, ssthresh):
                 return False
 
         # if ALL RECEIVED
-        if all(acks.values()):
+        if unacked == 0:
             print("All ACK(s) received")
             if linear:
                 WINDOW_SIZE = WINDOW_SIZE + 1
@@ -0,0 +1,398 @@
+# ======================================================================
+#                   netem.py
+# ======================================================================
+#
+# User-space network emulator with packet-level record and replay, so two
+# sender builds can be compared under identical network conditions on
+# loopback. It runs as a UDP proxy between the senders and the receiver:
+# data packets cross a bottleneck link with a rate, a queue limit, a delay,
+# random loss and reordering, as the netem qdisc of training_profile.sh
+# applies them, and ACKs pass straight back.
+#
+#     python receiver_daemon.py 5002 &
+#     python netem.py record run.trace --profile training --seed 7 &
+#     python sender_reno.py
+#     python netem.py replay run.trace --record replayed.trace &
+#     python sender_reno.py        # new build: same losses, reorders and link changes
+#     python netem.py show run.trace replayed.trace
+#
+# A trace is TRACE_MAGIC followed by fixed-size records: microseconds since
+# the first packet, event, direction, size and value (a seq id, or the new
+# rate, delay or loss rate). Replay applies the recorded rate and delay
+# changes at the same times, and the loss/reorder fate of the n-th data
+# packet of the recording to the n-th data packet of the new run. Queueing
+# and queue drops follow from the new run's own traffic. Past the end of
+# the trace, fates repeat from its start.
+
+import sys
+import time
+import heapq
+import random
+import select
+import socket
+import struct
+import argparse
+from collections import deque, namedtuple, Counter
+
+TRACE_MAGIC = b'UDPTRC01'
+RECORD_STRUCT = struct.Struct('!IBBHi')
+
+# events
+EVENT_ARRIVE = 0  # a packet reached the emulator
+EVENT_DELIVER = 1  # and left it for its destination
+EVENT_LOSS = 2  # random loss
+EVENT_REORDER = 3  # skips the delay, overtaking packets queued before it
+EVENT_QUEUE_DROP = 4  # the bottleneck queue was full
+EVENT_RATE = 5  # link rate change, bytes/sec, 0 for unlimited
+EVENT_DELAY = 6  # one-way delay change, microseconds
+EVENT_LOSS_RATE = 7  # loss probability change, parts per million
+EVENT_NAMES = ['arrive', 'deliver', 'loss', 'reorder', 'queue drop', 'rate', 'delay', 'loss rate']
+CONDITION_EVENTS = (EVENT_RATE, EVENT_DELAY, EVENT_LOSS_RATE)
+
+DATA = 0  # sender -> receiver
+ACK = 1  # receiver -> sender
+
+FATE_NORMAL = 0
+FATE_LOSS = 1
+FATE_REORDER = 2
+
+LISTEN_PORT = 5001
+TARGET = ('127.0.0.1', 5002)
+QUEUE_LIMIT = 1000  # packets, as netem's limit
+PROFILE_INTERVAL = 1.0  # seconds between training profile changes
+SOCKET_BUFFER = 8 * 1024 * 1024
+
+TraceRecord = namedtuple('TraceRecord', ['time', 'event', 'direction', 'size', 'value'])
+
+def packet_seq(packet):
+    """Seq id of a v2 or legacy packet, for the trace only."""
+    if len(packet) < 8:
+        return -1
+    offset = 4 if packet[0] == 0x82 else 0
+    return int.from_bytes(packet[offset:offset + 4], signed=True, byteorder='big')
+
+def read_trace(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f"{path} is not a packet trace")
+    return [TraceRecord(t / 1e6, event, direction, size, value)
+            for t, event, direction, size, value in RECORD_STRUCT.iter_unpack(data[len(TRACE_MAGIC):])]
+
+class TraceWriter:
+    def __init__(self, path) -> None:
+        self.file = open(path, 'wb')
+        self.file.write(TRACE_MAGIC)
+
+    def write(self, elapsed, event, direction, size=0, value=0):
+        self.file.write(RECORD_STRUCT.pack(int(elapsed * 1e6), event, direction, size, value))
+
+    def close(self):
+        self.file.close()
+
+class ProfileConditions:
+    """Link conditions from a seeded RNG, constant or following training_profile.sh.
+
+    The training profile starts at 100 kbit/s without loss, and every
+    second halves the rate and adds 2% loss (6 in 10) or divides it by three
+    and adds 3% loss, starting over below 2 kbit/s or above 20% loss, with
+    a 100 ms delay and 7% reordering throughout.
+    """
+
+    def __init__(self, profile='fixed', seed=None, delay=0.0, loss=0.0, reorder=0.0, rate=0) -> None:
+        self.profile = profile
+        self.random = random.Random(seed)
+        if profile == 'training':
+            # tc takes bits/sec and whole percents
+            self.bandwidth = 100000
+            self.loss_percent = 0
+            delay, loss, reorder, rate = 0.1, 0.0, 0.07, self.bandwidth // 8
+        self.delay = delay
+        self.loss = loss
+        self.reorder = reorder
+        self.rate = rate
+        self.next_change = 0.0
+
+    def update(self, elapsed):
+        """Condition changes due by elapsed seconds, as (event, value) pairs."""
+        if elapsed < self.next_change:
+            return []
+        if self.next_change == 0.0:
+            self.next_change = PROFILE_INTERVAL if self.profile == 'training' else float('inf')
+            return self.conditions()
+        self.next_change += PROFILE_INTERVAL
+        if self.random.randint(1, 10) < 7:
+            self.bandwidth //= 2
+            self.loss_percent += 2
+        else:
+            self.bandwidth //= 3
+            self.loss_percent += 3
+        if self.bandwidth < 2000:
+            self.bandwidth = 100000
+        if self.loss_percent > 20:
+            self.loss_percent = 0
+        self.rate = self.bandwidth // 8
+        self.loss = self.loss_percent / 100
+        return [(EVENT_RATE, self.rate), (EVENT_LOSS_RATE, round(self.loss * 1e6))]
+
+    def conditions(self):
+        return [(EVENT_RATE, int(self.rate)), (EVENT_DELAY, round(self.delay * 1e6)),
+                (EVENT_LOSS_RATE, round(self.loss * 1e6))]
+
+    def fate(self, ordinal):
+        if self.random.random() < self.loss:
+            return FATE_LOSS
+        if self.random.random() < self.reorder:
+            return FATE_REORDER
+        return FATE_NORMAL
+
+class TraceConditions:
+    """Replays the condition changes and data packet fates of a recorded trace."""
+
+    def __init__(self, records) -> None:
+        self.changes = [(r.time, r.event, r.value) for r in records if r.event in CONDITION_EVENTS]
+        self.next = 0
+        self.fates = bytearray()
+        for r in records:
+            if r.direction != DATA:
+                continue
+            if r.event == EVENT_ARRIVE:
+                self.fates.append(FATE_NORMAL)
+            elif r.event == EVENT_LOSS:
+                self.fates[-1] = FATE_LOSS
+            elif r.event == EVENT_REORDER:
+                self.fates[-1] = FATE_REORDER
+
+    def update(self, elapsed):
+        due = []
+        while self.next < len(self.changes) and self.changes[self.next][0] <= elapsed:
+            due.append(self.changes[self.next][1:])
+            self.next += 1
+        return due
+
+    def fate(self, ordinal):
+        return self.fates[ordinal % len(self.fates)] if self.fates else FATE_NORMAL
+
+class LinkEmulator:
+    """UDP proxy applying conditions to the data direction, one upstream socket per sender.
+
+    Each sender gets its own socket towards the receiver, so the receiver
+    still tells the flows apart, and all of them share one bottleneck queue.
+    With several listen ports, delivered data bytes are counted per port,
+    which lets a benchmark give every flow its own port.
+    """
+
+    def __init__(self, conditions, trace=None, listen_ports=(LISTEN_PORT,), target=TARGET, limit=QUEUE_LIMIT) -> None:
+        self.conditions = conditions
+        self.trace = trace
+        self.target = target
+        self.limit = limit
+
+        self.fronts = {self.open_socket(('0.0.0.0', port)): port for port in listen_ports}
+        self.upstream = {}  # (listen socket, sender address) -> socket towards the receiver
+        self.senders = {}  # socket towards the receiver -> (listen socket, sender address)
+        self.delivered = Counter()  # listen port -> data bytes delivered to the receiver
+        self.stopped = False
+
+        self.rate = 0
+        self.delay = 0.0
+        self.loss = 0.0
+        self.link_free = 0.0
+        self.departures = deque()
+        self.pending = []  # heap of (deliver time, order, socket, packet, address, direction, seq id)
+        self.order = 0
+        self.ordinal = 0
+        self.start = None
+        self.counts = Counter()
+
+    def open_socket(self, address):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+        sock.bind(address)
+        return sock
+
+    def record(self, now, event, direction, size=0, value=0):
+        self.counts[event, direction] += 1
+        if self.trace is not None:
+            self.trace.write(now - self.start, event, direction, size, value)
+
+    def apply_conditions(self, now):
+        for event, value in self.conditions.update(now - self.start):
+            if event == EVENT_RATE:
+                self.rate = value
+            elif event == EVENT_DELAY:
+                self.delay = value / 1e6
+            elif event == EVENT_LOSS_RATE:
+                self.loss = value / 1e6
+            self.record(now, event, DATA, value=value)
+
+    def schedule(self, when, sock, packet, address, direction, seq_id):
+        heapq.heappush(self.pending, (when, self.order, sock, packet, address, direction, seq_id))
+        self.order += 1
+
+    def on_data(self, packet, front, sender, now):
+        if self.start is None:
+            # times count from the first packet, so startup jitter does not shift the schedule
+            self.start = now
+            self.apply_conditions(now)
+        sock = self.upstream.get((front, sender))
+        if sock is None:
+            sock = self.upstream[front, sender] = self.open_socket(('127.0.0.1', 0))
+            self.senders[sock] = (front, sender)
+
+        seq_id = packet_seq(packet)
+        self.record(now, EVENT_ARRIVE, DATA, len(packet), seq_id)
+        fate = self.conditions.fate(self.ordinal)
+        self.ordinal += 1
+        if fate == FATE_LOSS:
+            self.record(now, EVENT_LOSS, DATA, len(packet), seq_id)
+            return
+        if fate == FATE_REORDER:
+            self.record(now, EVENT_REORDER, DATA, len(packet), seq_id)
+
+        departure = now
+        if self.rate:
+            while self.departures and self.departures[0] <= now:
+                self.departures.popleft()
+            if len(self.departures) >= self.limit:
+                self.record(now, EVENT_QUEUE_DROP, DATA, len(packet), seq_id)
+                return
+            self.link_free = max(self.link_free, now) + len(packet) / self.rate
+            departure = self.link_free
+            self.departures.append(departure)
+        self.schedule(departure if fate == FATE_REORDER else departure + self.delay,
+                      sock, packet, self.target, DATA, seq_id)
+
+    def on_ack(self, packet, sock, now):
+        seq_id = packet_seq(packet)
+        self.record(now, EVENT_ARRIVE, ACK, len(packet), seq_id)
+        front, sender = self.senders[sock]
+        self.schedule(now, front, packet, sender, ACK, seq_id)
+
+    def run(self, duration=None):
+        deadline = time.monotonic() + duration if duration else float('inf')
+        while not self.stopped:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            timeout = min(deadline - now, PROFILE_INTERVAL)
+            if self.pending:
+                timeout = min(timeout, max(self.pending[0][0] - now, 0))
+            readable, _, _ = select.select([*self.fronts, *self.senders], [], [], timeout)
+
+            now = time.monotonic()
+            if self.start is not None:
+                self.apply_conditions(now)
+            for sock in readable:
+                packet, address = sock.recvfrom(65536)
+                if sock in self.fronts:
+                    self.on_data(packet, sock, address, now)
+                else:
+                    self.on_ack(packet, sock, now)
+
+            while self.pending and self.pending[0][0] <= now:
+                _when, _order, sock, packet, address, direction, seq_id = heapq.heappop(self.pending)
+                sock.sendto(packet, address)
+                self.record(now, EVENT_DELIVER, direction, len(packet), seq_id)
+                if direction == DATA:
+                    self.delivered[self.fronts[self.senders[sock][0]]] += len(packet)
+
+    def stop(self):
+        """Ask run() to return, from another thread."""
+        self.stopped = True
+
+    def close(self):
+        for sock in [*self.fronts, *self.senders]:
+            sock.close()
+        if self.trace is not None:
+            self.trace.close()
+
+def summarize(records):
+    counts = Counter((r.event, r.direction) for r in records)
+    duration = records[-1].time if records else 0
+    lines = [f"{duration:.3f} s, {len(records)} records"]
+    for direction, name in ((DATA, 'data'), (ACK, 'ack')):
+        events = ', '.join(f"{EVENT_NAMES[event]} {counts[event, direction]}"
+                           for event in (EVENT_ARRIVE, EVENT_DELIVER, EVENT_LOSS, EVENT_REORDER, EVENT_QUEUE_DROP)
+                           if counts[event, direction])
+        lines.append(f"  {name}: {events or 'none'}")
+    changes = sum(counts[event, DATA] for event in CONDITION_EVENTS)
+    lines.append(f"  condition changes: {changes}")
+    return '\n'.join(lines)
+
+def compare(first, second):
+    """How closely the second trace followed the first one's fates and link changes."""
+    fates = [TraceConditions(first).fates, TraceConditions(second).fates]
+    common = min(len(f) for f in fates)
+    differing = sum(a != b for a, b in zip(fates[0][:common], fates[1][:common]))
+    schedules = [[(event, value) for _t, event, value in TraceConditions(records).changes] for records in (first, second)]
+    common_changes = min(len(s) for s in schedules)
+    same_schedule = schedules[0][:common_changes] == schedules[1][:common_changes]
+    return (f"fates differ for {differing} of {common} data packets in common, "
+            f"link changes {'match' if same_schedule else 'differ'} over the first {common_changes}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate a bottleneck link, recording or replaying packet fates.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_link_options(command):
+        command.add_argument('--listen', type=int, nargs='+', default=[LISTEN_PORT], help="ports the senders send to")
+        command.add_argument('--target', default=f"{TARGET[0]}:{TARGET[1]}", help="receiver address")
+        command.add_argument('--limit', type=int, default=QUEUE_LIMIT, help="bottleneck queue limit, packets")
+        command.add_argument('--duration', type=float, help="stop after this many seconds")
+
+    record = commands.add_parser('record', help="emulate from a profile and record the trace")
+    record.add_argument('trace')
+    record.add_argument('--profile', choices=['fixed', 'training'], default='fixed')
+    record.add_argument('--seed', type=int)
+    record.add_argument('--delay', type=float, default=0.0, help="one-way delay, seconds")
+    record.add_argument('--loss', type=float, default=0.0, help="loss probability")
+    record.add_argument('--reorder', type=float, default=0.0, help="probability a packet skips the delay")
+    record.add_argument('--rate', type=int, default=0, help="link rate, bytes/sec (0: unlimited)")
+    add_link_options(record)
+
+    replay = commands.add_parser('replay', help="apply a recorded trace's fates and link changes")
+    replay.add_argument('trace')
+    replay.add_argument('--record', metavar='TRACE', help="also record the replayed run")
+    add_link_options(replay)
+
+    show = commands.add_parser('show', help="summarize a trace, or compare a replay with its recording")
+    show.add_argument('trace')
+    show.add_argument('other', nargs='?')
+
+    options = parser.parse_args()
+    if options.command == 'show':
+        first = read_trace(options.trace)
+        print(f"{options.trace}: {summarize(first)}")
+        if options.other:
+            second = read_trace(options.other)
+            print(f"{options.other}: {summarize(second)}")
+            print(compare(first, second))
+        return
+
+    if options.command == 'record':
+        conditions = ProfileConditions(options.profile, options.seed, options.delay, options.loss,
+                                       options.reorder, options.rate)
+        trace = TraceWriter(options.trace)
+    else:
+        conditions = TraceConditions(read_trace(options.trace))
+        trace = TraceWriter(options.record) if options.record else None
+
+    host, port = options.target.rsplit(':', 1)
+    emulator = LinkEmulator(conditions, trace, options.listen, (host, int(port)), options.limit)
+    try:
+        emulator.run(options.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+        print(', '.join(f"{EVENT_NAMES[event]} ({'data' if direction == DATA else 'ack'}) {count}"
+                        for (event, direction), count in sorted(emulator.counts.items())), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
+
+# ======================================================================
+#                  END of netem.py
+# ======================================================================
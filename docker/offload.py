@@ -0,0 +1,85 @@
+# ======================================================================
+#                   offload.py
+# ======================================================================
+#
+# Linux UDP segmentation offload. With GSO (UDP_SEGMENT) one sendmsg hands
+# the kernel a run of equal-sized packets and it sends them as separate
+# datagrams; with GRO (UDP_GRO) one recvmsg may return several datagrams of
+# the same flow coalesced, with their size in a control message. Each
+# function reports False/None where the kernel or platform lacks support,
+# so callers fall back to one syscall per datagram.
+
+import socket
+import struct
+
+# Linux values, Python does not export them
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+
+GSO_MAX_SEGMENTS = 64  # UDP_MAX_SEGMENTS
+GSO_MAX_BYTES = 65507  # largest UDP payload over IPv4
+GRO_BUFFER_SIZE = 65535
+GRO_CMSG_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 0
+SEGMENT_SIZE_STRUCT = struct.Struct('=H')
+GRO_SIZE_STRUCT = struct.Struct('=i')
+
+def enable_gso(sock):
+    """Return True if sock can send with UDP_SEGMENT."""
+    if not hasattr(sock, 'sendmsg'):
+        return False
+    try:
+        sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+    except OSError:
+        return False
+    return True
+
+def enable_gro(sock):
+    """Turn on UDP_GRO for sock, return False if unsupported."""
+    if not GRO_CMSG_SIZE:
+        return False
+    try:
+        sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+    except OSError:
+        return False
+    return True
+
+def segment_runs(packets):
+    """Split packets into runs that one GSO send can carry.
+
+    All packets of a run have the size of its first one, except the last,
+    which may be shorter, and a run stays within GSO_MAX_SEGMENTS and
+    GSO_MAX_BYTES.
+    """
+    run = []
+    size = 0
+    for packet in packets:
+        length = len(packet)
+        if run and (length > size or len(run) == GSO_MAX_SEGMENTS or (len(run) + 1) * size > GSO_MAX_BYTES):
+            yield run
+            run = []
+        if not run:
+            size = length
+        run.append(packet)
+        if length < size:
+            # a short packet ends the run
+            yield run
+            run = []
+    if run:
+        yield run
+
+def send_segments(sock, packets, address):
+    """Send a run from segment_runs() as one datagram per packet, in one syscall."""
+    ancdata = [(SOL_UDP, UDP_SEGMENT, SEGMENT_SIZE_STRUCT.pack(len(packets[0])))]
+    return sock.sendmsg(packets, ancdata, 0, address)
+
+def parse_gro_size(ancdata):
+    """Size of the coalesced datagrams from recvmsg ancillary data, None if not coalesced."""
+    for level, kind, data in ancdata:
+        if level == SOL_UDP and kind == UDP_GRO and len(data) >= GRO_SIZE_STRUCT.size:
+            return GRO_SIZE_STRUCT.unpack_from(data)[0]
+    return None
+
+# ======================================================================
+#                  END of offload.py
+# ======================================================================
@@ -0,0 +1,98 @@
+# ======================================================================
+#                   path_metrics.py
+# ======================================================================
+#
+# Per-destination path metrics kept across transfers, in the spirit of the
+# Linux TCP metrics cache: when a transfer ends, the sender stores its
+# smoothed RTT, RTT variance, min RTT, ssthresh and bandwidth estimate under
+# the receiver's (host, port), and the next transfer to the same receiver
+# starts from them instead of the fixed defaults. ssthresh is only stored
+# once a loss or slow start exit set it, otherwise the stored one is kept.
+# The cache is a small JSON file so it outlives the sender process, and it
+# is off unless PATH_METRICS_FILE names one, so unrelated runs against the
+# same receiver do not warm-start each other. Entries lose weight as they age
+# (trust halves every PATH_METRICS_HALF_LIFE) and are dropped after
+# PATH_METRICS_MAX_AGE or when more than PATH_METRICS_CAPACITY destinations
+# are known, oldest first.
+
+import os
+import json
+import time
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+PATH_METRICS_FILE = ''  # off, PATH_METRICS_FILE in the environment enables it, e.g. /tmp/path_metrics.json
+PATH_METRICS_MAX_AGE = 3600.0  # seconds, as the Linux TCP metrics timeout
+PATH_METRICS_HALF_LIFE = 300.0  # seconds
+PATH_METRICS_CAPACITY = 256
+
+# trust is 1 for fresh metrics and halves every PATH_METRICS_HALF_LIFE
+PathMetrics = namedtuple('PathMetrics', ['srtt', 'rttvar', 'min_rtt', 'ssthresh', 'bandwidth', 'trust'])
+
+class PathMetricsCache:
+    """Path metrics by destination, stored in a JSON file."""
+
+    def __init__(self, path=None) -> None:
+        self.path = path if path is not None else os.environ.get('PATH_METRICS_FILE', PATH_METRICS_FILE)
+
+    def load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable path metrics cache {self.path}: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def lookup(self, host, port, now=None):
+        """The stored metrics of (host, port), None if unknown or expired."""
+        now = time.time() if now is None else now
+        entry = self.load().get(f'{host}:{port}')
+        if entry is None:
+            return None
+        try:
+            age = max(now - entry['updated'], 0)
+            if age > PATH_METRICS_MAX_AGE:
+                return None
+            return PathMetrics(entry['srtt'], entry['rttvar'], entry['min_rtt'], entry['ssthresh'],
+                               entry['bandwidth'], 0.5 ** (age / PATH_METRICS_HALF_LIFE))
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed path metrics for {host}:{port}: {e}")
+            return None
+
+    def update(self, host, port, srtt, rttvar, min_rtt, ssthresh, bandwidth, now=None):
+        """Store the metrics of a finished transfer, evicting expired and surplus entries.
+
+        A ssthresh of None keeps the stored one, if any.
+        """
+        if not self.path:
+            return
+        now = time.time() if now is None else now
+        entries = self.load()
+        if ssthresh is None:
+            ssthresh = entries.get(f'{host}:{port}', {}).get('ssthresh')
+        entries[f'{host}:{port}'] = {
+            'srtt': srtt, 'rttvar': rttvar, 'min_rtt': min_rtt,
+            'ssthresh': ssthresh, 'bandwidth': bandwidth, 'updated': now,
+        }
+        fresh = sorted((entry for entry in entries.items() if now - entry[1].get('updated', 0) <= PATH_METRICS_MAX_AGE),
+                       key=lambda entry: entry[1].get('updated', 0))
+        entries = dict(fresh[-PATH_METRICS_CAPACITY:])
+        # write then rename, so a concurrent sender never reads a partial file
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save path metrics to {self.path}: {e}")
+
+# ======================================================================
+#                  END of path_metrics.py
+# ======================================================================
@@ -0,0 +1,243 @@
+# ======================================================================
+#                   profiling.py
+# ======================================================================
+#
+# Profiling mode for the sender launchers and receiver.py:
+#
+#     python profiling.py sender_reno.py
+#     python profiling.py --cprofile reno.prof --output reno.json sender_reno.py
+#
+# Runs the script unchanged, with perf_counter_ns timers wrapped around the
+# per-packet phases (file reads, packet building, socket calls, congestion
+# logic, metrics bookkeeping, and on the receiver ring drains, reassembly,
+# ACKs and output writes), and prints a per-phase breakdown at exit.
+# Phase times are exclusive: time spent in a nested phase, e.g. the sendto
+# inside send_packet, is only counted for the inner phase. Nothing is wrapped
+# unless the script is started through this module.
+
+import os
+import sys
+import json
+import time
+import runpy
+import socket
+import pstats
+import cProfile
+import argparse
+import importlib
+import threading
+import functools
+from collections import defaultdict
+
+from offload import parse_gro_size
+
+# phase -> (module, class, methods) wrapped with a timer
+PHASES = [
+    ('file read', 'utils', 'FileReader', ['read']),
+    ('packet build', 'utils', 'UdpTcpSocket', ['create_packet']),
+    ('send path', 'utils', 'UdpTcpSocket', ['send_packet', 'send_packets']),
+    ('receive path', 'utils', 'UdpTcpSocket', ['receive_packet']),
+    ('delivery rate', 'utils', 'UdpTcpSocket', ['record_delivery', 'mark_app_limited']),
+    ('congestion control', 'utils', 'TahoeRenoSender',
+     ['on_new_ack', 'on_dup_ack', 'on_sack', 'on_timeout', 'pop_retransmissions', 'fast_retransmissions']),
+    ('congestion control', 'rack', 'RackTlp', ['on_send', 'on_rtt_sample', 'on_delivered', 'detect_losses']),
+    ('metrics', 'utils', 'PerformanceMetrics', ['start_packet', 'end_packet']),
+    ('buffer sizing', 'sockbuf', 'SocketBufferSizer', ['on_delivered', 'on_rtt_sample']),
+    ('ring drain', 'receiver', 'RecvRing', ['receive']),
+    ('ring drain', 'receiver', 'GroRing', ['receive']),
+    ('reassembly', 'receiver', 'SackTracker', ['hold', 'release', 'blocks', 'dsack_blocks']),
+    ('ack build/send', 'receiver', 'AckWriter', ['pack', 'set_ack_id', 'send']),
+    ('output write', 'session', 'ReceiveSink', ['write']),
+]
+SEND_CALLS = ['sendto', 'send', 'sendmsg']
+RECEIVE_CALLS = ['recvfrom', 'recv', 'recvmsg', 'recvfrom_into', 'recvmsg_into']
+CPROFILE_TOP = 15
+
+class PhaseTimer:
+    """Exclusive per-phase wall time, kept per thread and merged in report()."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def state(self):
+        try:
+            return self.local.state
+        except AttributeError:
+            state = self.local.state = {
+                'stack': [], 'ns': defaultdict(int), 'calls': defaultdict(int),
+                'syscalls': 0, 'sent': 0, 'received': 0,
+            }
+            with self.lock:
+                self.threads.append(state)
+            return state
+
+    def wrap(self, func, phase):
+        perf_counter_ns = time.perf_counter_ns
+        timer = self
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            state = timer.state()
+            stack = state['stack']
+            stack.append(0)
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                state['ns'][phase] += elapsed - stack.pop()
+                state['calls'][phase] += 1
+                if stack:
+                    stack[-1] += elapsed
+        return timed
+
+    def wrap_socket_call(self, func, phase, counter):
+        timed = self.wrap(func, phase)
+        name = func.__name__
+        timer = self
+
+        @functools.wraps(func)
+        def call(sock, *args):
+            state = timer.state()
+            # a socket with a timeout polls before every send or receive
+            state['syscalls'] += 1 if sock.gettimeout() is None else 2
+            result = timed(sock, *args)
+            state[counter] += datagram_count(name, args, result)
+            return result
+        return call
+
+    def totals(self):
+        ns, calls = defaultdict(int), defaultdict(int)
+        counts = defaultdict(int)
+        for state in self.threads:
+            for phase, value in state['ns'].items():
+                ns[phase] += value
+            for phase, value in state['calls'].items():
+                calls[phase] += value
+            for key in ('syscalls', 'sent', 'received'):
+                counts[key] += state[key]
+        return ns, calls, counts
+
+def datagram_count(name, args, result):
+    """Datagrams moved by one socket call, a UDP GSO send or GRO read moves several."""
+    if name == 'sendmsg' and len(args) > 1 and args[1]:
+        return len(args[0])
+    if name in ('recvmsg', 'recvmsg_into'):
+        size = parse_gro_size(result[1])
+        if size:
+            nbytes = result[0] if name == 'recvmsg_into' else len(result[0])
+            return max(-(-nbytes // size), 1)
+    return 1
+
+class ProfiledSocket(socket.socket):
+    """socket.socket whose send and receive calls are timed as syscall phases."""
+
+def install(timer):
+    """Wrap the phase methods, return a function that undoes it."""
+    originals = []
+    for phase, module_name, class_name, methods in PHASES:
+        cls = getattr(importlib.import_module(module_name), class_name)
+        for name in methods:
+            originals.append((cls, name, cls.__dict__[name]))
+            setattr(cls, name, timer.wrap(cls.__dict__[name], phase))
+
+    for name in SEND_CALLS:
+        setattr(ProfiledSocket, name, timer.wrap_socket_call(getattr(socket.socket, name), 'sendto', 'sent'))
+    for name in RECEIVE_CALLS:
+        setattr(ProfiledSocket, name, timer.wrap_socket_call(getattr(socket.socket, name), 'recv (incl. wait)', 'received'))
+    plain_socket = socket.socket
+    socket.socket = ProfiledSocket
+
+    def uninstall():
+        socket.socket = plain_socket
+        for cls, name, method in originals:
+            setattr(cls, name, method)
+    return uninstall
+
+def run_script(path):
+    """Run path as __main__.
+
+    A script that is also a phase module (receiver.py) runs the main() of the
+    imported module instead, whose classes are the wrapped ones.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if any(name == module_name for _phase, module_name, _class_name, _methods in PHASES):
+        importlib.import_module(name).main()
+    else:
+        runpy.run_path(path, run_name='__main__')
+
+def report(timer, wall_ns, cpu_seconds):
+    ns, calls, counts = timer.totals()
+    wall = wall_ns / 1e9
+    datagrams = counts['sent'] + counts['received']
+    attributed = sum(ns.values())
+
+    print("---------- Profile ----------")
+    print(f"Wall time: {wall:.3f} s, CPU time: {cpu_seconds:.3f} s ({cpu_seconds / wall:.0%})")
+    print(f"{'phase':<22}{'time ms':>12}{'% wall':>9}{'calls':>10}{'ns/call':>10}")
+    for phase, value in sorted(ns.items(), key=lambda item: -item[1]):
+        print(f"{phase:<22}{value / 1e6:>12.1f}{value / wall_ns:>9.1%}{calls[phase]:>10}{value // calls[phase]:>10}")
+    if len(timer.threads) <= 1 and wall_ns > attributed:
+        print(f"{'other':<22}{(wall_ns - attributed) / 1e6:>12.1f}{(wall_ns - attributed) / wall_ns:>9.1%}")
+    elif len(timer.threads) > 1:
+        print(f"({len(timer.threads)} threads, phase times are summed across them)")
+    print(f"Datagrams sent: {counts['sent']} ({counts['sent'] / wall:,.0f}/s), "
+          f"received: {counts['received']} ({counts['received'] / wall:,.0f}/s)")
+    if datagrams:
+        print(f"Socket syscalls per datagram: {counts['syscalls'] / datagrams:.2f}")
+
+    return {
+        'wall_seconds': wall,
+        'cpu_seconds': cpu_seconds,
+        'threads': len(timer.threads),
+        'phases': {phase: {'ns': value, 'calls': calls[phase]} for phase, value in ns.items()},
+        'datagrams_sent': counts['sent'],
+        'datagrams_received': counts['received'],
+        'syscalls': counts['syscalls'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sender or receiver script with per-phase timers.")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="also run under cProfile (main thread only) and dump the stats to FILE")
+    parser.add_argument('--output', metavar='FILE', help="write the phase breakdown as JSON to FILE")
+    parser.add_argument('script', help="e.g. sender_reno.py or receiver.py")
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    options = parser.parse_args()
+
+    sys.argv = [options.script] + options.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(options.script)))
+
+    timer = PhaseTimer()
+    uninstall = install(timer)
+    profiler = cProfile.Profile() if options.cprofile else None
+
+    cpu_start = time.process_time()
+    start = time.perf_counter_ns()
+    try:
+        if profiler:
+            profiler.enable()
+        run_script(options.script)
+    finally:
+        if profiler:
+            profiler.disable()
+        wall_ns = time.perf_counter_ns() - start
+        cpu_seconds = time.process_time() - cpu_start
+        uninstall()
+
+        breakdown = report(timer, wall_ns, cpu_seconds)
+        if options.output:
+            with open(options.output, 'w') as f:
+                json.dump(breakdown, f, indent=2)
+        if profiler:
+            profiler.dump_stats(options.cprofile)
+            pstats.Stats(profiler).sort_stats('tottime').print_stats(CPROFILE_TOP)
+
+if __name__ == '__main__':
+    main()
+
+# ======================================================================
+#                  END of profiling.py
+# ======================================================================
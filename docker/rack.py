@@ -0,0 +1,170 @@
+# ======================================================================
+#                   rack.py
+# ======================================================================
+#
+# RACK-TLP loss detection (RFC 8985) for the selective repeat senders.
+# Instead of counting duplicate ACKs, RACK remembers when every outstanding
+# segment was last sent and declares a segment lost once a segment sent
+# after it has been delivered (ACKed or SACKed) and a reordering window has
+# passed since. The window starts at zero and opens to a quarter of the min
+# RTT once reordering is seen, widening further after each spurious
+# retransmission. A Tail Loss Probe resends the tail after about two SRTTs
+# of silence, so a lost last segment is recovered by RACK on the probe's ACK
+# rather than by a retransmission timeout. Segments are identified by their
+# seq id, time is time.monotonic() seconds. Send times are read from the
+# sender's scoreboard, RACK only keeps the transmission order.
+
+import operator
+from collections import OrderedDict
+
+from delivery_rate import MinMaxFilter, MIN_RTT_FILTER_WINDOW
+
+SRTT_GAIN = 1 / 8
+TLP_MIN_TIMEOUT = 0.01  # seconds, floor of the probe timeout
+REO_WND_PERSIST = 16  # recoveries a widened reordering window is kept for
+MAX_DUP_THRESH = 3  # from this many SACKed segments the window is zero until reordering is seen (RFC 8985 6.2)
+
+class RackTlp:
+    """Time-based loss detection and tail loss probes for one transfer."""
+
+    def __init__(self, scoreboard) -> None:
+        self.scoreboard = scoreboard
+        # outstanding seq id -> whether its last transmission was a retransmission, in transmission order
+        self.sent = OrderedDict()
+        # send time and seq id of the most recently sent segment known delivered
+        self.xmit_time = None
+        self.end_seq = -1
+        self.rtt = None
+        self.fack = -1  # highest seq id delivered
+        self.srtt = None
+        self.min_rtt = MinMaxFilter(MIN_RTT_FILTER_WINDOW, operator.le)
+
+        self.reordering_seen = False
+        self.reo_wnd_mult = 1
+        self.reo_wnd_persist = 0
+        self.widened_at = None
+        self.reo_deadline = None  # when the next outstanding segment times out, if one is waiting
+        self.probe_seq = None  # seq id of the outstanding tail loss probe
+
+        # exported as live metrics
+        self.lost = 0
+        self.probes = 0
+        self.spurious = 0
+
+    def on_send(self, seq_id, retransmit=False):
+        """Record a transmission, after the scoreboard has its send time."""
+        self.sent[seq_id] = retransmit
+        self.sent.move_to_end(seq_id)
+
+    def on_rtt_sample(self, rtt, now):
+        if self.srtt is None:
+            self.srtt = rtt
+        else:
+            self.srtt += SRTT_GAIN * (rtt - self.srtt)
+        self.min_rtt.update(now, rtt)
+
+    def on_delivered(self, seq_ids, now, echo_time=None):
+        """Account segments newly ACKed or SACKed, in ascending order.
+
+        echo_time is when the segment that triggered this ACK was sent, from
+        the echoed timestamp. A delivered retransmission whose ACK answers an
+        earlier send was not needed: the original arrived late. Returns True
+        when a retransmitted tail loss probe was delivered and was needed,
+        a loss the caller still has to respond to.
+        """
+        spurious = repaired = False
+        min_rtt = self.min_rtt.get()
+        sent_time_of = self.scoreboard.sent_time
+        for seq_id in seq_ids:
+            retransmitted = self.sent.pop(seq_id, None)
+            if retransmitted is None:
+                continue
+            sent_time = sent_time_of(seq_id)
+            late = echo_time is not None and echo_time < sent_time
+            if seq_id == self.probe_seq:
+                self.probe_seq = None
+                repaired = retransmitted and not late
+            if retransmitted:
+                spurious = spurious or late
+                # ambiguous: the ACK may be for the original transmission
+                if late or (min_rtt is not None and now - sent_time < min_rtt):
+                    continue
+            elif seq_id < self.fack:
+                self.reordering_seen = True
+            self.fack = max(self.fack, seq_id)
+            if self.xmit_time is None or (sent_time, seq_id) > (self.xmit_time, self.end_seq):
+                self.xmit_time = sent_time
+                self.end_seq = seq_id
+                self.rtt = now - sent_time
+        if spurious:
+            self.on_spurious_retransmit(now)
+        return repaired
+
+    def on_spurious_retransmit(self, now):
+        """Widen the reordering window after a retransmission that was not needed, once per round trip."""
+        self.spurious += 1
+        self.reordering_seen = True
+        if self.widened_at is not None and now - self.widened_at < self.srtt:
+            return
+        self.widened_at = now
+        if self.reo_wnd_mult * self.min_rtt.get() / 4 < self.srtt:
+            self.reo_wnd_mult += 1
+        self.reo_wnd_persist = REO_WND_PERSIST
+
+    def on_recovery(self):
+        """A new loss recovery starts, a widened window decays back after REO_WND_PERSIST of them."""
+        if self.reo_wnd_persist:
+            self.reo_wnd_persist -= 1
+            if not self.reo_wnd_persist:
+                self.reo_wnd_mult = 1
+
+    def reo_wnd(self, in_recovery, sacked_count):
+        min_rtt = self.min_rtt.get()
+        if min_rtt is None:
+            return 0
+        if not self.reordering_seen and (in_recovery or sacked_count >= MAX_DUP_THRESH):
+            return 0
+        return min(self.reo_wnd_mult * min_rtt / 4, self.srtt)
+
+    def detect_losses(self, now, reo_wnd):
+        """Seq ids to resend now, oldest transmission first, and arm the reordering timer.
+
+        Lost segments leave the outstanding list until on_send() records their
+        retransmission.
+        """
+        self.reo_deadline = None
+        if self.xmit_time is None:
+            return []
+        lost = []
+        timeout = 0
+        sent_time_of = self.scoreboard.sent_time
+        for seq_id in self.sent:
+            sent_time = sent_time_of(seq_id)
+            # only segments sent before the most recent delivered one can be lost
+            if (sent_time, seq_id) >= (self.xmit_time, self.end_seq):
+                break
+            remaining = sent_time + self.rtt + reo_wnd - now
+            if remaining <= 0:
+                lost.append(seq_id)
+            else:
+                timeout = max(timeout, remaining)
+        for seq_id in lost:
+            del self.sent[seq_id]
+        if timeout:
+            self.reo_deadline = now + timeout
+        self.lost += len(lost)
+        return lost
+
+    def probe_timeout(self, rto):
+        """Seconds of silence after which a tail loss probe is sent, never later than the RTO."""
+        if self.srtt is None:
+            return rto
+        return min(max(2 * self.srtt, TLP_MIN_TIMEOUT), rto)
+
+    def on_probe(self, seq_id):
+        self.probe_seq = seq_id
+        self.probes += 1
+
+# ======================================================================
+#                  END of rack.py
+# ======================================================================
@@ -1,65 +1,548 @@
+import io
 import random
+import select
 import socket
+import struct
+import sys
+import time
+from collections import namedtuple
+
+from sockbuf import SocketBufferSizer, enable_drop_counter, parse_drop_counter, DROP_COUNTER_SIZE
+from offload import enable_gro, parse_gro_size, GRO_BUFFER_SIZE, GRO_CMSG_SIZE, GSO_MAX_SEGMENTS
+from exporter import MetricsExporter
+from session import ReceiveSink
 
 PACKET_SIZE = 1024
 SEQ_ID_SIZE = 4
 MESSAGE_SIZE = PACKET_SIZE - SEQ_ID_SIZE
-EXPECTED_SEQ_ID = 0
-RECEIVED_DATA = {}
+FINACK_MESSAGE = b'==FINACK=='
+FINACK_SIZE = len(FINACK_MESSAGE)
+# python receiver.py [port], e.g. behind netem.py
+RECEIVER_PORT = 5001
+
+# number of preallocated receive buffers, i.e. the most datagrams drained per wakeup
+RECV_RING_SIZE = 64
+# after a wakeup that found the queue empty, skip this many polls for more: a receiver that
+# keeps up reads one datagram per wakeup, and a failed non-blocking read costs about a datagram's worth
+POLL_INTERVAL = 8
+# read coalesced datagrams with UDP GRO where the kernel supports it (see offload.py),
+# into this many 64 KB buffers. Off like the senders' GSO (utils.SEGMENTATION_OFFLOAD):
+# without GSO every read is one datagram, and recvmsg_into costs more than recvfrom_into
+RECEIVE_OFFLOAD = False
+GRO_RING_SIZE = 16
+# send one cumulative ACK per drained batch of in-order datagrams instead of one per datagram;
+# off, since senders that grow cwnd per ACK would grow more slowly
+COALESCE_ACKS = False
+# the stats and the buffer sizer are brought up to date once this many bytes have arrived, and at the end
+STATS_UPDATE_BYTES = 64 * 1024
+# RTT assumed for buffer sizing, the receiver has no RTT samples of its own
+RTT_HINT = 0.25
+# out-of-order data held for reassembly is bounded by this many bytes above the
+# cumulative ACK, the free part is advertised to v2 senders as their receive window
+REASSEMBLY_BUFFER_SIZE = 2 * 1024 * 1024
+# in-order data is written through as it arrives, in chunks of this size
+SINK_BUFFERING = 1024 * 1024
+# a single file transfer is written to OUTPUT_PATH, a multi-file session unpacked into SESSION_DIR
+OUTPUT_PATH = '/hdd/file2.mp3'
+SESSION_DIR = '/hdd/session'
+
+# ACKs carry up to this many SACK blocks (start, end) after the 'ack' message. The ACK for a
+# duplicate datagram reports it first, as a D-SACK block (RFC 2883): below the cumulative ACK,
+# or inside the SACK block that follows it.
+MAX_SACK_BLOCKS = 3
+
+SEQ_ID_STRUCT = struct.Struct('!i')
+ACK_STRUCT = struct.Struct('!i3s')
+SACK_BLOCK_STRUCT = struct.Struct('!ii')
+
+# header v2 (see utils.py): marker/version, flags, window, seq id, TSval, TSecr.
+# ACKs answer in the format of the packet they acknowledge, so legacy senders keep working.
+HEADER_V2_MARK = 0x82
+HEADER_V2_STRUCT = struct.Struct('!BBHiII')
+TIMESTAMPS_STRUCT = struct.Struct('!II')
+TIMESTAMPS_OFFSET = 8
+SEQ_ID_OFFSET = 4
+FLAG_ACK = 0x01
+FLAG_WINDOW = 0x04  # the window field holds the receive window, in MESSAGE_SIZE segments
+FLAG_SESSION = 0x08  # a session id follows the header
+FLAG_SYN = 0x10  # handshake, see receiver_daemon.py
+MAX_WINDOW = 0xFFFF
+TIMESTAMP_MASK = 0xFFFFFFFF
+SESSION_ID_STRUCT = struct.Struct('!I')
+MAX_PACKET_SIZE = HEADER_V2_STRUCT.size + SESSION_ID_STRUCT.size + MESSAGE_SIZE
+
+# SYN payload: nonce, segment size, options, file size, then the utf-8 name.
+# SYN-ACK payload: the nonce, accepted segment size and options.
+SYN_STRUCT = struct.Struct('!IHHQ')
+SYN_ACK_STRUCT = struct.Struct('!IHH')
+OPTION_SACK = 0x01
+OPTION_WINDOW = 0x02
+SUPPORTED_OPTIONS = OPTION_SACK | OPTION_WINDOW
+
+Handshake = namedtuple('Handshake', ['nonce', 'message_size', 'options', 'file_size', 'name'])
 
 def create_acknowledgement(seq_id, message):
     return int.to_bytes(seq_id, SEQ_ID_SIZE, signed=True, byteorder='big') + message.encode()
 
-# create a udp socket
-with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
-    # bind the socket to a OS port
-    # bind to 0.0.0.0 so external 
-    udp_socket.bind(("0.0.0.0", 5001))
+def parse_syn(view, nbytes):
+    """The Handshake a SYN datagram asks for, None if it is malformed."""
+    offset = HEADER_V2_STRUCT.size
+    if nbytes < offset + SYN_STRUCT.size:
+        return None
+    nonce, message_size, options, file_size = SYN_STRUCT.unpack_from(view, offset)
+    name = bytes(view[offset + SYN_STRUCT.size:nbytes]).decode(errors='replace')
+    return Handshake(nonce, message_size, options, file_size, name)
+
+def create_syn_ack(handshake, window, tsecr, session_id=None):
+    """Accept a handshake, with session_id None the sender continues without a session."""
+    flags = FLAG_SYN | FLAG_ACK | FLAG_WINDOW
+    session_field = b''
+    if session_id is not None:
+        flags |= FLAG_SESSION
+        session_field = SESSION_ID_STRUCT.pack(session_id)
+    tsval = (time.monotonic_ns() // 1000) & TIMESTAMP_MASK
+    return (HEADER_V2_STRUCT.pack(HEADER_V2_MARK, flags, window, 0, tsval, tsecr) + session_field +
+            SYN_ACK_STRUCT.pack(handshake.nonce, min(handshake.message_size, MESSAGE_SIZE),
+                                handshake.options & SUPPORTED_OPTIONS))
+
+class AckWriter:
+    """Serializes ACKs into one reused buffer instead of building new bytes per ACK.
+
+    With v2 set the ACK carries the v2 header with the current receive window,
+    and send() stamps the TSval being answered into the packed ACK right
+    before it goes out. A session_id is carried after the v2 header.
+    """
+
+    def __init__(self, session_id=None):
+        self.buffer = bytearray(HEADER_V2_STRUCT.size + SESSION_ID_STRUCT.size + ACK_STRUCT.size +
+                                MAX_SACK_BLOCKS * SACK_BLOCK_STRUCT.size)
+        self.view = memoryview(self.buffer)
+        self.v2 = False
+        self.window = MAX_WINDOW
+        self.session_id = session_id
+        self.packed = self.view[:0]
+
+    def pack(self, seq_id, message, sack_blocks=()):
+        if self.v2:
+            offset = HEADER_V2_STRUCT.size
+            if self.session_id is None:
+                HEADER_V2_STRUCT.pack_into(self.buffer, 0, HEADER_V2_MARK, FLAG_ACK | FLAG_WINDOW, self.window, seq_id, 0, 0)
+            else:
+                HEADER_V2_STRUCT.pack_into(self.buffer, 0, HEADER_V2_MARK, FLAG_ACK | FLAG_WINDOW | FLAG_SESSION,
+                                           self.window, seq_id, 0, 0)
+                SESSION_ID_STRUCT.pack_into(self.buffer, offset, self.session_id)
+                offset += SESSION_ID_STRUCT.size
+            self.buffer[offset:offset + len(message)] = message
+            offset += len(message)
+        else:
+            ACK_STRUCT.pack_into(self.buffer, 0, seq_id, message)
+            offset = ACK_STRUCT.size
+        for start, end in sack_blocks:
+            SACK_BLOCK_STRUCT.pack_into(self.buffer, offset, start, end)
+            offset += SACK_BLOCK_STRUCT.size
+        self.packed = self.view[:offset]
+        return self.packed
+
+    def set_ack_id(self, seq_id):
+        """Rewrite only the ack id of the last packed ACK, when its window and SACK blocks still hold."""
+        SEQ_ID_STRUCT.pack_into(self.buffer, SEQ_ID_OFFSET if self.v2 else 0, seq_id)
+
+    def send(self, sendto, client, tsecr, ack_id=None):
+        """Send the last packed ACK with sendto, a v2 ACK echoing tsecr. ack_id rewrites its ack id first."""
+        if self.v2:
+            if ack_id is not None:
+                SEQ_ID_STRUCT.pack_into(self.buffer, SEQ_ID_OFFSET, ack_id)
+            tsval = (time.monotonic_ns() // 1000) & TIMESTAMP_MASK
+            TIMESTAMPS_STRUCT.pack_into(self.buffer, TIMESTAMPS_OFFSET, tsval, tsecr)
+        elif ack_id is not None:
+            SEQ_ID_STRUCT.pack_into(self.buffer, 0, ack_id)
+        sendto(self.packed, client)
+
+class SackTracker:
+    """Out-of-order data above the cumulative ACK, and the byte ranges it covers.
+
+    Ranges are merged with their neighbours on arrival through start->end and
+    end->start maps, so each datagram costs O(1). Like RFC 2018, the blocks
+    reported first are the ones that changed most recently.
+    """
+
+    def __init__(self):
+        self.block_end = {}
+        self.block_start = {}
+        self.recent = []
+        # out-of-order payloads keyed by seq id, and their total size
+        self.segments = {}
+        self.buffered_bytes = 0
+
+    def hold(self, seq_id, payload):
+        """Keep a copy of the out-of-order payload until the cumulative ACK reaches it."""
+        self.segments[seq_id] = payload.tobytes()
+        self.buffered_bytes += len(payload)
+        self.add(seq_id, seq_id + len(payload))
+
+    def release(self, expected_seq_id, write):
+        """Write the held payloads that are in order from expected_seq_id on, return the new cumulative ACK."""
+        segments = self.segments
+        while expected_seq_id in segments:
+            message = segments.pop(expected_seq_id)
+            self.buffered_bytes -= len(message)
+            write(message)
+            expected_seq_id += len(message)
+        self.consume(expected_seq_id)
+        return expected_seq_id
+
+    def remove(self, start):
+        end = self.block_end.pop(start)
+        del self.block_start[end]
+        if start in self.recent:
+            self.recent.remove(start)
+        return end
+
+    def add(self, start, end):
+        if end in self.block_end:
+            end = self.remove(end)
+        if start in self.block_start:
+            start = self.block_start[start]
+            self.remove(start)
+        self.block_end[start] = end
+        self.block_start[end] = start
+        self.recent.insert(0, start)
+        del self.recent[MAX_SACK_BLOCKS:]
+
+    def consume(self, expected_seq_id):
+        """Drop the block the cumulative ACK just walked through."""
+        if expected_seq_id in self.block_start:
+            self.remove(self.block_start[expected_seq_id])
+
+    def blocks(self):
+        return [(start, self.block_end[start]) for start in self.recent]
+
+    def dsack_blocks(self, start, end):
+        """SACK blocks for the ACK of the duplicate [start, end): the D-SACK block, then the block holding it, if any."""
+        blocks = [(start, end)]
+        for block_start, block_end in self.block_end.items():
+            if block_start <= start and end <= block_end:
+                blocks.append((block_start, block_end))
+                break
+        blocks += [block for block in self.blocks() if block not in blocks]
+        return blocks[:MAX_SACK_BLOCKS]
+
+class ReceiverStats:
+    """Progress counters, updated once per drained batch and read by the metrics exporter."""
+
+    def __init__(self):
+        self.datagrams = 0
+        self.bytes_received = 0
+        self.duplicates = 0
+        self.expected_seq_id = 0
+        self.highest_seq_id = 0
+        self.sack_blocks = 0
+        self.kernel_drops = 0
+        self.reassembly_bytes = 0
+        self.out_of_window = 0
+
+    def live_metrics(self):
+        return {
+            'datagrams_total': self.datagrams,
+            'bytes_received_total': self.bytes_received,
+            'bytes_delivered_total': self.expected_seq_id,
+            'duplicates_total': self.duplicates,
+            # bytes held above the cumulative ACK, waiting for a hole to fill
+            'reorder_depth_bytes': max(self.highest_seq_id - self.expected_seq_id, 0),
+            'sack_blocks': self.sack_blocks,
+            'reassembly_buffer_bytes': self.reassembly_bytes,
+            'out_of_window_total': self.out_of_window,
+            'kernel_drops_total': self.kernel_drops,
+        }
+
+class RecvRing:
+    """Preallocated datagram buffers filled with recvfrom_into.
+
+    receive() blocks for the first datagram and then, if poll() says more are
+    queued, drains them without blocking, so a burst costs no allocations
+    beyond the payload copy kept for reassembly. A socket with a timeout is
+    read one datagram at a time, since MSG_DONTWAIT would still wait out the
+    timeout.
+
+    With track_drops, the first datagram after a batch that filled the ring
+    is read with recvmsg to pick up the kernel's cumulative receive queue drop
+    counter. The kernel only drops when the queue is full, which holds more
+    datagrams than the ring, so the batch that follows any drop fills it.
+    """
+
+    def __init__(self, size=RECV_RING_SIZE, track_drops=False):
+        self.views = [memoryview(bytearray(MAX_PACKET_SIZE)) for _ in range(size)]
+        self.lengths = [0] * size
+        self.clients = [None] * size
+        self.track_drops = track_drops
+        self.kernel_drops = 0
+        self.full = True
+        self.socket = self.poll = None
+        self.skip_polls = 0
+
+    def receive(self, udp_socket):
+        views = self.views
+        if self.track_drops and self.full:
+            self.full = False
+            nbytes, ancdata, _flags, client = udp_socket.recvmsg_into([views[0]], DROP_COUNTER_SIZE)
+            drops = parse_drop_counter(ancdata)
+            if drops is not None:
+                self.kernel_drops = drops
+        else:
+            nbytes, client = udp_socket.recvfrom_into(views[0], MAX_PACKET_SIZE)
+        self.lengths[0] = nbytes
+        self.clients[0] = client
+        if self.skip_polls:
+            self.skip_polls -= 1
+            return 1
+        if udp_socket is not self.socket:
+            self.socket = udp_socket
+            poller = select.poll()
+            poller.register(udp_socket, select.POLLIN)
+            self.poll = poller.poll
+        if len(views) == 1 or udp_socket.gettimeout() is not None:
+            return 1
+        if not self.poll(0):
+            self.skip_polls = POLL_INTERVAL - 1
+            return 1
+        lengths, clients = self.lengths, self.clients
+        recvfrom_into = udp_socket.recvfrom_into
+        count = 1
+        try:
+            for count in range(1, len(views)):
+                lengths[count], clients[count] = recvfrom_into(views[count], MAX_PACKET_SIZE, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return count
+        self.full = True
+        return len(views)
+
+class GroRing(RecvRing):
+    """RecvRing for a socket with UDP_GRO enabled.
+
+    Each read may return a run of datagrams of one client coalesced, which is
+    split back into views of the datagrams, so serve() sees the same ring.
+    """
+
+    def __init__(self, size=GRO_RING_SIZE, track_drops=False):
+        self.buffers = [memoryview(bytearray(GRO_BUFFER_SIZE)) for _ in range(size)]
+        self.views = [None] * (size * GSO_MAX_SEGMENTS)
+        self.lengths = [0] * len(self.views)
+        self.clients = [None] * len(self.views)
+        self.track_drops = track_drops
+        self.ancillary_size = GRO_CMSG_SIZE + (DROP_COUNTER_SIZE if track_drops else 0)
+        self.kernel_drops = 0
+
+    def receive(self, udp_socket):
+        count = 0
+        flags = 0
+        views, lengths, clients = self.views, self.lengths, self.clients
+        limit = len(self.buffers) if udp_socket.gettimeout() is None else 1
+        for buffer in self.buffers[:limit]:
+            try:
+                nbytes, ancdata, _flags, client = udp_socket.recvmsg_into([buffer], self.ancillary_size, flags)
+            except BlockingIOError:
+                break
+            if self.track_drops and not flags:
+                # the counter is cumulative, once per batch is enough
+                drops = parse_drop_counter(ancdata)
+                if drops is not None:
+                    self.kernel_drops = drops
+            flags = socket.MSG_DONTWAIT
+            segment = parse_gro_size(ancdata)
+            if (segment is None or segment >= nbytes) and count < len(views):
+                # not coalesced, the usual case unless the sender uses GSO
+                views[count] = buffer[:nbytes]
+                lengths[count] = nbytes
+                clients[count] = client
+                count += 1
+                continue
+            segment = segment or 1
+            for offset in range(0, nbytes or 1, segment):
+                if count == len(views):
+                    # tiny segments, grow in place so callers' references stay valid
+                    views.append(None)
+                    lengths.append(0)
+                    clients.append(None)
+                end = min(offset + segment, nbytes)
+                views[count] = buffer[offset:end]
+                lengths[count] = end - offset
+                clients[count] = client
+                count += 1
+        return count
+
+def open_ring(udp_socket, offload=RECEIVE_OFFLOAD):
+    """The receive ring for udp_socket, a GroRing if GRO can be enabled on it."""
+    track_drops = enable_drop_counter(udp_socket)
+    if offload and enable_gro(udp_socket):
+        return GroRing(track_drops=track_drops)
+    return RecvRing(track_drops=track_drops)
+
+def serve(udp_socket, ring=None, coalesce_acks=COALESCE_ACKS, stats=None, sink=None,
+          buffer_size=REASSEMBLY_BUFFER_SIZE):
+    """Receive one transfer until FINACK, writing the data in order to sink, and return the stats.
+
+    Only out-of-order data is held, at most buffer_size bytes above the
+    cumulative ACK; datagrams reaching past that are dropped and the free
+    space is advertised in every v2 ACK. sink defaults to an in-memory buffer.
+    Datagrams may use the legacy or the v2 header, v2 ACKs echo the TSval of
+    the datagram that triggered them (the first of a coalesced batch).
+    With coalesce_acks, in-order datagrams drained in the same batch share one
+    cumulative ACK, duplicate ACKs for out-of-order data are still sent one per
+    datagram so dup-ACK loss detection keeps working.
+    """
+    ring = ring or open_ring(udp_socket)
+    stats = stats or ReceiverStats()
+    sink = sink or io.BytesIO()
+    sizer = SocketBufferSizer(udp_socket, rtt_hint=RTT_HINT, options=(socket.SO_RCVBUF,))
+    acks = AckWriter()
+    sack = SackTracker()
+    expected_seq_id = 0
+
+    # hoist attribute lookups out of the per-datagram loop
+    views, lengths, clients = ring.views, ring.lengths, ring.clients
+    unpack_seq_id = SEQ_ID_STRUCT.unpack_from
+    unpack_header = HEADER_V2_STRUCT.unpack_from
+    sendto = udp_socket.sendto
+    write = sink.write
+    send_ack = acks.send
+    held = sack.segments
+    acks.window = min(buffer_size // MESSAGE_SIZE, MAX_WINDOW)
+    acks.pack(expected_seq_id, b'ack')
+    tsval = pending_tsval = 0
+    acks_v2 = acks.v2
+    datagrams = received_bytes = published_bytes = 0
 
-    print("Receiver running")
-    # start receiving packets
     while True:
-        timeouts = 0
         try:
-            # receive the packet
-            packet, client = udp_socket.recvfrom(PACKET_SIZE)
-            
-            # get the message id
-            seq_id, message = packet[:SEQ_ID_SIZE], packet[SEQ_ID_SIZE:]
-            
+            count = ring.receive(udp_socket)
+        except socket.timeout:
+            continue
+
+        pending_client = None
+        datagrams += count
+        for i in range(count):
+            view = views[i]
+            nbytes = lengths[i]
+            received_bytes += nbytes
+
+            # get the message id, answering in the sender's header format
+            v2 = view[0] == HEADER_V2_MARK
+            if v2 is not acks_v2:
+                acks.v2 = acks_v2 = v2
+                acks.pack(expected_seq_id, b'ack', sack.recent and sack.blocks())
+            if v2:
+                _mark, flags, _window, seq_id, tsval, _tsecr = unpack_header(view)
+                header_size = HEADER_V2_STRUCT.size
+                if flags:
+                    if flags & FLAG_SYN:
+                        # one transfer, no sessions: the SYN-ACK carries no session id
+                        handshake = parse_syn(view, nbytes)
+                        if handshake is not None:
+                            sendto(create_syn_ack(handshake, acks.window, tsval), clients[i])
+                        continue
+                    if flags & FLAG_SESSION:
+                        header_size += SESSION_ID_STRUCT.size
+            else:
+                seq_id = unpack_seq_id(view)[0]
+                header_size = SEQ_ID_SIZE
+            message_size = nbytes - header_size
+
             # check if finack message
-            if message == b'==FINACK==':
-                break
-            
-            # if the message id is -1, we have received all the packets
-            seq_id = int.from_bytes(seq_id, signed=True, byteorder='big')
-            
-            # keep track of received sequences
-            RECEIVED_DATA[seq_id] = message
-            
-            # check if sequence id is same as expected and move forward
-            if seq_id <= EXPECTED_SEQ_ID and len(RECEIVED_DATA[seq_id]) > 0:
-                while EXPECTED_SEQ_ID in RECEIVED_DATA:
-                    EXPECTED_SEQ_ID += len(RECEIVED_DATA[seq_id])
-            
-            # create ack id
-            ack_id = EXPECTED_SEQ_ID
-            
-            # create the acknowledgement
-            acknowledgement = create_acknowledgement(ack_id, 'ack')
-
-            # send the acknowledgement
-            udp_socket.sendto(acknowledgement, client)
-            
+            if message_size == FINACK_SIZE and view[header_size:nbytes] == FINACK_MESSAGE:
+                stats.datagrams = datagrams
+                stats.bytes_received = received_bytes
+                stats.expected_seq_id = expected_seq_id
+                stats.kernel_drops = ring.kernel_drops
+                return stats
+
+            if seq_id == expected_seq_id and message_size > 0:
+                # in order: write through, then whatever it unblocked
+                write(view[header_size:nbytes])
+                expected_seq_id += message_size
+                if expected_seq_id in held:
+                    expected_seq_id = sack.release(expected_seq_id, write)
+                    stats.reassembly_bytes = sack.buffered_bytes
+                    stats.sack_blocks = len(sack.block_end)
+                    acks.window = min((buffer_size - sack.buffered_bytes) // MESSAGE_SIZE, MAX_WINDOW)
+                    acks.pack(expected_seq_id, b'ack', sack.recent and sack.blocks())
+                    ack_id = None
+                else:
+                    # only the ack id moves, it is rewritten in place
+                    ack_id = expected_seq_id
+                if coalesce_acks:
+                    if ack_id is not None:
+                        acks.set_ack_id(ack_id)
+                    if pending_client is None:
+                        pending_tsval = tsval
+                    pending_client = clients[i]
+                    continue
+                send_ack(sendto, clients[i], tsval, ack_id)
+                continue
+
+            client = clients[i]
+            dsack = False
+            if seq_id < expected_seq_id or seq_id in held:
+                # duplicates are not copied again, but reported so the sender can undo a spurious retransmission
+                stats.duplicates += 1
+                dsack = message_size > 0
+            elif seq_id + message_size > expected_seq_id + buffer_size:
+                # past the window, the sender resends it once the window opens
+                stats.out_of_window += 1
+            elif seq_id > expected_seq_id:
+                sack.hold(seq_id, view[header_size:nbytes])
+                acks.window = min((buffer_size - sack.buffered_bytes) // MESSAGE_SIZE, MAX_WINDOW)
+                acks.pack(expected_seq_id, b'ack', sack.blocks())
+                stats.highest_seq_id = max(stats.highest_seq_id, seq_id + message_size)
+                stats.reassembly_bytes = sack.buffered_bytes
+                stats.sack_blocks = len(sack.block_end)
+
+            if pending_client is not None:
+                send_ack(sendto, pending_client, pending_tsval)
+                pending_client = None
+
+            # send the acknowledgement, the buffer already holds the current ack id
+            ack_id = expected_seq_id
+            if dsack:
+                acks.pack(expected_seq_id, b'ack', sack.dsack_blocks(seq_id, seq_id + message_size))
+            send_ack(sendto, client, tsval)
+            if dsack:
+                acks.pack(expected_seq_id, b'ack', sack.recent and sack.blocks())
+
             # check if all data received (empty message)
-            if len(message) == 0 and ack_id == seq_id:
-                ack = create_acknowledgement(ack_id, 'ack')
-                fin = create_acknowledgement(ack_id + 3, 'fin')
-                udp_socket.sendto(ack, client)
-                udp_socket.sendto(fin, client)
-        except socket.timeout:
-            timeouts += 1
+            if message_size == 0 and ack_id == seq_id:
+                for final_ack in ((ack_id, b'ack'), (ack_id + 3, b'fin')):
+                    acks.pack(*final_ack)
+                    send_ack(sendto, client, tsval)
+                acks.pack(expected_seq_id, b'ack', sack.recent and sack.blocks())
+
+        if pending_client is not None:
+            send_ack(sendto, pending_client, pending_tsval)
+
+        if received_bytes - published_bytes >= STATS_UPDATE_BYTES:
+            sizer.on_delivered(received_bytes - published_bytes)
+            published_bytes = received_bytes
+            stats.datagrams = datagrams
+            stats.bytes_received = received_bytes
+            stats.expected_seq_id = expected_seq_id
+            stats.kernel_drops = ring.kernel_drops
+
+def main():
+    # create a udp socket
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+        # bind the socket to a OS port
+        # bind to 0.0.0.0 so external
+        udp_socket.bind(("0.0.0.0", int(sys.argv[1]) if len(sys.argv) > 1 else RECEIVER_PORT))
+
+        print("Receiver running")
+        # start receiving packets
+        ring = open_ring(udp_socket)
+        stats = ReceiverStats()
+        with ReceiveSink(OUTPUT_PATH, SESSION_DIR, SINK_BUFFERING) as sink, \
+                MetricsExporter('receiver', stats.live_metrics):
+            serve(udp_socket, ring, stats=stats, sink=sink)
+        print(f"Kernel receive drops: {ring.kernel_drops}")
+        if sink.is_session:
+            print(f"Session files received: {sink.output.file_count} in {SESSION_DIR}")
 
-with open('/hdd/file2.mp3', 'wb') as f:
-    for sid in sorted(RECEIVED_DATA.keys()):
-        f.write(RECEIVED_DATA[sid])
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+# ======================================================================
+#                   receiver_daemon.py
+# ======================================================================
+#
+# Long-running receiver: one socket serves any number of transfers, back to
+# back or side by side, so benchmark runs no longer restart the receiver.
+# A sender opens a session with a one round trip handshake:
+#
+#     SYN      v2 header, FLAG_SYN; nonce, segment size, options, file size, name
+#     SYN-ACK  v2 header, FLAG_SYN | FLAG_ACK | FLAG_SESSION, session id;
+#              nonce, accepted segment size, accepted options
+#
+# and every later datagram carries the session id after the v2 header, which
+# routes it to its session. A resent SYN gets the same session back. Transfers
+# without a session (legacy headers, or senders that skip the handshake) are
+# keyed by the sender's address and end with the FINACK, as in receiver.py.
+#
+# Each transfer is written to OUTPUT_DIR/<name>.part-<id> and renamed to
+# OUTPUT_DIR/<name> once all of its announced size arrived, so the output
+# directory never holds a partial file under its final name.
+
+import os
+import time
+import random
+import select
+import shutil
+import sys
+import socket
+import logging
+
+from exporter import MetricsExporter
+from receiver import (AckWriter, SackTracker, ReceiverStats, open_ring, parse_syn, create_syn_ack,
+                      FINACK_MESSAGE, MESSAGE_SIZE, SEQ_ID_SIZE, SEQ_ID_STRUCT, HEADER_V2_MARK, HEADER_V2_STRUCT,
+                      SESSION_ID_STRUCT, FLAG_SYN, FLAG_SESSION, MAX_WINDOW, REASSEMBLY_BUFFER_SIZE,
+                      SINK_BUFFERING, RTT_HINT, RECEIVER_PORT)
+from session import ReceiveSink
+from sockbuf import SocketBufferSizer
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = '/hdd/received'
+# a session that sent nothing for this long is dropped, incomplete output included
+SESSION_IDLE_TIMEOUT = 30.0
+# longest wait for a datagram before idle sessions are checked
+HOUSEKEEPING_INTERVAL = 1.0
+
+def output_name(name, fallback):
+    """The announced name reduced to a plain file name, names come from the network."""
+    name = os.path.basename(name.replace('\\', '/'))
+    return name if name not in ('', '.', '..') else fallback
+
+class ReceiveSession:
+    """Reassembly state of one transfer, the per-session counterpart of serve()'s locals."""
+
+    def __init__(self, key, session_id, name, file_size, output_dir, handshake=None,
+                 buffer_size=REASSEMBLY_BUFFER_SIZE) -> None:
+        self.key = key
+        self.session_id = session_id
+        self.file_size = file_size
+        self.handshake = handshake
+        self.buffer_size = buffer_size
+        self.label = str(session_id) if session_id is not None else f"{key[0]}:{key[1]}"
+
+        self.output_path = os.path.join(output_dir, name)
+        self.partial_path = f"{self.output_path}.part-{self.label.replace(':', '-')}"
+        self.sink = ReceiveSink(self.partial_path, self.partial_path, SINK_BUFFERING)
+        self.complete = False
+
+        self.stats = ReceiverStats()
+        self.acks = AckWriter(session_id)
+        self.acks.window = min(buffer_size // MESSAGE_SIZE, MAX_WINDOW)
+        self.sack = SackTracker()
+        self.expected_seq_id = 0
+        self.started = self.last_active = time.monotonic()
+
+    def receive(self, view, header_size, nbytes, seq_id, v2):
+        """Take one data datagram and pack the ACK to answer it with."""
+        stats = self.stats
+        message_size = nbytes - header_size
+        stats.datagrams += 1
+        stats.bytes_received += nbytes
+
+        dsack = False
+        if self.complete or seq_id < self.expected_seq_id or seq_id in self.sack.segments:
+            stats.duplicates += 1
+            dsack = message_size > 0
+        elif seq_id + message_size > self.expected_seq_id + self.buffer_size:
+            stats.out_of_window += 1
+        elif seq_id == self.expected_seq_id and message_size > 0:
+            self.sink.write(view[header_size:nbytes])
+            self.expected_seq_id = self.sack.release(self.expected_seq_id + message_size, self.sink.write)
+            if self.file_size is not None and self.expected_seq_id >= self.file_size:
+                self.finish()
+        elif seq_id > self.expected_seq_id:
+            self.sack.hold(seq_id, view[header_size:nbytes])
+            stats.highest_seq_id = max(stats.highest_seq_id, seq_id + message_size)
+
+        stats.expected_seq_id = self.expected_seq_id
+        stats.reassembly_bytes = self.sack.buffered_bytes
+        stats.sack_blocks = len(self.sack.block_end)
+        self.acks.v2 = v2
+        self.acks.window = min((self.buffer_size - self.sack.buffered_bytes) // MESSAGE_SIZE, MAX_WINDOW)
+        if dsack:
+            self.acks.pack(self.expected_seq_id, b'ack', self.sack.dsack_blocks(seq_id, seq_id + message_size))
+        else:
+            self.acks.pack(self.expected_seq_id, b'ack', self.sack.recent and self.sack.blocks())
+
+    def finish(self):
+        """All data arrived: move the output to its final name."""
+        self.complete = True
+        self.sink.close()
+        # the newest transfer of a name replaces the previous one, as receiver.py overwrites its output
+        if os.path.isdir(self.output_path) and not os.path.islink(self.output_path):
+            shutil.rmtree(self.output_path)
+        elif os.path.lexists(self.output_path):
+            os.remove(self.output_path)
+        os.replace(self.partial_path, self.output_path)
+
+        elapsed = time.monotonic() - self.started
+        files = f", {self.sink.output.file_count} files" if self.sink.is_session else ''
+        print(f"Session {self.label}: {self.expected_seq_id} bytes{files} in {elapsed:.3f} s -> {self.output_path}")
+
+    def abandon(self):
+        """Drop an incomplete transfer and its partial output."""
+        self.sink.close()
+        if os.path.isdir(self.partial_path):
+            shutil.rmtree(self.partial_path)
+        elif os.path.lexists(self.partial_path):
+            os.remove(self.partial_path)
+
+class ReceiverDaemon:
+    """Serves transfers on one socket until stopped, routing datagrams by session id."""
+
+    def __init__(self, udp_socket, output_dir=OUTPUT_DIR, buffer_size=REASSEMBLY_BUFFER_SIZE,
+                 idle_timeout=SESSION_IDLE_TIMEOUT) -> None:
+        self.socket = udp_socket
+        self.output_dir = output_dir
+        self.buffer_size = buffer_size
+        self.idle_timeout = idle_timeout
+        os.makedirs(output_dir, exist_ok=True)
+
+        # session id, or the sender's address for sessionless transfers -> ReceiveSession
+        self.sessions = {}
+        # (sender address, SYN nonce) -> session id, so a resent SYN is answered the same way
+        self.handshakes = {}
+        self.completed = 0
+        self.expired = 0
+        self.unknown_session = 0
+
+        self.ring = open_ring(udp_socket)
+        self.sizer = SocketBufferSizer(udp_socket, rtt_hint=RTT_HINT, options=(socket.SO_RCVBUF,))
+        self.now = time.monotonic()
+
+    def new_session_id(self):
+        # random ids, so datagrams of a session from before a restart are not mistaken for a new one
+        while True:
+            session_id = random.getrandbits(32)
+            if session_id not in self.sessions:
+                return session_id
+
+    def on_syn(self, view, nbytes, client, tsval):
+        handshake = parse_syn(view, nbytes)
+        if handshake is None:
+            return
+        session_id = self.handshakes.get((client, handshake.nonce))
+        if session_id is None:
+            session_id = self.new_session_id()
+            name = output_name(handshake.name, f"transfer-{session_id}")
+            self.sessions[session_id] = ReceiveSession(session_id, session_id, name, handshake.file_size,
+                                                       self.output_dir, (client, handshake.nonce), self.buffer_size)
+            self.handshakes[(client, handshake.nonce)] = session_id
+            logger.info(f"Session {session_id} opened by {client[0]}:{client[1]} for {name!r}, "
+                        f"{handshake.file_size} bytes")
+            if not handshake.file_size:
+                self.sessions[session_id].finish()
+        session = self.sessions[session_id]
+        self.socket.sendto(create_syn_ack(handshake, session.acks.window, tsval, session_id), client)
+
+    def sessionless(self, client):
+        session = self.sessions.get(client)
+        if session is None:
+            session = self.sessions[client] = ReceiveSession(
+                client, None, output_name(f"{client[0]}_{client[1]}", 'transfer'), None,
+                self.output_dir, buffer_size=self.buffer_size)
+        return session
+
+    def close_session(self, session):
+        del self.sessions[session.key]
+        if session.handshake is not None:
+            self.handshakes.pop(session.handshake, None)
+
+    def dispatch(self, view, nbytes, client):
+        if view[0] == HEADER_V2_MARK:
+            _mark, flags, _window, seq_id, tsval, _tsecr = HEADER_V2_STRUCT.unpack_from(view)
+            header_size = HEADER_V2_STRUCT.size
+            if flags & FLAG_SYN:
+                self.on_syn(view, nbytes, client, tsval)
+                return
+            if flags & FLAG_SESSION:
+                session = self.sessions.get(SESSION_ID_STRUCT.unpack_from(view, header_size)[0])
+                header_size += SESSION_ID_STRUCT.size
+                if session is None:
+                    # closed or expired, the sender learns from the missing ACKs
+                    self.unknown_session += 1
+                    return
+            else:
+                session = self.sessionless(client)
+            v2 = True
+        else:
+            seq_id = SEQ_ID_STRUCT.unpack_from(view)[0]
+            header_size = SEQ_ID_SIZE
+            session = self.sessionless(client)
+            v2 = False
+            tsval = 0
+        session.last_active = self.now
+
+        if nbytes - header_size == len(FINACK_MESSAGE) and view[header_size:nbytes] == FINACK_MESSAGE:
+            if not session.complete:
+                if session.file_size is None:
+                    session.finish()
+                else:
+                    logger.warning(f"Session {session.label} closed at {session.expected_seq_id} "
+                                   f"of {session.file_size} bytes")
+                    session.abandon()
+            self.completed += session.complete
+            self.close_session(session)
+            return
+
+        try:
+            session.receive(view, header_size, nbytes, seq_id, v2)
+        except (OSError, ValueError) as e:
+            # one bad transfer, e.g. a session entry escaping its directory, must not stop the others
+            logger.error(f"Session {session.label} failed: {e}")
+            session.abandon()
+            self.close_session(session)
+            return
+        session.acks.send(self.socket.sendto, client, tsval)
+
+    def expire(self):
+        for session in list(self.sessions.values()):
+            if self.now - session.last_active > self.idle_timeout:
+                if session.complete:
+                    # the FINACK was lost, the data was not
+                    self.completed += 1
+                else:
+                    logger.warning(f"Session {session.label} idle for {self.idle_timeout:.0f} s, dropped at "
+                                   f"{session.expected_seq_id} bytes")
+                    session.abandon()
+                    self.expired += 1
+                self.close_session(session)
+
+    def serve_forever(self):
+        views, lengths, clients = self.ring.views, self.ring.lengths, self.ring.clients
+        next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+        while True:
+            # the socket stays blocking so the ring drains whole bursts, select() bounds the wait
+            readable, _, _ = select.select([self.socket], [], [], HOUSEKEEPING_INTERVAL)
+            self.now = time.monotonic()
+            if readable:
+                count = self.ring.receive(self.socket)
+                for i in range(count):
+                    self.dispatch(views[i], lengths[i], clients[i])
+                self.sizer.on_delivered(sum(lengths[:count]))
+            if self.now >= next_housekeeping:
+                self.expire()
+                next_housekeeping = self.now + HOUSEKEEPING_INTERVAL
+
+    def live_metrics(self):
+        metrics = {
+            'sessions_active': len(self.sessions),
+            'sessions_completed_total': self.completed,
+            'sessions_expired_total': self.expired,
+            'unknown_session_datagrams_total': self.unknown_session,
+            'kernel_drops_total': self.ring.kernel_drops,
+        }
+        for session in list(self.sessions.values()):
+            for name, value in session.stats.live_metrics().items():
+                if name != 'kernel_drops_total':
+                    metrics[f'{name}{{session="{session.label}"}}'] = value
+        return metrics
+
+if __name__ == '__main__':
+    # python receiver_daemon.py [port [output directory]]
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_DIR
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+        udp_socket.bind(("0.0.0.0", int(sys.argv[1]) if len(sys.argv) > 1 else RECEIVER_PORT))
+        daemon = ReceiverDaemon(udp_socket, output_dir)
+        print(f"Receiver daemon running, writing to {output_dir}")
+        with MetricsExporter('receiver', daemon.live_metrics):
+            try:
+                daemon.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        print(f"Sessions completed: {daemon.completed}, expired: {daemon.expired}, "
+              f"kernel receive drops: {daemon.ring.kernel_drops}")
+
+# ======================================================================
+#                  END of receiver_daemon.py
+# ======================================================================
@@ -0,0 +1,163 @@
+# ======================================================================
+#                   scoreboard.py
+# ======================================================================
+#
+# Sender scoreboard: the SACKed, lost and retransmitted state of every
+# segment from the cumulative ACK point to the highest segment sent, one
+# byte per segment and flag in bytearrays indexed by segment number, and
+# the last send time of each segment in a double array next to them, which
+# RACK and the fixed window retransmission timers read. ACKs and SACK
+# blocks mark whole ranges with slice assignment, counts and hole searches
+# are bytearray.count()/find() scans in C, and the acknowledged prefix is
+# trimmed in bulk, so the cost per ACK stays flat as the window grows to
+# thousands of segments. Callers use seq ids (byte offsets), segments are
+# segment_size bytes except for the last one of the stream.
+
+from array import array
+
+COMPACT_SEGMENTS = 4096  # trim the acknowledged prefix once it is this long
+NOT_SACKED = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+class Scoreboard:
+    """SACK, loss and retransmission state of the segments in flight."""
+
+    def __init__(self, segment_size) -> None:
+        self.segment_size = segment_size
+        self.first = 0  # segment number of index 0
+        self.base = 0  # first segment not cumulatively ACKed
+        self.end = 0  # one past the highest segment sent
+        self.sacked = bytearray()
+        self.lost = bytearray()
+        self.retransmitted = bytearray()
+        self.send_times = array('d')
+        self.sacked_count = 0
+        self.lost_count = 0
+
+    def segment(self, seq_id):
+        return seq_id // self.segment_size
+
+    def on_send(self, seq_id, now):
+        """Segment seq_id was sent, or resent, at time now."""
+        end = seq_id // self.segment_size + 1
+        if end > self.end:
+            grow = end - self.first - len(self.sacked)
+            if grow > 0:
+                self.sacked.extend(bytes(grow))
+                self.lost.extend(bytes(grow))
+                self.retransmitted.extend(bytes(grow))
+                self.send_times.frombytes(bytes(self.send_times.itemsize * grow))
+            self.end = end
+        i = end - 1 - self.first
+        if i >= 0:
+            self.send_times[i] = now
+
+    def sent_time(self, seq_id):
+        """When seq_id was last sent, None once it has been trimmed or if it was never sent."""
+        i = seq_id // self.segment_size - self.first
+        if 0 <= i < self.end - self.first:
+            return self.send_times[i]
+        return None
+
+    def on_ack(self, ack_id):
+        """Cumulative ACK: every segment below ack_id arrived."""
+        base = min(-(-ack_id // self.segment_size), self.end)
+        if base <= self.base:
+            return
+        lo, hi = self.base - self.first, base - self.first
+        self.sacked_count -= self.sacked.count(1, lo, hi)
+        self.lost_count -= self.lost.count(1, lo, hi)
+        # trim up to the previous base only, the segments this ACK covers keep
+        # their send times until the next one for RACK to read
+        if lo >= COMPACT_SEGMENTS and lo * 2 >= len(self.sacked):
+            del self.sacked[:lo]
+            del self.lost[:lo]
+            del self.retransmitted[:lo]
+            del self.send_times[:lo]
+            self.first = self.base
+        self.base = base
+
+    def on_sack(self, start, end):
+        """Mark the SACK block [start, end) and return the seq ids it newly covers, which are no longer lost."""
+        lo = max(start // self.segment_size, self.base) - self.first
+        hi = min(-(-end // self.segment_size), self.end) - self.first
+        if lo >= hi:
+            return []
+        sacked = self.sacked
+        newly = []
+        i = sacked.find(0, lo, hi)
+        while i >= 0:
+            newly.append((i + self.first) * self.segment_size)
+            i = sacked.find(0, i + 1, hi)
+        if newly:
+            sacked[lo:hi] = b'\x01' * (hi - lo)
+            self.sacked_count += len(newly)
+            self.lost_count -= self.lost.count(1, lo, hi)
+            self.lost[lo:hi] = bytes(hi - lo)
+        return newly
+
+    def is_sacked(self, seq_id):
+        i = seq_id // self.segment_size - self.first
+        return 0 <= i < len(self.sacked) and self.sacked[i] == 1
+
+    def mark_lost(self, start, end):
+        """Mark the segments in [start, end) that are not ACKed or SACKed as lost."""
+        lo = max(start // self.segment_size, self.base) - self.first
+        hi = min(-(-end // self.segment_size), self.end) - self.first
+        if lo >= hi:
+            return
+        lost = self.sacked[lo:hi].translate(NOT_SACKED)
+        self.lost_count += lost.count(1) - self.lost.count(1, lo, hi)
+        self.lost[lo:hi] = lost
+
+    def is_lost(self, seq_id):
+        i = seq_id // self.segment_size - self.first
+        return 0 <= i < len(self.lost) and self.lost[i] == 1
+
+    def lost_segments(self, start, end):
+        """Seq ids in [start, end) marked lost and not ACKed or SACKed since, in ascending order."""
+        lo = max(start // self.segment_size, self.base) - self.first
+        hi = min(-(-end // self.segment_size), self.end) - self.first
+        lost = self.lost
+        i = lost.find(1, lo, hi) if lo < hi else -1
+        while i >= 0:
+            yield (i + self.first) * self.segment_size
+            i = lost.find(1, i + 1, hi)
+
+    def mark_retransmitted(self, seq_id):
+        i = seq_id // self.segment_size - self.first
+        if 0 <= i < len(self.retransmitted):
+            self.retransmitted[i] = 1
+
+    def is_retransmitted(self, seq_id):
+        i = seq_id // self.segment_size - self.first
+        return 0 <= i < len(self.retransmitted) and self.retransmitted[i] == 1
+
+    def clear_retransmitted(self):
+        self.retransmitted[:] = bytes(len(self.retransmitted))
+
+    def holes(self, start, end):
+        """Seq ids in [start, end) not ACKed or SACKed, in ascending order."""
+        lo = max(start // self.segment_size, self.base) - self.first
+        hi = min(-(-end // self.segment_size), self.end) - self.first
+        sacked = self.sacked
+        i = sacked.find(0, lo, hi) if lo < hi else -1
+        while i >= 0:
+            yield (i + self.first) * self.segment_size
+            i = sacked.find(0, i + 1, hi)
+
+    def next_hole(self, start, end):
+        return next(self.holes(start, end), None)
+
+    def nth_highest_sacked(self, n):
+        """Seq id of the n-th highest SACKed segment, None if fewer are SACKed."""
+        if self.sacked_count < n:
+            return None
+        lo = self.base - self.first
+        i = self.end - self.first
+        for _ in range(n):
+            i = self.sacked.rfind(1, lo, i)
+        return (i + self.first) * self.segment_size
+
+# ======================================================================
+#                  END of scoreboard.py
+# ======================================================================
@@ -1,4 +1,5 @@
 import socket
+from collections import deque
 from datetime import datetime
 import time
 
@@ -44,46 +45,47 @@ def stop_and_wait_send(udp_socket, message, address):
             # no ack received
             return False
 
-def fixed_sliding_window_send(udp_socket, messages, address, acks):
+def fixed_sliding_window_send(udp_socket, address, window_size):
+    global LARGE_FILE_DATA
     global PER_PACKET_DELAY
 
-    # wait for acknowledgement
-    while True:
+    retransmit_timeout = udp_socket.gettimeout()
+    base = 0
+    next_seq = 0
+    # in-flight messages, oldest first: [sent_id, ack_id, message, sent_time]
+    in_flight = deque()
+
+    while base < len(LARGE_FILE_DATA):
+        # release a new message as soon as the left edge of the window advances
+        while len(in_flight) < window_size and next_seq < len(LARGE_FILE_DATA):
+            message = int.to_bytes(next_seq, SEQ_ID_SIZE, byteorder='big', signed=True) + LARGE_FILE_DATA[next_seq : next_seq + MESSAGE_SIZE]
+            udp_socket.sendto(message, address)
+            PER_PACKET_DELAY[next_seq] = [time.time(), None]
+            ack_id = next_seq + len(message) - SEQ_ID_SIZE
+            in_flight.append([next_seq, ack_id, message, time.time()])
+            next_seq = ack_id
+
         try:
             # wait for ack
             ack, _ = udp_socket.recvfrom(PACKET_SIZE)
-            
-            # extract ack id
-            ack_id = int.from_bytes(ack[:SEQ_ID_SIZE], byteorder='big')
-            # print(ack_id, ack[SEQ_ID_SIZE:])
 
-            # calculate the 
-            ack_id_prev = ack_id - MESSAGE_SIZE
-
-            if ack_id_prev in acks:
-                acks[ack_id_prev] = True
-                if ack_id_prev >= 0:
-                    PER_PACKET_DELAY[ack_id_prev][1] = time.time()
-            else:
-                max_acks_key = max(acks.keys())
-
-                # search for length of the last message
-                for sid, message in messages:
-                    if sid == max_acks_key:
-                        ack_id_prev = ack_id - len(message) + SEQ_ID_SIZE
-                        acks[ack_id_prev] = True
-                        if ack_id_prev >= 0:
-                            PER_PACKET_DELAY[ack_id_prev][1] = time.time()
-
-            # all acks received, move on
-            if all(acks.values()):
-                return True
+            # extract ack id, acks are cumulative so everything below it arrived
+            ack_id = int.from_bytes(ack[:SEQ_ID_SIZE], byteorder='big', signed=True)
+            while in_flight and in_flight[0][1] <= ack_id:
+                sent_id, _, _, _ = in_flight.popleft()
+                PER_PACKET_DELAY[sent_id][1] = time.time()
+            base = max(base, ack_id)
         except socket.timeout:
-            # no ack received, resend unacked messages
-            for sid, message in messages:
-                if not acks[sid]:
-                    udp_socket.sendto(message, address)
+            pass
 
+        # no ack in time, resend each message whose own timer expired
+        now = time.time()
+        for message_state in in_flight:
+            if now - message_state[3] >= retransmit_timeout:
+                udp_socket.sendto(message_state[2], address)
+                message_state[3] = now
+
+    return True
 
 def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
     # wait for acknowledgement
@@ -92,6 +94,9 @@ def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
     dup_acks = []
     counts = []
 
+    # every message in the window starts unacked
+    unacked = len(acks)
+
     # check if we are in congestion avoidance phase
     if WINDOW_SIZE >= ssthresh:
         linear = True
@@ -103,6 +108,8 @@ def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
         # extract ack id
         ack_id = int.from_bytes(ack[:SEQ_ID_SIZE], byteorder='big')
         print(ack_id, ack[SEQ_ID_SIZE:])
+        if acks.get(ack_id) is False:
+            unacked -= 1
         acks[ack_id] = True
 
         # if TIMEOUT
@@ -133,7 +140,7 @@ def tcp_tahoe(udp_socket, messages, receiver_addr, acks, ssthresh):
                 return False
 
         # if ALL RECEIVED
-        if all(acks.values()):
+        if unacked == 0:
             print("All ACK(s) received")
             if linear:
                 WINDOW_SIZE = WINDOW_SIZE + 1
@@ -149,6 +156,9 @@ def tcp_reno(udp_socket, messages, receiver_addr, acks, ssthresh):
     dup_acks = []
     counts = []
 
+    # every message in the window starts unacked
+    unacked = len(acks)
+
     # check if we are in congestion avoidance phase
     if WINDOW_SIZE >= ssthresh:
         linear = True
@@ -160,6 +170,8 @@ def tcp_reno(udp_socket, messages, receiver_addr, acks, ssthresh):
         # extract ack id
         ack_id = int.from_bytes(ack[:SEQ_ID_SIZE], byteorder='big')
         print(ack_id, ack[SEQ_ID_SIZE:])
+        if acks.get(ack_id) is False:
+            unacked -= 1
         acks[ack_id] = True
 
         # if TIMEOUT
@@ -190,7 +202,7 @@ def tcp_reno(udp_socket, messages, receiver_addr, acks, ssthresh):
                 return False
 
         # if ALL RECEIVED
-        if all(acks.values()):
+        if unacked == 0:
             print("All ACK(s) received")
             if linear:
                 WINDOW_SIZE = WINDOW_SIZE + 1
@@ -222,6 +234,12 @@ def send_data(congestion_control_protocol, window_size):
         
         # start sending LARGE_FILE_DATA from 0th sequence
         seq_id = 0
+
+        # the sliding window runs its own continuous loop instead of window batches
+        if congestion_control_protocol == 'fixed_sliding_window_send':
+            fixed_sliding_window_send(udp_socket, reciever_address, WINDOW_SIZE)
+            seq_id = len(LARGE_FILE_DATA)
+
         while seq_id < len(LARGE_FILE_DATA):
             # print(seq_id, len(LARGE_FILE_DATA))
 
@@ -260,8 +278,6 @@ def send_data(congestion_control_protocol, window_size):
             
             if congestion_control_protocol == 'stop_and_wait_send':
                 ack_result = all(stop_and_wait_send(udp_socket, message, reciever_address) for _, message in messages)
-            elif congestion_control_protocol == 'fixed_sliding_window_send':
-                ack_result = fixed_sliding_window_send(udp_socket, messages, reciever_address, acks)
             elif congestion_control_protocol == 'tcp_tahoe':
                 ack_result = tcp_tahoe(udp_socket, messages, reciever_address, acks, ssthresh)
             elif congestion_control_protocol == 'tcp_reno':
@@ -270,6 +286,15 @@ def send_data(congestion_control_protocol, window_size):
             if ack_result == True:
                 # move sequence id forward
                 seq_id += curret_message_size + (MESSAGE_SIZE * (WINDOW_SIZE - 1))
+            else:
+                # acks are cumulative, so restart the window at the first missing byte
+                # instead of resending the messages that already arrived
+                cumulative_acks = [ack_id for ack_id, acked in acks.items() if acked]
+                if cumulative_acks:
+                    seq_id = max(seq_id, min(max(cumulative_acks), len(LARGE_FILE_DATA)))
+                    for sent_id, _ in messages:
+                        if sent_id < seq_id and PER_PACKET_DELAY[sent_id][1] is None:
+                            PER_PACKET_DELAY[sent_id][1] = time.time()
             
         # send final closing message
         message = int.to_bytes(seq_id, SEQ_ID_SIZE, byteorder='big', signed=True) + str.encode('==FINACK==')
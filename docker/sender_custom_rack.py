@@ -0,0 +1,10 @@
+import logging
+
+from utils import TahoeRenoSender
+
+logging.basicConfig(level=logging.FATAL)
+logger = logging.getLogger(__name__)
+
+# Send the file, with selective repeat, RACK-TLP loss detection and HyStart
+sender = TahoeRenoSender('C', selective_repeat=True, rack=True, hystart=True)
+sender.send('./file.mp3', 'localhost', 5001)
@@ -0,0 +1,10 @@
+import logging
+
+from utils import ThreadedTahoeRenoSender
+
+logging.basicConfig(level=logging.FATAL)
+logger = logging.getLogger(__name__)
+
+# Send the file, tuned to the score weights in OBJECTIVE_WEIGHTS and paced at cwnd / base RTT
+sender = ThreadedTahoeRenoSender('O', selective_repeat=True, rack=True, hystart=True)
+sender.send('./file.mp3', 'localhost', 5001)
@@ -0,0 +1,10 @@
+import logging
+
+from utils import TahoeRenoSender
+
+logging.basicConfig(level=logging.FATAL)
+logger = logging.getLogger(__name__)
+
+# Send every file under ./session as one flow
+sender = TahoeRenoSender('C', selective_repeat=True, rack=True, hystart=True)
+sender.send('./session', 'localhost', 5001)
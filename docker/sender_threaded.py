@@ -0,0 +1,10 @@
+import logging
+
+from utils import ThreadedTahoeRenoSender
+
+logging.basicConfig(level=logging.FATAL)
+logger = logging.getLogger(__name__)
+
+# Send the file
+sender = ThreadedTahoeRenoSender('R')
+sender.send('./file.mp3', 'localhost', 5001)
@@ -0,0 +1,10 @@
+import logging
+
+from utils import TahoeRenoSender
+
+logging.basicConfig(level=logging.FATAL)
+logger = logging.getLogger(__name__)
+
+# Send the file
+sender = TahoeRenoSender('V')
+sender.send('./file.mp3', 'localhost', 5001)
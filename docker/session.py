@@ -0,0 +1,204 @@
+# ======================================================================
+#                   session.py
+# ======================================================================
+#
+# Multi-file sessions: a list or directory of files sent as one byte stream
+# over one flow, so the congestion window carries over between files, the
+# next file's first segments go out while the previous file's tail is still
+# in flight, and small files share packets instead of each taking one.
+#
+# Stream layout:
+#
+#     SESSION_MAGIC
+#     per file: ENTRY_STRUCT (name length, file size), utf-8 name, data
+#     ENTRY_STRUCT (0, 0) end marker
+
+import os
+import mmap
+import struct
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAGIC = b'UDPSESS1'
+ENTRY_STRUCT = struct.Struct('!HQ')
+# smaller files are read into memory, larger ones are mapped
+MMAP_THRESHOLD = 64 * 1024
+
+def list_session_files(source):
+    """Files of a directory (recursively, sorted) or the given list, with their stream names."""
+    if isinstance(source, (str, os.PathLike)):
+        root = source
+        paths = sorted(os.path.join(directory, name)
+                       for directory, _dirs, names in os.walk(source) for name in names)
+    else:
+        paths = list(source)
+        root = os.path.commonpath([os.path.abspath(os.path.dirname(p)) for p in paths]) if paths else '.'
+    return [(path, os.path.relpath(os.path.abspath(path), os.path.abspath(root))) for path in paths]
+
+class SessionReader:
+    """Presents a list of files as one session stream, with FileReader's interface."""
+
+    def __init__(self, source) -> None:
+        # announced in the handshake, a receiver daemon unpacks the session under this name
+        if isinstance(source, (str, os.PathLike)):
+            self.name = os.path.basename(os.path.normpath(source))
+        else:
+            self.name = 'session'
+        self.offsets = []
+        self.parts = []
+        self.mmaps = []
+        self.file_size = 0
+        self.file_count = 0
+
+        self.add_part(SESSION_MAGIC)
+        for path, name in list_session_files(source):
+            name_bytes = name.replace(os.sep, '/').encode()
+            size = os.path.getsize(path)
+            self.add_part(ENTRY_STRUCT.pack(len(name_bytes), size) + name_bytes)
+            if size >= MMAP_THRESHOLD:
+                with open(path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.mmaps.append(data)
+            else:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            self.add_part(data)
+            self.file_count += 1
+        self.add_part(ENTRY_STRUCT.pack(0, 0))
+
+    def add_part(self, data):
+        if len(data):
+            self.offsets.append(self.file_size)
+            self.parts.append(data)
+            self.file_size += len(data)
+
+    def read(self, start, length):
+        end = min(start + length, self.file_size)
+        i = bisect.bisect_right(self.offsets, start) - 1
+        chunks = []
+        position = start
+        # a segment may span the tail of one file, headers and several small files
+        while position < end:
+            part_start = self.offsets[i]
+            chunk = self.parts[i][position - part_start:end - part_start]
+            chunks.append(chunk)
+            position += len(chunk)
+            i += 1
+        data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        return data, end - start
+
+    def __del__(self):
+        for data in self.mmaps:
+            data.close()
+
+class SessionWriter:
+    """Unpacks a session stream written to it in order into files under directory."""
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        self.header = bytearray()
+        self.name_length = None
+        self.remaining = 0
+        self.file = None
+        self.file_count = 0
+        self.done = False
+
+    def open_entry(self, name):
+        path = os.path.normpath(os.path.join(self.directory, name))
+        # names come from the network, never write outside the session directory
+        if os.path.isabs(name) or not path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise ValueError(f"Session entry escapes the output directory: {name!r}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file_count += 1
+
+    def write(self, data):
+        data = memoryview(data)
+        while len(data) and not self.done:
+            if self.file is not None:
+                chunk = data[:self.remaining]
+                self.file.write(chunk)
+                self.remaining -= len(chunk)
+                data = data[len(chunk):]
+                if not self.remaining:
+                    self.file.close()
+                    self.file = None
+                continue
+
+            # collect the entry header, then its name
+            needed = ENTRY_STRUCT.size if self.name_length is None else ENTRY_STRUCT.size + self.name_length
+            take = needed - len(self.header)
+            self.header += data[:take]
+            data = data[take:]
+            if len(self.header) < needed:
+                return
+            if self.name_length is None:
+                self.name_length, self.remaining = ENTRY_STRUCT.unpack(self.header)
+                if not self.name_length:
+                    self.done = True
+                continue
+
+            self.open_entry(self.header[ENTRY_STRUCT.size:].decode())
+            self.header.clear()
+            self.name_length = None
+            if not self.remaining:
+                self.file.close()
+                self.file = None
+
+    def close(self):
+        if self.file is not None:
+            logger.warning(f"Session ended inside a file, {self.remaining} bytes missing")
+            self.file.close()
+            self.file = None
+
+class ReceiveSink:
+    """Output for a transfer: a single file, or a session unpacked into a directory.
+
+    The first bytes decide: a stream starting with SESSION_MAGIC is a session.
+    """
+
+    def __init__(self, file_path, session_directory, buffering=-1) -> None:
+        self.file_path = file_path
+        self.session_directory = session_directory
+        self.buffering = buffering
+        self.prefix = b''
+        self.output = None
+
+    def write(self, data):
+        if self.output is None:
+            self.prefix += bytes(data)
+            if len(self.prefix) < len(SESSION_MAGIC) and SESSION_MAGIC.startswith(self.prefix):
+                return
+            self.choose_output()
+            return
+        self.output.write(data)
+
+    def choose_output(self):
+        prefix, self.prefix = self.prefix, b''
+        if prefix.startswith(SESSION_MAGIC):
+            self.output = SessionWriter(self.session_directory)
+            prefix = prefix[len(SESSION_MAGIC):]
+        else:
+            self.output = open(self.file_path, 'wb', buffering=self.buffering)
+        self.output.write(prefix)
+
+    @property
+    def is_session(self):
+        return isinstance(self.output, SessionWriter)
+
+    def close(self):
+        if self.output is None:
+            self.choose_output()
+        self.output.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+# ======================================================================
+#                  END of session.py
+# ======================================================================
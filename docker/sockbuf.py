@@ -0,0 +1,122 @@
+# ======================================================================
+#                   sockbuf.py
+# ======================================================================
+#
+# Socket buffer sizing from the bandwidth-delay product and kernel drop
+# counting, shared by the senders (through UdpTcpSocket) and receiver.py.
+
+import socket
+import struct
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIN_SOCKET_BUFFER = 256 * 1024
+MAX_SOCKET_BUFFER = 16 * 1024 * 1024
+BDP_HEADROOM = 2  # buffer this many BDPs so a full window burst fits
+RESIZE_THRESHOLD = 0.25  # only resize when the target moves by more than 25%
+RATE_INTERVAL_MIN = 0.05  # seconds, shortest interval used for a rate sample
+RTT_GAIN = 0.125  # RFC 6298 alpha
+
+# Linux values, Python does not export them
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+# the *FORCE variants may exceed net.core.[rw]mem_max but need CAP_NET_ADMIN
+FORCE_OPTIONS = {
+    socket.SO_SNDBUF: getattr(socket, 'SO_SNDBUFFORCE', 32),
+    socket.SO_RCVBUF: getattr(socket, 'SO_RCVBUFFORCE', 33),
+}
+DROP_COUNTER_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 0
+
+def enable_drop_counter(sock):
+    """Ask the kernel to report the socket's receive queue drops, return False if unsupported."""
+    if not DROP_COUNTER_SIZE:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    except OSError:
+        return False
+    return True
+
+def parse_drop_counter(ancdata):
+    """Return the cumulative drop counter carried in recvmsg ancillary data, or None."""
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(data) >= 4:
+            return struct.unpack('=I', data[:4])[0]
+    return None
+
+class SocketBufferSizer:
+    """Keeps SO_SNDBUF/SO_RCVBUF at a multiple of the current BDP estimate.
+
+    The RTT is smoothed like TCP's SRTT, the delivery rate is the best of the
+    recent intervals, each at least one SRTT long. Sizes are clamped to
+    [min_size, max_size] and only changed when they move by more than
+    RESIZE_THRESHOLD, so the setsockopt calls stay rare.
+    """
+
+    def __init__(self, sock, min_size=MIN_SOCKET_BUFFER, max_size=MAX_SOCKET_BUFFER,
+                 rtt_hint=None, options=(socket.SO_SNDBUF, socket.SO_RCVBUF)):
+        self.sock = sock
+        self.min_size = min_size
+        self.max_size = max_size
+        self.options = options
+        self.srtt = rtt_hint
+        self.delivery_rate = 0.0
+        self.can_force = True
+
+        self.interval_start = time.monotonic()
+        self.interval_bytes = 0
+        # start from what the kernel gave us, the first estimate replaces it
+        self.buffer_size = sock.getsockopt(socket.SOL_SOCKET, options[-1])
+
+    def on_rtt_sample(self, rtt):
+        if rtt <= 0:
+            return
+        if self.srtt is None:
+            self.srtt = rtt
+        else:
+            self.srtt += RTT_GAIN * (rtt - self.srtt)
+
+    def on_delivered(self, nbytes, now=None):
+        now = time.monotonic() if now is None else now
+        self.interval_bytes += nbytes
+        elapsed = now - self.interval_start
+        if elapsed < max(self.srtt or 0, RATE_INTERVAL_MIN):
+            return
+
+        rate = self.interval_bytes / elapsed
+        # decay the old maximum so the estimate follows a slower path down
+        self.delivery_rate = max(rate, self.delivery_rate * 0.75)
+        self.interval_start = now
+        self.interval_bytes = 0
+        self.update()
+
+    def bdp(self):
+        if self.srtt is None:
+            return 0
+        return self.srtt * self.delivery_rate
+
+    def update(self):
+        target = min(max(int(self.bdp() * BDP_HEADROOM), self.min_size), self.max_size)
+        if abs(target - self.buffer_size) > RESIZE_THRESHOLD * self.buffer_size:
+            self.resize(target)
+
+    def resize(self, size):
+        for option in self.options:
+            if self.can_force:
+                try:
+                    self.sock.setsockopt(socket.SOL_SOCKET, FORCE_OPTIONS[option], size)
+                    continue
+                except OSError:
+                    # unprivileged, the kernel silently caps at [rw]mem_max instead
+                    self.can_force = False
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, option, size)
+            except OSError as e:
+                logger.warning(f"Could not set socket buffer to {size} bytes: {e}")
+        self.buffer_size = size
+        logger.info(f"Socket buffers resized to {size} bytes (bdp {self.bdp():.0f} bytes)")
+
+# ======================================================================
+#                  END of sockbuf.py
+# ======================================================================
@@ -3,38 +3,354 @@
 # ======================================================================
 
 import os
+import random
 import socket
 import time
 import mmap
+import struct
 import logging
+import threading
+import heapq
+from collections import deque
+
+from congestion import CubicWindow, VegasWindow, ObjectiveWindow, HyStart, objective_score
+from delivery_rate import RateSampler
+from exporter import MetricsExporter, quantile_metrics
+from histogram import LatencyHistogram, save_histograms
+from rack import RackTlp
+from scoreboard import Scoreboard
+from offload import enable_gso, segment_runs, send_segments
+from path_metrics import PathMetricsCache
+from session import SessionReader
+from sockbuf import SocketBufferSizer, enable_drop_counter, parse_drop_counter, DROP_COUNTER_SIZE
 
 logger = logging.getLogger(__name__)
 
 MAX_DUP_ACKS = 3
-TIMEOUT = 1.0  # Timeout for retransmission in seconds
+TIMEOUT = 1.0  # Timeout for retransmission in seconds, and the longest retransmission timeout
+MIN_RTO = 0.2  # shortest retransmission timeout, as Linux
+SRTT_GAIN = 0.125  # RFC 6298 alpha
+RTTVAR_GAIN = 0.25  # RFC 6298 beta
+TIMER_GRANULARITY = 0.001  # shortest socket timeout for the RACK-TLP timers
+WARM_START_GAIN = 0.5  # a cached path starts at this fraction of its BDP
+
+RETRANSMIT_CACHE_SIZE = 4096  # packets kept built for retransmission, about 4 MB
+
+# Send each window burst with UDP GSO (see offload.py). Off by default: netem
+# and other qdiscs see a segmented burst as one packet, so emulated loss and
+# delay would hit whole bursts.
+SEGMENTATION_OFFLOAD = False
+
+# live metrics: RTT quantiles come from the most recent samples only
+RTT_SAMPLE_COUNT = 1024
+SENDER_RATES = {'bytes_acked_total': 'goodput_bytes_per_second'}
 
 PACKET_SIZE = 1024
 SEQ_ID_SIZE = 4
 MESSAGE_SIZE = PACKET_SIZE - SEQ_ID_SIZE
 
+# ACK payload is the 'ack' message followed by (start, end) SACK blocks
+ACK_MESSAGE_SIZE = 3
+SACK_BLOCK_STRUCT = struct.Struct('!ii')
+
+# Header v2: marker/version, flags, window, seq id, TSval, TSecr.
+# The marker byte has the high bit set, which no legacy seq id >= 0 has, and
+# differs from the 0xff of the legacy FINACK seq id -1, so receivers can tell
+# both formats apart from the first byte. Payloads stay MESSAGE_SIZE bytes.
+HEADER_VERSION = 2  # format of new sockets, set to 1 to talk to a legacy receiver
+HEADER_V2_MARK = 0x82
+HEADER_V2_STRUCT = struct.Struct('!BBHiII')
+TIMESTAMPS_STRUCT = struct.Struct('!II')
+TIMESTAMPS_OFFSET = 8
+FLAG_ACK = 0x01
+FLAG_FIN = 0x02
+FLAG_WINDOW = 0x04  # ACK carries the receive window, in MESSAGE_SIZE segments
+FLAG_SESSION = 0x08  # a session id follows the header
+FLAG_SYN = 0x10
+TIMESTAMP_MASK = 0xFFFFFFFF
+SESSION_ID_STRUCT = struct.Struct('!I')
+
+# Handshake (see receiver_daemon.py): the SYN carries a nonce, the segment size,
+# the options asked for, the file size and name, the SYN-ACK answers with the
+# nonce, the accepted segment size and options, and a session id if the
+# receiver keeps sessions.
+SYN_STRUCT = struct.Struct('!IHHQ')
+SYN_ACK_STRUCT = struct.Struct('!IHH')
+OPTION_SACK = 0x01
+OPTION_WINDOW = 0x02
+HANDSHAKE_RETRIES = 5
+
+def timestamp():
+    """Microsecond clock for TSval, wraps every 71 minutes."""
+    return (time.monotonic_ns() // 1000) & TIMESTAMP_MASK
+
+def parse_sack_blocks(ack_data):
+    blocks = ack_data[ACK_MESSAGE_SIZE:]
+    if len(blocks) % SACK_BLOCK_STRUCT.size:
+        return []
+    return list(SACK_BLOCK_STRUCT.iter_unpack(blocks))
+
+def split_dsack(ack_id, sack_blocks):
+    """Separate the D-SACK block (RFC 2883) of an ACK from its SACK blocks, return (dsack, sack_blocks).
+
+    The first block reports a duplicate arrival when it lies below the
+    cumulative ACK or inside the second block, dsack is None otherwise.
+    """
+    if sack_blocks:
+        start, end = sack_blocks[0]
+        if end <= ack_id or (len(sack_blocks) > 1 and sack_blocks[1][0] <= start and end <= sack_blocks[1][1]):
+            return sack_blocks[0], sack_blocks[1:]
+    return None, sack_blocks
+
 class UdpTcpSocket:
-    def __init__(self, host, port, timeout):
+    def __init__(self, host, port, timeout, header_version=None, offload=None):
         self.address = (host, port)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.settimeout(timeout)
+        # send_packets() hands runs of packets to the kernel in one sendmsg
+        self.gso = (SEGMENTATION_OFFLOAD if offload is None else offload) and enable_gso(self.socket)
 
-    def create_packet(self, seq_id, data):
-        return seq_id.to_bytes(SEQ_ID_SIZE, signed=True, byteorder='big') + data
+        self.header_version = header_version or HEADER_VERSION
+        self.header_size = HEADER_V2_STRUCT.size if self.header_version == 2 else SEQ_ID_SIZE
+        # set by connect() when the receiver assigns a session
+        self.session_id = None
+        self.header_flags = 0
+        self.options = 0
+        # receiver's last TSval, echoed back as TSecr
+        self.peer_timestamp = 0
+        # receive window in bytes, unlimited until the receiver advertises one
+        self.peer_window = float('inf')
+
+        # socket buffers follow the BDP, the drop counter tells self-inflicted loss apart
+        self.buffer_sizer = SocketBufferSizer(self.socket)
+        self.track_drops = enable_drop_counter(self.socket)
+        self.kernel_drops = 0
+
+        # delivery rate samples for every data packet sent through this socket,
+        # the lock lets a transmitter and an ACK thread share it
+        self.rate_sampler = RateSampler()
+        self.rate_lock = threading.Lock()
+        self.highest_sent = 0
+        self.delivered_ack = 0
+        self.retransmits = 0
+        self.rtt_samples = []
+        self.rtt_index = 0
+        self.rtt_histogram = LatencyHistogram()
+
+    def create_packet(self, seq_id, data, buffer=None):
+        """Frame data as packet seq_id, into buffer if given (the packet is then a memoryview of it)."""
+        if buffer is not None:
+            packet = memoryview(buffer)[:self.header_size + len(data)]
+        elif self.header_version != 2:
+            return seq_id.to_bytes(SEQ_ID_SIZE, signed=True, byteorder='big') + data
+        else:
+            packet = bytearray(self.header_size + len(data))
+        if self.header_version != 2:
+            packet[:SEQ_ID_SIZE] = seq_id.to_bytes(SEQ_ID_SIZE, signed=True, byteorder='big')
+            packet[SEQ_ID_SIZE:] = data
+            return packet
+        # timestamps are filled in by prepare_send, so a resent packet carries its own send time
+        flags = self.header_flags | (FLAG_FIN if seq_id < 0 else 0)
+        HEADER_V2_STRUCT.pack_into(packet, 0, HEADER_V2_MARK, flags, 0, seq_id, 0, 0)
+        if self.session_id is not None:
+            SESSION_ID_STRUCT.pack_into(packet, HEADER_V2_STRUCT.size, self.session_id)
+        packet[self.header_size:] = data
+        return packet
+
+    def prepare_send(self, packet):
+        """Stamp the timestamps of packet and account it as sent."""
+        if self.header_version == 2:
+            TIMESTAMPS_STRUCT.pack_into(packet, TIMESTAMPS_OFFSET, timestamp(), self.peer_timestamp)
+            seq_id = int.from_bytes(packet[4:8], signed=True, byteorder='big')
+        else:
+            seq_id = int.from_bytes(packet[:SEQ_ID_SIZE], signed=True, byteorder='big')
+        if seq_id >= 0:
+            ack_id = seq_id + len(packet) - self.header_size
+            with self.rate_lock:
+                retransmit = ack_id <= self.highest_sent
+                self.rate_sampler.on_send(ack_id, max(self.highest_sent - self.delivered_ack, 0), retransmit=retransmit)
+                self.highest_sent = max(self.highest_sent, ack_id)
+                self.retransmits += retransmit
 
     def send_packet(self, packet):
+        self.prepare_send(packet)
         self.socket.sendto(packet, self.address)
 
+    def send_packets(self, packets):
+        """Send a burst of packets, in as few syscalls as segmentation offload allows."""
+        for packet in packets:
+            self.prepare_send(packet)
+        sent = 0
+        if self.gso:
+            try:
+                for run in segment_runs(packets):
+                    if len(run) == 1:
+                        self.socket.sendto(run[0], self.address)
+                    else:
+                        send_segments(self.socket, run, self.address)
+                    sent += len(run)
+                return
+            except OSError as e:
+                # e.g. the route's device cannot segment, nothing of the failed run went out
+                logger.warning(f"UDP segmentation offload failed, sending packets one by one: {e}")
+                self.gso = False
+        for packet in packets[sent:]:
+            self.socket.sendto(packet, self.address)
+
     def receive_packet(self):
-        packet, _address = self.socket.recvfrom(PACKET_SIZE)
-        seq_id = int.from_bytes(packet[:SEQ_ID_SIZE], signed=True, byteorder='big')
-        data = packet[SEQ_ID_SIZE:]
+        if self.track_drops:
+            packet, ancdata, _flags, _address = self.socket.recvmsg(PACKET_SIZE, DROP_COUNTER_SIZE)
+            drops = parse_drop_counter(ancdata)
+            if drops is not None:
+                self.kernel_drops = drops
+        else:
+            packet, _address = self.socket.recvfrom(PACKET_SIZE)
+
+        if packet[0] != HEADER_V2_MARK:
+            # legacy ACK, no timestamps
+            seq_id = int.from_bytes(packet[:SEQ_ID_SIZE], signed=True, byteorder='big')
+            return seq_id, packet[SEQ_ID_SIZE:], None
+
+        _mark, flags, window, seq_id, tsval, tsecr = HEADER_V2_STRUCT.unpack_from(packet)
+        if flags & FLAG_SYN:
+            # a late SYN-ACK answering a resent SYN
+            return self.receive_packet()
+        self.peer_timestamp = tsval
+        if flags & FLAG_WINDOW:
+            self.peer_window = window * MESSAGE_SIZE
+        # the echoed TSval says which transmission this ACK answers, retransmissions included
+        rtt = ((timestamp() - tsecr) & TIMESTAMP_MASK) / 1e6
+        self.add_rtt_sample(rtt)
+        with self.rate_lock:
+            self.rate_sampler.on_rtt_sample(rtt)
+        offset = HEADER_V2_STRUCT.size + (SESSION_ID_STRUCT.size if flags & FLAG_SESSION else 0)
+        return seq_id, packet[offset:], rtt
 
-        return seq_id, data
+    def connect(self, name, file_size, options=OPTION_SACK | OPTION_WINDOW):
+        """Announce the transfer to the receiver, one round trip before the first data packet.
+
+        A receiver daemon answers with a session id that every later packet
+        carries, the single-transfer receiver answers without one. Legacy
+        sockets skip the handshake, and a receiver that answers in the legacy
+        format, or not at all, gets the legacy header from then on.
+        """
+        if self.header_version != 2:
+            return
+        nonce = random.getrandbits(32)
+        syn = bytearray(HEADER_V2_STRUCT.size) + SYN_STRUCT.pack(nonce, MESSAGE_SIZE, options, file_size) + name.encode()
+        for _ in range(HANDSHAKE_RETRIES):
+            HEADER_V2_STRUCT.pack_into(syn, 0, HEADER_V2_MARK, FLAG_SYN, 0, 0, timestamp(), 0)
+            self.socket.sendto(syn, self.address)
+            try:
+                packet, _address = self.socket.recvfrom(PACKET_SIZE)
+            except socket.timeout:
+                logger.warning("Handshake timed out, resend SYN")
+                continue
+
+            if packet[0] != HEADER_V2_MARK:
+                # a legacy receiver took the SYN for data and ACKed it in its own format
+                logger.warning("Legacy receiver, falling back to the v1 header")
+                self.use_legacy_header(syn)
+                return
+            _mark, flags, window, _seq_id, tsval, tsecr = HEADER_V2_STRUCT.unpack_from(packet)
+            offset = HEADER_V2_STRUCT.size
+            session_id = None
+            if flags & FLAG_SESSION:
+                session_id = SESSION_ID_STRUCT.unpack_from(packet, offset)[0]
+                offset += SESSION_ID_STRUCT.size
+            if not flags & FLAG_SYN or len(packet) < offset + SYN_ACK_STRUCT.size:
+                continue
+            reply_nonce, message_size, self.options = SYN_ACK_STRUCT.unpack_from(packet, offset)
+            if reply_nonce != nonce:
+                continue
+            if message_size < MESSAGE_SIZE:
+                raise ConnectionError(f"Receiver accepts segments of at most {message_size} bytes")
+
+            self.peer_timestamp = tsval
+            if flags & FLAG_WINDOW:
+                self.peer_window = window * MESSAGE_SIZE
+            if session_id is not None:
+                self.session_id = session_id
+                self.header_flags = FLAG_SESSION
+                self.header_size = HEADER_V2_STRUCT.size + SESSION_ID_STRUCT.size
+            # the handshake is the first RTT sample, before any data is in flight
+            rtt = ((timestamp() - tsecr) & TIMESTAMP_MASK) / 1e6
+            self.add_rtt_sample(rtt)
+            self.buffer_sizer.on_rtt_sample(rtt)
+            with self.rate_lock:
+                self.rate_sampler.on_rtt_sample(rtt)
+            logger.info(f"Connected, session {session_id}")
+            return
+        logger.warning(f"No handshake reply from {self.address[0]}:{self.address[1]}, falling back to the v1 header")
+        self.use_legacy_header(syn)
+
+    def use_legacy_header(self, syn):
+        """Switch to the v1 header, and blank the SYN a legacy receiver stored as data.
+
+        A legacy receiver reads the first 4 bytes of the SYN as a (negative)
+        seq id and keeps the rest as that segment's data, which would end up in
+        its output. An empty v1 segment under the same seq id replaces it.
+        """
+        self.header_version = 1
+        self.header_size = SEQ_ID_SIZE
+        self.header_flags = 0
+        self.options = 0
+        syn_seq_id = int.from_bytes(syn[:SEQ_ID_SIZE], signed=True, byteorder='big')
+        blank = self.create_packet(syn_seq_id, b'')
+        for _ in range(HANDSHAKE_RETRIES):
+            self.socket.sendto(blank, self.address)
+            try:
+                self.socket.recvfrom(PACKET_SIZE)
+                return
+            except socket.timeout:
+                continue
+        logger.warning("Receiver did not acknowledge the blanked SYN")
+
+    def record_delivery(self, ack_id, rtt=None):
+        """Account a cumulative ACK that moved the left edge to ack_id, return its rate sample."""
+        with self.rate_lock:
+            acked_bytes = ack_id - self.delivered_ack
+            if acked_bytes <= 0:
+                return None
+            self.delivered_ack = ack_id
+            sample = self.rate_sampler.on_ack(ack_id, acked_bytes, rtt)
+        if rtt is not None:
+            self.buffer_sizer.on_rtt_sample(rtt)
+            if self.header_version != 2:
+                # v2 ACKs were already sampled in receive_packet
+                self.add_rtt_sample(rtt)
+        self.buffer_sizer.on_delivered(acked_bytes)
+        return sample
+
+    def add_rtt_sample(self, rtt):
+        self.rtt_histogram.record(rtt)
+        if len(self.rtt_samples) < RTT_SAMPLE_COUNT:
+            self.rtt_samples.append(rtt)
+        else:
+            self.rtt_samples[self.rtt_index] = rtt
+        self.rtt_index = (self.rtt_index + 1) % RTT_SAMPLE_COUNT
+
+    def live_metrics(self):
+        metrics = {
+            'bytes_acked_total': self.delivered_ack,
+            'bytes_sent_total': self.highest_sent,
+            'retransmits_total': self.retransmits,
+            'bandwidth_estimate_bytes_per_second': self.rate_sampler.bandwidth(),
+            'min_rtt_seconds': self.rate_sampler.min_rtt(),
+            'kernel_drops_total': self.kernel_drops,
+            'rwnd_bytes': self.peer_window if self.peer_window != float('inf') else None,
+        }
+        metrics.update(quantile_metrics('rtt_seconds', self.rtt_samples[:]))
+        return metrics
+
+    def mark_app_limited(self):
+        """The window has room but the sender has nothing left to send."""
+        with self.rate_lock:
+            self.rate_sampler.mark_app_limited(max(self.highest_sent - self.delivered_ack, 0))
+
+    def bandwidth(self):
+        """Live bottleneck bandwidth estimate in bytes/sec."""
+        return self.rate_sampler.bandwidth()
 
     def close(self):
         self.socket.close()
@@ -48,6 +364,7 @@ class UdpTcpSocket:
 class FileReader:
     def __init__(self, path) -> None:
         self.path = path
+        self.name = os.path.basename(path)
         self.file_size = os.path.getsize(self.path)
         with open(path, 'rb') as f:
             self.mmap_obj = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -56,20 +373,83 @@ class FileReader:
         end = start + length
         if end > self.file_size:
             length = self.file_size - start
-        self.mmap_obj.seek(start)
-        data = self.mmap_obj.read(length)
+        # slice instead of seek/read so concurrent readers never share a file position
+        data = self.mmap_obj[start:start + length]
         return data, length
 
     def __del__(self):
         self.mmap_obj.close()
+
+class RetransmitCache:
+    """Packets in flight kept built, so a resend costs no file read and no allocation.
+
+    Buffers come from a pool of at most capacity packets, allocated as the
+    window first needs them and recycled once the cumulative ACK passes
+    them. Packets are looked up by seq id and cached in ascending order on
+    first transmission only. When the pool is exhausted a packet is not
+    kept, and resending it builds it again. The lock lets a transmitter and
+    an ACK thread share the cache.
+    """
+
+    def __init__(self, buffer_size, capacity=RETRANSMIT_CACHE_SIZE) -> None:
+        self.buffer_size = buffer_size
+        self.capacity = capacity
+        self.allocated = 0
+        self.free = []
+        self.packets = {}  # seq id -> memoryview of its packet in a pooled buffer
+        self.order = deque()  # cached seq ids, ascending
+        self.lock = threading.Lock()
+
+    def buffer(self, seq_id):
+        """A pooled buffer to build packet seq_id in, None if it is not to be cached."""
+        with self.lock:
+            if seq_id in self.packets or (self.order and seq_id < self.order[-1]):
+                return None
+            if self.free:
+                return self.free.pop()
+            if self.allocated < self.capacity:
+                self.allocated += 1
+                return bytearray(self.buffer_size)
+        return None
+
+    def add(self, seq_id, packet):
+        with self.lock:
+            self.packets[seq_id] = packet
+            self.order.append(seq_id)
+
+    def get(self, seq_id):
+        return self.packets.get(seq_id)
+
+    def release(self, ack_id):
+        """Recycle the buffers of every packet below the cumulative ACK."""
+        order = self.order
+        with self.lock:
+            while order and order[0] < ack_id:
+                self.free.append(self.packets.pop(order.popleft()).obj)
+
+def open_reader(source):
+    """FileReader for a file, SessionReader for a directory or a list of files sent as one session."""
+    if isinstance(source, (list, tuple)) or os.path.isdir(source):
+        return SessionReader(source)
+    return FileReader(source)
     
 
 class PerformanceMetrics:
     def __init__(self):
         self.start_time = 0
         self.end_time = 0
-        self.packet_delay_tracker = {}
+        # send times of unacknowledged packets by ack id, the heap pops the oldest ack id first
+        self.outstanding = {}
+        self.outstanding_order = []
+        self.delivered = 0
+        self.last_delay = None
+        self.delay_histogram = LatencyHistogram()
+        self.jitter_histogram = LatencyHistogram()
+        self.rtt_histogram = None
         self.total_data_sent = 0
+        self.kernel_drops = 0
+        self.bottleneck_bandwidth = 0
+        self.min_rtt = None
     
     def start(self):
         self.start_time = time.time()
@@ -78,14 +458,37 @@ class PerformanceMetrics:
         self.end_time = time.time()
 
     def start_packet(self, seq_id, packet):
-        if seq_id in self.packet_delay_tracker:
+        if seq_id in self.outstanding or seq_id <= self.delivered:
             return
-        self.packet_delay_tracker[seq_id] = (time.time(), -1)
+        self.outstanding[seq_id] = time.time()
+        heapq.heappush(self.outstanding_order, seq_id)
         self.total_data_sent += len(packet)
 
     def end_packet(self, seq_id):
+        """Everything up to ack id seq_id arrived, return the delay of the packet ending there."""
         logger.debug(f"Packet {seq_id} received")
-        self.packet_delay_tracker[seq_id] = (self.packet_delay_tracker[seq_id][0], time.time())
+        end = time.time()
+        delay = None
+        # packets skipped by cumulative ACKs are delivered with the ACK that covers them
+        while self.outstanding_order and self.outstanding_order[0] <= seq_id:
+            ack_id = heapq.heappop(self.outstanding_order)
+            packet_delay = end - self.outstanding.pop(ack_id)
+            self.record_delay(packet_delay)
+            if ack_id == seq_id:
+                delay = packet_delay
+        self.delivered = max(self.delivered, seq_id)
+        return delay
+
+    def record_delay(self, delay):
+        self.delay_histogram.record(delay)
+        # jitter between packets consecutive in sequence order
+        if self.last_delay is not None:
+            self.jitter_histogram.record(abs(delay - self.last_delay))
+        self.last_delay = delay
+
+    def record_path(self, rate_sampler):
+        self.bottleneck_bandwidth = rate_sampler.bandwidth()
+        self.min_rtt = rate_sampler.min_rtt()
 
     def calculate_throughput(self):
         return self.total_data_sent / (self.end_time - self.start_time)
@@ -95,37 +498,23 @@ class PerformanceMetrics:
         
         throughput = self.calculate_throughput()
 
-        sorted_packets = sorted(self.packet_delay_tracker.items(), key=lambda x: x[0])
+        for seq_id in sorted(self.outstanding):
+            logger.warning(f"Packet {seq_id} was not received")
 
-        # ensure there are not -1 for awks that were skipped by replacing them 
-        # with the end time with the end time from the next packet
-        last_end_time = self.end_time
-        for i in reversed(range(len(sorted_packets) - 1)):
-            if sorted_packets[i][1][1] == -1:
-                sorted_packets[i] = (sorted_packets[i][0], (sorted_packets[i][1][0], last_end_time))
-            else:
-                last_end_time = sorted_packets[i][1][1]
-
-
-        for seq_id, (start, end) in sorted_packets:
-            if end == -1:
-                logger.warning(f"Packet {seq_id} was not received")
+        # Average per-packet delay and jitter
+        avg_delay = self.delay_histogram.mean()
+        avg_jitter = self.jitter_histogram.mean()
 
-        packet_delays = [end - start for _, (start, end) in sorted_packets if end != -1]
-        # Average per-packet delay
-        avg_delay = sum(packet_delays) / len(packet_delays)
-
-        # Jitter calculation
-        jitters = [abs(packet_delays[i + 1] - packet_delays[i]) for i in range(len(packet_delays) - 1)]
-        avg_jitter = sum(jitters) / len(jitters) if jitters else 0
-
-        # Metric calculation
-        part_1 = 0.2 * (throughput / 2000)
-        part_2 = 0.1 / avg_jitter
-        part_3 = 0.8 / avg_delay
-        metric = part_1 + part_2 + part_3
+        # Metric calculation, the score ObjectiveWindow tunes for
+        metric = objective_score(throughput, avg_delay, avg_jitter)
 
         return throughput, avg_delay, avg_jitter, metric
+
+    def histograms(self):
+        histograms = {'delay': self.delay_histogram, 'jitter': self.jitter_histogram}
+        if self.rtt_histogram is not None:
+            histograms['rtt'] = self.rtt_histogram
+        return histograms
     
     def print_metrics(self):
         throughput, avg_delay, avg_jitter, metric = self.calculate_metrics()
@@ -134,80 +523,719 @@ class PerformanceMetrics:
         print(f"Average Delay: {avg_delay:.6f} seconds")
         print(f"Average Jitter: {avg_jitter:.6f} seconds")
         print(f"Performance Metric: {metric:.6f}")
+        histograms = self.histograms()
+        for label, name in (('Delay', 'delay'), ('Jitter', 'jitter'), ('RTT', 'rtt')):
+            if name in histograms and histograms[name].total:
+                print(f"{label} p50/p90/p99/p99.9/max: {histograms[name].describe()} seconds")
+        print(f"Kernel Receive Drops: {self.kernel_drops}")
+        print(f"Bottleneck Bandwidth Estimate: {self.bottleneck_bandwidth:.2f} bytes/sec")
+        if self.min_rtt is not None:
+            print(f"Min RTT: {self.min_rtt:.6f} seconds")
+        if os.environ.get('HISTOGRAM_FILE'):
+            save_histograms(os.environ['HISTOGRAM_FILE'].format(pid=os.getpid()), histograms)
 
 class TahoeRenoSender:
-    def __init__(self, sender_type) -> None:
+    def __init__(self, sender_type, selective_repeat=False, yield_to_loss=True, rack=False, hystart=False,
+                 objective_weights=None) -> None:
+        if rack and not selective_repeat:
+            raise ValueError("RACK-TLP loss detection needs selective repeat")
         self.sender_type = sender_type
+        # on timeout resend only the segments the receiver has not SACKed (instead of go-back-N)
+        self.selective_repeat = selective_repeat
+        # delay-based 'V' only: back off from loss-based flows instead of switching to Reno
+        self.yield_to_loss = yield_to_loss
+        # time-based loss detection and tail loss probes instead of the dup ACK threshold
+        self.use_rack = rack
+        # leave slow start on RTT growth or a full ACK train instead of at the first loss
+        self.use_hystart = hystart
+        # objective 'O' only: score weights, None reads OBJECTIVE_WEIGHTS from the environment
+        self.objective_weights = objective_weights
+        # RTT, ssthresh and bandwidth of earlier transfers, by receiver
+        self.path_cache = PathMetricsCache()
 
-    def send(self, file_path, server_address, server_port):
+    def create_controller(self):
+        if self.sender_type == 'U':
+            return CubicWindow()
+        if self.sender_type == 'V':
+            return VegasWindow(yield_to_loss=self.yield_to_loss)
+        if self.sender_type == 'O':
+            return ObjectiveWindow(MESSAGE_SIZE, self.objective_weights)
+        return None
+
+    def reset_state(self):
         # TCP Tahoe/Reno parameters
-        cwnd = 1  # Congestion window size in packets
-        ssthresh = 64  # Slow start threshold
-        dup_ack_count = 0
+        self.cwnd = 1  # Congestion window size in packets
+        self.ssthresh = 64  # Slow start threshold
+        # set once a loss, timeout or slow start exit sets ssthresh, until then it is not worth caching
+        self.ssthresh_learned = False
+        self.dup_ack_count = 0
 
-        reader = FileReader(file_path)
-        base = 0
-        next_seq = 0
+        self.base = 0
+        self.next_seq = 0
+        self.rwnd = float('inf')  # receiver-advertised window in bytes
+
+        # RFC 6298 retransmission timeout, TIMEOUT until the first RTT sample
+        self.srtt = None
+        self.rttvar = None
+        self.rto = TIMEOUT
+
+        # CUBIC ('U'), delay-based Vegas ('V') and objective ('O') keep their own state across ACKs,
+        # and reduce at most once per window of data: not again until base passes recovery_point
+        self.controller = self.create_controller()
+        self.recovery_point = 0
+        self.hystart = HyStart() if self.use_hystart else None
+
+        # selective repeat state: SACKed and lost segments, segments already resent
+        # since the last timeout, and the range whose lost segments a timeout resends
+        self.scoreboard = Scoreboard(MESSAGE_SIZE)
+        self.resend_next = 0
+        self.resend_end = 0
+
+        # RACK-TLP state, its timers count from the last ACK or timer event
+        self.rack = RackTlp(self.scoreboard) if self.use_rack else None
+        self.rto_start = time.monotonic()
+        # built once the handshake has fixed the header size
+        self.packets = None
+
+        # undo of spurious reductions (Eifel and D-SACK): cwnd and ssthresh before the first
+        # reduction of the episode, which ends once base passes undo_end, the retransmissions
+        # since then not yet reported as duplicates, and the first of them, whose ACK shows
+        # from the echoed timestamp whether the original transmission arrived
+        self.prior_cwnd = None
+        self.prior_ssthresh = None
+        self.prior_ssthresh_learned = False
+        self.undo_end = 0
+        self.undo_retrans = 0
+        self.undo_seq = None
+        self.undo_time = None
+        self.undo_next_seq = 0
+        self.eifel_pending = False
+
+        # loss events, exported as live metrics
+        self.timeouts = 0
+        self.dup_acks = 0
+        self.dsacks = 0
+        self.undos = 0
+
+    def on_rtt_sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += RTTVAR_GAIN * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += SRTT_GAIN * (rtt - self.srtt)
+        self.update_rto()
+
+    def update_rto(self):
+        self.rto = min(max(self.srtt + max(4 * self.rttvar, TIMER_GRANULARITY), MIN_RTO), TIMEOUT)
+
+    def load_path_metrics(self, host, port):
+        """Start from what the last transfer to this receiver learned, if it is recent enough.
+
+        The cached RTT sets the retransmission timeout and the cached ssthresh
+        the end of slow start. cwnd starts at WARM_START_GAIN of the cached
+        BDP, less the older the metrics are, so slow start is mostly skipped.
+        """
+        metrics = self.path_cache.lookup(host, port)
+        if metrics is None:
+            return
+        self.srtt = metrics.srtt
+        self.rttvar = metrics.rttvar
+        self.update_rto()
+        if metrics.ssthresh is not None:
+            self.ssthresh = max(metrics.ssthresh, 2)
+        if metrics.bandwidth and metrics.min_rtt:
+            bdp = metrics.bandwidth * metrics.min_rtt / MESSAGE_SIZE
+            self.cwnd = max(self.cwnd, int(min(WARM_START_GAIN * metrics.trust * bdp, self.ssthresh)))
+        logger.info(f"Warm start from cached path metrics: cwnd {self.cwnd}, ssthresh {self.ssthresh}, "
+                    f"rto {self.rto:.3f} s")
+
+    def save_path_metrics(self, soc):
+        if self.srtt is None:
+            return
+        host, port = soc.address
+        self.path_cache.update(host, port, self.srtt, self.rttvar, soc.rate_sampler.min_rtt(),
+                               self.ssthresh if self.ssthresh_learned else None, soc.bandwidth())
+
+    def on_new_ack(self, ack_id, rtt=None):
+        if rtt is not None:
+            self.on_rtt_sample(rtt)
+        self.scoreboard.on_ack(ack_id)
+        acked_packets = (ack_id - self.base) / MESSAGE_SIZE
+        self.base = ack_id
+        self.dup_ack_count = 0
+        if self.packets is not None:
+            self.packets.release(ack_id)
+
+        if self.hystart is not None and self.cwnd < self.ssthresh and self.hystart.on_ack(self.cwnd, rtt):
+            self.ssthresh = self.cwnd
+            self.ssthresh_learned = True
+
+        # Adjust congestion window
+        if self.controller is not None:
+            ssthresh = self.ssthresh
+            self.cwnd, self.ssthresh = self.controller.on_ack(self.cwnd, self.ssthresh, acked_packets, rtt)
+            self.ssthresh_learned = self.ssthresh_learned or self.ssthresh != ssthresh
+        elif self.cwnd < self.ssthresh:
+            if self.hystart is not None:
+                # HyStart needs slow start to last round trips: double per RTT, not per ACK
+                self.cwnd += max(int(acked_packets), 1)
+            else:
+                self.cwnd *= 2
+        else:
+            self.cwnd += 1
+
+    def send_window(self):
+        """Bytes that may be in flight: min(cwnd, rwnd).
+
+        A zero window still lets one segment out, which probes for the window
+        to reopen and always fits the receiver since it starts at the ACK point.
+        A tail loss probe with new data goes out past cwnd.
+        """
+        window = min(self.cwnd * MESSAGE_SIZE, max(self.rwnd, MESSAGE_SIZE))
+        if self.rack is not None and self.rack.probe_seq is not None and self.next_seq <= self.rack.probe_seq:
+            window = max(window, self.rack.probe_seq + MESSAGE_SIZE - self.base)
+        return window
+
+    def reduce_window(self):
+        """Multiplicative decrease for a loss event."""
+        self.save_undo_state()
+        self.ssthresh_learned = True
+        if self.controller is not None:
+            self.cwnd, self.ssthresh = self.controller.on_loss(self.cwnd)
+            return
+        self.ssthresh = max(self.cwnd // 2, 1)
+        if self.sender_type == 'T':
+            self.cwnd = 1
+        elif self.sender_type == 'R':
+            self.cwnd = self.ssthresh
+        elif self.sender_type == 'C':
+            # Custom
+            self.cwnd = self.ssthresh + 3
+        else:
+            logger.fatal("TahoeRenoSender incorrect sender_type!")
+
+    def on_dup_ack(self):
+        """Count a duplicate ACK, return True if base should be fast retransmitted."""
+        self.dup_ack_count += 1
+        self.dup_acks += 1
+        if self.dup_ack_count < MAX_DUP_ACKS:
+            return False
+
+        logger.warning("Triple duplicate ACK, performing fast retransmit")
+        if self.controller is not None:
+            # one multiplicative decrease per loss event, not per further dup ACK
+            if self.dup_ack_count == MAX_DUP_ACKS and self.base >= self.recovery_point:
+                self.reduce_window()
+                self.recovery_point = self.next_seq
+            return True
+
+        self.reduce_window()
+        return True
+
+    def save_undo_state(self):
+        """Remember cwnd and ssthresh before the first reduction of a loss episode."""
+        if self.prior_cwnd is None or self.base >= self.undo_end:
+            self.prior_cwnd = self.cwnd
+            self.prior_ssthresh = self.ssthresh
+            self.prior_ssthresh_learned = self.ssthresh_learned
+            self.undo_retrans = 0
+            self.undo_seq = None
+            self.eifel_pending = False
+        self.undo_end = max(self.undo_end, self.next_seq)
+
+    def count_undo_retransmit(self, seq_id, segments=1):
+        if self.prior_cwnd is None or seq_id >= self.undo_end:
+            return
+        self.undo_retrans += segments
+        if self.undo_seq is None:
+            self.undo_seq = seq_id
+            self.undo_time = time.monotonic()
+            self.eifel_pending = True
+
+    def on_ack_blocks(self, dsack, newly_sacked, echo_rtt):
+        """Count a D-SACK and check the ACK for a spurious retransmission."""
+        now = time.monotonic()
+        if dsack is not None:
+            self.dsacks += 1
+            if self.rack is not None and echo_rtt is None and self.rack.srtt is not None:
+                # without timestamps, D-SACK is RACK's only sign of a retransmission that was not needed
+                self.rack.on_spurious_retransmit(now)
+        self.detect_spurious(dsack, newly_sacked, echo_rtt, now)
+
+    def detect_spurious(self, dsack, newly_sacked, echo_rtt, now):
+        """Undo the episode's reductions if its retransmissions turn out not to have been needed.
+
+        Eifel (RFC 3522): the ACK that first covers the first retransmission
+        echoes a timestamp from before it, so the original arrived. D-SACK
+        (RFC 3708): the receiver reported every retransmission as a duplicate.
+        """
+        if self.prior_cwnd is None:
+            return
+        if self.eifel_pending and (self.base > self.undo_seq or self.undo_seq in newly_sacked):
+            self.eifel_pending = False
+            if echo_rtt is not None and now - echo_rtt < self.undo_time - TIMER_GRANULARITY:
+                self.undo_reduction('timestamps')
+                return
+        if dsack is not None and self.undo_seq is not None and dsack[0] >= self.undo_seq and self.undo_retrans > 0:
+            self.undo_retrans -= -(-(dsack[1] - dsack[0]) // MESSAGE_SIZE)
+            if self.undo_retrans <= 0:
+                self.undo_reduction('D-SACK')
+
+    def undo_reduction(self, detected_by):
+        logger.warning(f"Spurious retransmission ({detected_by}), restoring cwnd {self.prior_cwnd} "
+                       f"and ssthresh {self.prior_ssthresh}")
+        self.cwnd = max(self.cwnd, self.prior_cwnd)
+        if self.prior_ssthresh >= self.ssthresh:
+            self.ssthresh = self.prior_ssthresh
+            self.ssthresh_learned = self.prior_ssthresh_learned
+        self.prior_cwnd = self.prior_ssthresh = None
+        self.eifel_pending = False
+        self.undos += 1
+        # leave recovery, and skip what a timeout had still to resend
+        self.recovery_point = self.base
+        self.resend_next = self.resend_end
+        self.next_seq = max(self.next_seq, self.undo_next_seq)
+
+    def on_sack(self, sack_blocks):
+        """Record SACKed segments, return the newly SACKed seq ids."""
+        newly_sacked = []
+        for start, end in sack_blocks:
+            newly_sacked += self.scoreboard.on_sack(start, end)
+        return newly_sacked
+
+    def on_rack_loss(self):
+        """RACK found a loss: reduce the window once per window of data."""
+        if self.base < self.recovery_point:
+            return
+        logger.warning("RACK detected loss, entering recovery")
+        self.rack.on_recovery()
+        self.reduce_window()
+        self.recovery_point = self.next_seq
+
+    def detect_losses(self, now):
+        lost = self.rack.detect_losses(now, self.rack.reo_wnd(self.base < self.recovery_point, self.scoreboard.sacked_count))
+        for seq_id in lost:
+            self.scoreboard.mark_lost(seq_id, seq_id + 1)
+        if lost:
+            self.on_rack_loss()
+        return lost
+
+    def on_rack_ack(self, old_base, newly_sacked, rtt, echo_rtt, now):
+        """Feed an ACK to RACK, return the segments it declares lost."""
+        self.rto_start = now
+        if self.base == old_base:
+            self.dup_acks += 1
+        if rtt is not None:
+            self.rack.on_rtt_sample(rtt, now)
+        delivered = list(range(old_base, self.base, MESSAGE_SIZE)) + sorted(newly_sacked)
+        echo_time = now - echo_rtt if echo_rtt is not None else None
+        if self.rack.on_delivered(delivered, now, echo_time):
+            # the tail loss probe repaired a loss nothing else had detected
+            self.on_rack_loss()
+        return self.detect_losses(now)
+
+    def loss_timer(self, now):
+        """Seconds until the next RACK reordering, tail loss probe or retransmission timer."""
+        rack = self.rack
+        deadline = self.rto_start + self.rto
+        if rack.reo_deadline is not None:
+            deadline = min(deadline, rack.reo_deadline)
+        if rack.probe_seq is None and self.base < self.next_seq:
+            deadline = min(deadline, self.rto_start + rack.probe_timeout(self.rto))
+        return max(deadline - now, TIMER_GRANULARITY)
+
+    def on_loss_timer(self, now, file_size):
+        """Run the RACK-TLP timer that expired, return the segments to resend.
+
+        A tail loss probe sends the next new segment if the receive window
+        has room for it, otherwise it resends the highest segment not SACKed.
+        """
+        rack = self.rack
+        if rack.reo_deadline is not None and now >= rack.reo_deadline:
+            return self.detect_losses(now)
+        if now >= self.rto_start + self.rto or self.base >= self.next_seq:
+            self.on_timeout()
+            return self.pop_retransmissions()
+
+        self.rto_start = now
+        if self.next_seq < file_size and self.next_seq + MESSAGE_SIZE <= self.base + max(self.rwnd, MESSAGE_SIZE):
+            logger.info(f"Tail loss probe with new packet {self.next_seq}")
+            rack.on_probe(self.next_seq)
+            return []
+        seq_id = (self.next_seq - 1) // MESSAGE_SIZE * MESSAGE_SIZE
+        while seq_id > self.base and self.scoreboard.is_sacked(seq_id):
+            seq_id -= MESSAGE_SIZE
+        logger.info(f"Tail loss probe resending packet {seq_id}")
+        rack.on_probe(seq_id)
+        return [seq_id]
+
+    def on_timeout(self):
+        logger.warning("Timeout occurred, reducing window size")
+        self.timeouts += 1
+        self.save_undo_state()
+        self.ssthresh_learned = True
+        # exponential backoff, until the next RTT sample
+        self.rto = min(self.rto * 2, TIMEOUT)
+        if self.rack is not None:
+            self.rack.probe_seq = None
+            self.rto_start = time.monotonic()
+        if self.controller is not None:
+            self.cwnd, self.ssthresh = self.controller.on_timeout(self.cwnd)
+            self.recovery_point = self.next_seq
+        else:
+            self.ssthresh = max(self.cwnd // 2, 1)
+            self.cwnd = 1
+        if self.selective_repeat:
+            self.scoreboard.clear_retransmitted()
+            self.scoreboard.mark_lost(self.base, self.next_seq)
+            self.resend_next = self.base
+            self.resend_end = self.next_seq
+        else:
+            # go-back-N resends through the send loop, an undo resumes from undo_next_seq
+            self.count_undo_retransmit(self.base, -(-(self.next_seq - self.base) // MESSAGE_SIZE))
+            self.undo_next_seq = max(self.undo_next_seq, self.next_seq)
+            self.next_seq = self.base
+
+    def pop_retransmissions(self):
+        """Segments the last timeout marked lost that are still missing and now fit in the window."""
+        start = max(self.resend_next, self.base)
+        limit = min(self.resend_end, self.base + int(self.cwnd * MESSAGE_SIZE))
+        if start >= limit:
+            return []
+        self.resend_next = limit
+        return list(self.scoreboard.lost_segments(start, limit))
+
+    def fast_retransmissions(self):
+        """Segments to resend once the dup ACK threshold is reached.
+
+        Go-back-N resends base on every further dup ACK. Selective repeat resends
+        each hole once per timeout: base, plus every hole with MAX_DUP_ACKS
+        SACKed segments above it (RFC 6675 IsLost).
+        """
+        if not self.selective_repeat:
+            return [self.base]
+        scoreboard = self.scoreboard
+        limit = max(self.base + MESSAGE_SIZE, scoreboard.nth_highest_sacked(MAX_DUP_ACKS) or 0)
+        scoreboard.mark_lost(self.base, limit)
+        return [seq_id for seq_id in scoreboard.lost_segments(self.base, limit) if not scoreboard.is_retransmitted(seq_id)]
+
+    def live_metrics(self, soc):
+        metrics = soc.live_metrics()
+        metrics.update({
+            'cwnd_packets': self.cwnd,
+            'ssthresh_packets': self.ssthresh,
+            'timeouts_total': self.timeouts,
+            'dup_acks_total': self.dup_acks,
+            'rto_seconds': self.rto,
+            'lost_packets': self.scoreboard.lost_count,
+            'dsacks_total': self.dsacks,
+            'spurious_undos_total': self.undos,
+        })
+        if self.rack is not None:
+            metrics.update({
+                'rack_lost_total': self.rack.lost,
+                'tlp_probes_total': self.rack.probes,
+                'spurious_retransmits_total': self.rack.spurious,
+            })
+        if self.hystart is not None:
+            metrics['hystart_exits_total'] = self.hystart.exits
+        if isinstance(self.controller, ObjectiveWindow):
+            metrics['objective_epochs_total'] = self.controller.epochs
+            metrics['objective_score'] = self.controller.last_score or 0
+        return metrics
+
+    def on_retransmit(self, seq_id):
+        self.count_undo_retransmit(seq_id)
+        self.scoreboard.on_send(seq_id, time.monotonic())
+        if self.selective_repeat:
+            self.scoreboard.mark_retransmitted(seq_id)
+        if self.rack is not None:
+            self.rack.on_send(seq_id, retransmit=True)
+
+    def build_packet(self, soc, reader, seq_id):
+        """Packet seq_id, from the retransmission cache if it was sent before."""
+        packet = self.packets.get(seq_id)
+        if packet is None:
+            message_bytes, _message_size = reader.read(seq_id, MESSAGE_SIZE)
+            buffer = self.packets.buffer(seq_id)
+            packet = soc.create_packet(seq_id, message_bytes, buffer)
+            if buffer is not None:
+                self.packets.add(seq_id, packet)
+        return packet
+
+    def retransmit(self, soc, reader, pref, seq_id):
+        self.on_retransmit(seq_id)
+        packet = self.packets.get(seq_id)
+        if packet is None:
+            message_bytes, _message_size = reader.read(seq_id, MESSAGE_SIZE)
+            packet = soc.create_packet(seq_id, message_bytes)
+        # the first transmission may not have been recorded yet after a rewind
+        self.start_packet(pref, seq_id + len(packet) - soc.header_size, packet)
+        soc.send_packet(packet)
+        logger.info(f"Retransmitted packet {seq_id}")
+
+    def start_packet(self, pref, ack_id, packet):
+        pref.start_packet(ack_id, packet)
+
+    def send(self, file_path, server_address, server_port):
+        self.reset_state()
+
+        reader = open_reader(file_path)
         
         pref = PerformanceMetrics()
         pref.start()
+        if isinstance(self.controller, ObjectiveWindow):
+            # tune to the delay and jitter this transfer is scored on
+            self.controller.observe(pref.delay_histogram, pref.jitter_histogram)
 
-        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc:
-            while base < reader.file_size:
-                while next_seq < base + cwnd * MESSAGE_SIZE and next_seq < reader.file_size:
-                    seq_id = next_seq
-                    message_bytes, message_size = reader.read(seq_id, MESSAGE_SIZE)
-                    next_seq += message_size
-                    packet = soc.create_packet(seq_id, message_bytes)
-                    pref.start_packet(next_seq, packet)
-                    soc.send_packet(packet)
+        self.load_path_metrics(server_address, server_port)
+
+        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc, \
+                MetricsExporter('sender', lambda: self.live_metrics(soc), rates=SENDER_RATES):
+            soc.connect(reader.name, reader.file_size)
+            self.rto_start = time.monotonic()
+            self.packets = RetransmitCache(soc.header_size + MESSAGE_SIZE)
+            while self.base < reader.file_size:
+                for seq_id in self.pop_retransmissions():
+                    self.retransmit(soc, reader, pref, seq_id)
+
+                burst = []
+                while self.next_seq < self.base + self.send_window() and self.next_seq < reader.file_size:
+                    seq_id = self.next_seq
+                    # go-back-N resends from the cache
+                    packet = self.build_packet(soc, reader, seq_id)
+                    self.next_seq += len(packet) - soc.header_size
+                    pref.start_packet(self.next_seq, packet)
+                    self.scoreboard.on_send(seq_id, time.monotonic())
+                    if self.rack is not None:
+                        self.rack.on_send(seq_id)
+                    burst.append(packet)
                     logger.info(f"Sent packet {seq_id}")
+                if burst:
+                    soc.send_packets(burst)
+                if self.next_seq >= reader.file_size:
+                    soc.mark_app_limited()
+                if self.rack is not None:
+                    soc.socket.settimeout(self.loss_timer(time.monotonic()))
+                else:
+                    soc.socket.settimeout(self.rto)
                 try:
-                    ack_id, _awk_data = soc.receive_packet()
+                    ack_id, awk_data, echo_rtt = soc.receive_packet()
                     logger.info(f"Received ACK for {ack_id}")
+                    acked_bytes = max(ack_id - self.base, 0)
+                    old_base = self.base
+                    self.rwnd = soc.peer_window
 
-                    if ack_id > base:
-                        base = ack_id
-                        dup_ack_count = 0
-
-                        # Adjust congestion window
-                        if cwnd < ssthresh:
-                            cwnd *= 2
-                        else:
-                            cwnd += 1
-
-                    elif ack_id == base:
-                        dup_ack_count += 1
-                        if dup_ack_count >= MAX_DUP_ACKS:
-                            logger.warning("Triple duplicate ACK, performing fast retransmit")
-                            ssthresh = max(cwnd // 2, 1)
-                            if self.sender_type == 'T':
-                                cwnd = 1
-                            elif self.sender_type == 'R':
-                                cwnd = ssthresh
-                            elif self.sender_type == 'C':
-                                # Custom
-                                cwnd = ssthresh + 3
-                            else:
-                                logger.fatal("TahoeRenoSender incorrect sender_type!")
-                            
-                            message_bytes, _message_size = reader.read(base, MESSAGE_SIZE)
-                            packet = soc.create_packet(base, message_bytes)
-                            soc.send_packet(packet)
-                            logger.info(f"Retransmitted packet {base}")
+                    # Stop the timer for this packet, the echoed timestamp also times retransmissions
+                    rtt = pref.end_packet(ack_id)
+                    if echo_rtt is not None:
+                        rtt = echo_rtt
 
-                    # Stop the timer for this packet
-                    pref.end_packet(ack_id)
+                    if ack_id > self.base:
+                        self.on_new_ack(ack_id, rtt)
+
+                    dsack, sack_blocks = split_dsack(ack_id, parse_sack_blocks(awk_data))
+                    newly_sacked = []
+                    if self.selective_repeat:
+                        newly_sacked = self.on_sack(sack_blocks)
+                    self.on_ack_blocks(dsack, newly_sacked, echo_rtt)
+
+                    if self.rack is not None:
+                        for seq_id in self.on_rack_ack(old_base, newly_sacked, rtt, echo_rtt, time.monotonic()):
+                            self.retransmit(soc, reader, pref, seq_id)
+                    elif dsack is None and ack_id == self.base and acked_bytes == 0 and self.on_dup_ack():
+                        for seq_id in self.fast_retransmissions():
+                            self.retransmit(soc, reader, pref, seq_id)
+
+                    if acked_bytes:
+                        soc.record_delivery(ack_id, rtt)
 
                 except socket.timeout:
-                    logger.warning("Timeout occurred, reducing window size")
-                    ssthresh = max(cwnd // 2, 1)
-                    cwnd = 1
-                    next_seq = base
+                    if self.rack is not None:
+                        for seq_id in self.on_loss_timer(time.monotonic(), reader.file_size):
+                            self.retransmit(soc, reader, pref, seq_id)
+                    else:
+                        self.on_timeout()
 
             finack_packet = soc.create_packet(-1, b'==FINACK==')
             soc.send_packet(finack_packet)
             logger.info("File transmission complete")
+            pref.kernel_drops = soc.kernel_drops
+            pref.rtt_histogram = soc.rtt_histogram
+            pref.record_path(soc.rate_sampler)
+            self.save_path_metrics(soc)
+
+        pref.end()
+        pref.print_metrics()
+
+class ThreadedTahoeRenoSender(TahoeRenoSender):
+    """TahoeRenoSender with separate transmitter and ACK receiver threads.
+
+    The transmitter sleeps until the window (and optional pacing credit) allows
+    another packet, the ACK receiver blocks on the socket and runs the
+    Tahoe/Reno reactions. Both share the window state through one condition
+    variable that is only held while that state is read or updated, never
+    across file reads or socket calls.
+    """
+
+    def __init__(self, sender_type, pacing_rate=None, selective_repeat=False, yield_to_loss=True, rack=False,
+                 hystart=False, objective_weights=None) -> None:
+        super().__init__(sender_type, selective_repeat, yield_to_loss, rack, hystart, objective_weights)
+        # bytes/sec, None sends as fast as cwnd allows, or at the objective controller's rate
+        self.pacing_rate = pacing_rate
+        self.state_lock = threading.Condition()
+
+    def reset_state(self):
+        super().reset_state()
+        self.done = False
+
+    def on_retransmit(self, seq_id):
+        with self.state_lock:
+            super().on_retransmit(seq_id)
+
+    def start_packet(self, pref, ack_id, packet):
+        # the ACK thread pops the same send-time heap in end_packet()
+        with self.state_lock:
+            pref.start_packet(ack_id, packet)
+
+    def can_send(self, file_size):
+        return self.next_seq < self.base + self.send_window() and self.next_seq < file_size
+
+    def transmit_loop(self, soc, reader, pref):
+        credit = PACKET_SIZE
+        last_refill = time.monotonic()
+
+        while True:
+            # wait for pacing credit before claiming a sequence number,
+            # so that a timeout during the sleep rewinds cleanly
+            pacing_rate = self.pacing_rate or getattr(self.controller, 'pacing_rate', None)
+            if pacing_rate:
+                now = time.monotonic()
+                credit = min(credit + (now - last_refill) * pacing_rate, 2 * PACKET_SIZE)
+                last_refill = now
+                if credit < PACKET_SIZE:
+                    time.sleep((PACKET_SIZE - credit) / pacing_rate)
+                    continue
+
+            with self.state_lock:
+                while not self.done and not self.can_send(reader.file_size):
+                    if self.next_seq >= reader.file_size:
+                        soc.mark_app_limited()
+                    self.state_lock.wait()
+                if self.done:
+                    return
+                seq_id = self.next_seq
+                message_size = min(MESSAGE_SIZE, reader.file_size - seq_id)
+                self.next_seq += message_size
+                self.scoreboard.on_send(seq_id, time.monotonic())
+                if self.rack is not None:
+                    self.rack.on_send(seq_id)
+
+            packet = self.build_packet(soc, reader, seq_id)
+            self.start_packet(pref, seq_id + message_size, packet)
+            soc.send_packet(packet)
+            credit -= len(packet)
+            logger.info(f"Sent packet {seq_id}")
+
+    def ack_loop(self, soc, reader, pref):
+        while True:
+            with self.state_lock:
+                timeout = self.loss_timer(time.monotonic()) if self.rack is not None else self.rto
+            soc.socket.settimeout(timeout)
+            try:
+                ack_id, awk_data, echo_rtt = soc.receive_packet()
+            except socket.timeout:
+                with self.state_lock:
+                    if self.rack is not None:
+                        retransmit_seqs = self.on_loss_timer(time.monotonic(), reader.file_size)
+                    else:
+                        self.on_timeout()
+                        retransmit_seqs = self.pop_retransmissions()
+                    self.state_lock.notify()
+                for seq_id in retransmit_seqs:
+                    self.retransmit(soc, reader, pref, seq_id)
+                continue
+            logger.info(f"Received ACK for {ack_id}")
+
+            with self.state_lock:
+                acked_bytes = max(ack_id - self.base, 0)
+                old_base = self.base
+                cwnd = self.cwnd
+                rtt = echo_rtt
+                if soc.peer_window != self.rwnd:
+                    self.rwnd = soc.peer_window
+                    self.state_lock.notify()
+                if ack_id > self.base:
+                    # Stop the timer for this packet
+                    rtt = pref.end_packet(ack_id)
+                    if echo_rtt is not None:
+                        rtt = echo_rtt
+                    self.on_new_ack(ack_id, rtt)
+                    # ACKs for data sent before a timeout may overtake the rewind
+                    self.next_seq = max(self.next_seq, self.base)
+                    self.done = self.base >= reader.file_size
+                    self.state_lock.notify()
+
+                dsack, sack_blocks = split_dsack(ack_id, parse_sack_blocks(awk_data))
+                newly_sacked = []
+                if self.selective_repeat:
+                    newly_sacked = self.on_sack(sack_blocks)
+                self.on_ack_blocks(dsack, newly_sacked, echo_rtt)
+                if self.cwnd != cwnd:
+                    self.state_lock.notify()
+
+                retransmit_seqs = self.pop_retransmissions()
+                if self.rack is not None:
+                    retransmit_seqs += self.on_rack_ack(old_base, newly_sacked, rtt, echo_rtt, time.monotonic())
+                elif dsack is None and ack_id == self.base and acked_bytes == 0 and self.on_dup_ack():
+                    retransmit_seqs += self.fast_retransmissions()
+                    self.state_lock.notify()
+                done = self.done
+
+            if acked_bytes:
+                soc.record_delivery(ack_id, rtt)
+
+            for seq_id in retransmit_seqs:
+                self.retransmit(soc, reader, pref, seq_id)
+
+            if done:
+                return
+
+    def send(self, file_path, server_address, server_port):
+        self.reset_state()
+
+        reader = open_reader(file_path)
+
+        pref = PerformanceMetrics()
+        pref.start()
+        if isinstance(self.controller, ObjectiveWindow):
+            # tune to the delay and jitter this transfer is scored on
+            self.controller.observe(pref.delay_histogram, pref.jitter_histogram)
+
+        self.load_path_metrics(server_address, server_port)
+
+        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc, \
+                MetricsExporter('sender', lambda: self.live_metrics(soc), rates=SENDER_RATES):
+            soc.connect(reader.name, reader.file_size)
+            self.rto_start = time.monotonic()
+            self.packets = RetransmitCache(soc.header_size + MESSAGE_SIZE)
+            threads = [
+                threading.Thread(target=self.transmit_loop, args=(soc, reader, pref), daemon=True),
+                threading.Thread(target=self.ack_loop, args=(soc, reader, pref), daemon=True),
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            finack_packet = soc.create_packet(-1, b'==FINACK==')
+            soc.send_packet(finack_packet)
+            logger.info("File transmission complete")
+            pref.kernel_drops = soc.kernel_drops
+            pref.rtt_histogram = soc.rtt_histogram
+            pref.record_path(soc.rate_sampler)
+            self.save_path_metrics(soc)
 
         pref.end()
         pref.print_metrics()
@@ -217,13 +1245,15 @@ class StopAndWaitSender:
         pass
 
     def send(self, file_path, server_address, server_port):
-        reader = FileReader(file_path)
+        reader = open_reader(file_path)
         next_seq = 0
         
         pref = PerformanceMetrics()
         pref.start()
 
-        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc:
+        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc, \
+                MetricsExporter('sender', soc.live_metrics, rates=SENDER_RATES):
+            soc.connect(reader.name, reader.file_size)
             while next_seq < reader.file_size:
                 seq_id = next_seq
                 message_bytes, message_size = reader.read(seq_id, MESSAGE_SIZE)
@@ -234,7 +1264,7 @@ class StopAndWaitSender:
                 logger.info(f"Sent packet {seq_id}")
 
                 try:
-                    ack_id, _awk_data = soc.receive_packet()
+                    ack_id, _awk_data, echo_rtt = soc.receive_packet()
                     logger.info(f"Received ACK for {ack_id}")
 
                     if ack_id <= seq_id:
@@ -242,7 +1272,8 @@ class StopAndWaitSender:
                         logger.info(f"Retransmitted packet {seq_id}")
                     else:
                         # Stop the timer for this packet
-                        pref.end_packet(ack_id)
+                        delay = pref.end_packet(ack_id)
+                        soc.record_delivery(ack_id, delay if echo_rtt is None else echo_rtt)
 
                 except socket.timeout:
                     logger.warning("Timeout occurred, resend")
@@ -251,6 +1282,9 @@ class StopAndWaitSender:
             finack_packet = soc.create_packet(-1, b'==FINACK==')
             soc.send_packet(finack_packet)
             logger.info("File transmission complete")
+            pref.kernel_drops = soc.kernel_drops
+            pref.rtt_histogram = soc.rtt_histogram
+            pref.record_path(soc.rate_sampler)
 
         pref.end()
         pref.print_metrics()
@@ -260,55 +1294,81 @@ class FixedSlidingWindowSender:
         self.window_size = window_size
 
     def send(self, file_path, server_address, server_port):
-        reader = FileReader(file_path)
+        reader = open_reader(file_path)
         base = 0
         next_seq = 0
+        # send times of the segments in flight, and their retransmission timers (deadline, seq_id, ack_id, packet),
+        # earliest first. ACKs and resends leave stale entries behind, dropped once they reach the top
+        scoreboard = Scoreboard(MESSAGE_SIZE)
+        timers = []
+
+        def stale(timer):
+            deadline, seq_id, ack_id, _packet = timer
+            return ack_id <= base or scoreboard.sent_time(seq_id) + TIMEOUT != deadline
         
         pref = PerformanceMetrics()
         pref.start()
 
-        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc:
+        with UdpTcpSocket(server_address, server_port, TIMEOUT) as soc, \
+                MetricsExporter('sender', soc.live_metrics, rates=SENDER_RATES):
+            soc.connect(reader.name, reader.file_size)
             while base < reader.file_size:
-                messages = []
-                acks = {}
-                while next_seq < base + self.window_size * MESSAGE_SIZE and next_seq < reader.file_size:
+                # release a new segment as soon as the left edge of the window advances
+                window = min(self.window_size * MESSAGE_SIZE, max(soc.peer_window, MESSAGE_SIZE))
+                while next_seq < base + window and next_seq < reader.file_size:
                     seq_id = next_seq
                     message_bytes, message_size = reader.read(seq_id, MESSAGE_SIZE)
                     next_seq += message_size
                     packet = soc.create_packet(seq_id, message_bytes)
-                    
-                    messages.append((next_seq, packet))
-                    acks[next_seq] = False
+                    now = time.time()
+                    scoreboard.on_send(seq_id, now)
+                    heapq.heappush(timers, (now + TIMEOUT, seq_id, next_seq, packet))
 
                     pref.start_packet(next_seq, packet)
                     soc.send_packet(packet)
                     logger.info(f"Sent packet {seq_id}")
+                if next_seq >= reader.file_size:
+                    soc.mark_app_limited()
 
-                # wait for acknowledgement
-                while True:
-                    try:
-                        ack_id, _awk_data = soc.receive_packet()
-                        logger.info(f"Received ACK for {ack_id}")
+                # wait no longer than the earliest retransmission timer, a resend restarts its segment's timer
+                while stale(timers[0]):
+                    heapq.heappop(timers)
+                soc.socket.settimeout(max(timers[0][0] - time.time(), 0.001))
+                try:
+                    ack_id, _awk_data, echo_rtt = soc.receive_packet()
+                    logger.info(f"Received ACK for {ack_id}")
 
-                        if ack_id in acks:
-                            # Stop the timer for this packet
-                            pref.end_packet(ack_id)
-                            acks[ack_id] = True
+                    if ack_id > base:
+                        # Stop the timer for this packet
+                        delay = pref.end_packet(ack_id)
+                        soc.record_delivery(ack_id, delay if echo_rtt is None else echo_rtt)
+                        scoreboard.on_ack(ack_id)
+                        base = ack_id
 
-                        # all acks received, move on
-                        if all(acks.values()):
-                            base = next_seq
-                            break
+                except socket.timeout:
+                    pass
 
-                    except socket.timeout:
+                # per-segment retransmission of every segment whose own timer expired
+                now = time.time()
+                timed_out = False
+                while timers and timers[0][0] <= now:
+                    timer = heapq.heappop(timers)
+                    if stale(timer):
+                        continue
+                    _deadline, seq_id, ack_id, packet = timer
+                    if not timed_out:
                         logger.warning("Timeout occurred, resend unacked messages")
-                        for sid, packet in messages:
-                            if not acks[sid]:
-                                soc.send_packet(packet)
+                        timed_out = True
+                    soc.send_packet(packet)
+                    scoreboard.on_send(seq_id, now)
+                    heapq.heappush(timers, (now + TIMEOUT, seq_id, ack_id, packet))
 
             finack_packet = soc.create_packet(-1, b'==FINACK==')
             soc.send_packet(finack_packet)
             logger.info("File transmission complete")
+            pref.kernel_drops = soc.kernel_drops
+            pref.rtt_histogram = soc.rtt_histogram
+            pref.record_path(soc.rate_sampler)
 
         pref.end()
         pref.print_metrics()